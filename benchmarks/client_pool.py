@@ -0,0 +1,106 @@
+"""
+Benchmark per-call latency of a fresh AI service client per call versus the
+shared, pooled client from ClientRegistry.
+
+By default a local OpenAI-compatible stub server is started, so the difference
+is the TCP connect and client setup cost. Point --url at a real endpoint (with
+--key and --model) to include TLS handshakes.
+
+    PYTHONPATH=src python benchmarks/client_pool.py --calls 200
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+from cerebrum.toolkit.ClientRegistry import ClientRegistry
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive
+    wbufsize = 1 << 16  # Send headers and body in one write
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "ok"},
+                    }
+                ],
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _timed_calls(get_client, calls, model):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        get_client().chat.completions.create(
+            model=model, messages=[{"role": "user", "content": "ping"}], max_tokens=1
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument(
+        "--url", help="OpenAI-compatible base URL, defaults to a local stub"
+    )
+    parser.add_argument("--key", default="stub")
+    parser.add_argument("--model", default="stub")
+    args = parser.parse_args()
+
+    baseURL = args.url
+    if baseURL is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        baseURL = f"http://127.0.0.1:{server.server_port}/v1"
+
+    aiConfig = {"baseURL": baseURL, "apiKey": args.key}
+
+    def fresh():
+        return OpenAI(base_url=baseURL, api_key=args.key, max_retries=0)
+
+    def shared():
+        return ClientRegistry.client(aiConfig)
+
+    shared()  # Warm the pool, as a long-running process would be
+
+    for name, get_client in (
+        ("fresh client per call", fresh),
+        ("shared pooled client", shared),
+    ):
+        latencies = _timed_calls(get_client, args.calls, args.model)
+        print(
+            f"{name:24s} median {statistics.median(latencies):7.2f} ms  "
+            f"p95 {statistics.quantiles(latencies, n=20)[18]:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
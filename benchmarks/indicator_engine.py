@@ -0,0 +1,100 @@
+"""
+Compare the per-ticker indicator path (FinanceDataUtils.getTechnicalIndicators
+on each DataFrame, through TA-Lib) with IndicatorEngine's single vectorized pass
+over a panel of all tickers.
+
+Histories are synthetic random walks of --days bars. The engine's timing is
+split into building the panel and computing indicators and signal codes; the
+dicts for prompts are built separately, since a screen only needs the codes.
+The engine's values are checked against the per-ticker ones. A screen that
+requests only some indicators (--screen, IndicatorRegistry specs) is timed too.
+
+    PYTHONPATH=src python benchmarks/indicator_engine.py --tickers 1000 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from prompt_tokens import _synthetic_history
+
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine
+from cerebrum.toolkit.IndicatorRegistry import IndicatorRegistry
+
+
+def _max_difference(expected, actual):
+    """Largest absolute difference between the numbers of two indicators dicts."""
+    if isinstance(expected, dict):
+        return max(_max_difference(expected[key], actual[key]) for key in expected)
+    if isinstance(expected, list):
+        return max(
+            (_max_difference(a, b) for a, b in zip(expected, actual)), default=0.0
+        )
+    if isinstance(expected, str):
+        return 0.0 if expected == actual else float("inf")
+    if np.isnan(expected) and np.isnan(actual):
+        return 0.0
+    return abs(float(expected) - float(actual))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--tickers", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument(
+        "--check", type=int, default=200, help="Tickers whose dicts are compared"
+    )
+    parser.add_argument(
+        "--screen", nargs="+", default=["rsi", "adx"], help="Indicators of the screen"
+    )
+    args = parser.parse_args()
+
+    financeUtils = FinanceDataUtils()
+    engine = IndicatorEngine()
+    for count in args.tickers:
+        histories = {
+            f"T{i}": _synthetic_history(args.days, seed=i) for i in range(count)
+        }
+
+        start = time.perf_counter()
+        expected = {
+            key: financeUtils.getTechnicalIndicators(data.copy())
+            for key, data in histories.items()
+        }
+        perTicker = time.perf_counter() - start
+
+        start = time.perf_counter()
+        panel = engine.panel(histories)
+        built = time.perf_counter()
+        result = engine.compute(panel)
+        computed = time.perf_counter()
+        actual = {
+            key: engine.indicators(panel, result, row)
+            for row, key in enumerate(panel["keys"])
+        }
+        finished = time.perf_counter()
+
+        screenStart = time.perf_counter()
+        IndicatorRegistry().evaluate(panel, args.screen)
+        screen = time.perf_counter() - screenStart
+
+        difference = max(
+            _max_difference(expected[key], actual[key])
+            for key in list(histories)[: args.check]
+        )
+        print(
+            f"{count:6d} tickers  per-ticker {perTicker:7.2f}s  "
+            f"engine {finished - start:6.2f}s (panel {built - start:.2f}s, compute "
+            f"{computed - built:.2f}s, "
+            f"dicts {finished - computed:.2f}s)  "
+            f"compute {perTicker / (computed - built):5.1f}x faster  max difference "
+            f"{difference:.1e}  "
+            f'screen {"+".join(args.screen)} {screen:.2f}s'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the input tokens of Prompt.market_analysis for each indicator encoding.
+
+Token counts come from ContextManager.count_tokens (tiktoken's cl100k_base when
+installed, otherwise its estimate). Without --ticker a synthetic random-walk
+price history is used, so no network access is needed.
+
+    PYTHONPATH=src python benchmarks/prompt_tokens.py --ticker AAPL
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from cerebrum.config.Prompt import Prompt
+from cerebrum.toolkit.ContextManager import ContextManager
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.IndicatorEncoder import IndicatorEncoder
+
+
+def _synthetic_history(days: int = 250, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 150 * np.exp(np.cumsum(rng.normal(0, 0.015, days)))
+    return pd.DataFrame(
+        {
+            "Open": close * (1 + rng.normal(0, 0.003, days)),
+            "High": close * (1 + np.abs(rng.normal(0, 0.01, days))),
+            "Low": close * (1 - np.abs(rng.normal(0, 0.01, days))),
+            "Close": close,
+            "Volume": rng.integers(20_000_000, 80_000_000, days).astype(float),
+        },
+        index=pd.bdate_range(end="2025-01-01", periods=days),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--ticker", help="Download this ticker instead of using synthetic data"
+    )
+    parser.add_argument("--period", default="1y")
+    args = parser.parse_args()
+
+    financeUtils = FinanceDataUtils()
+    if args.ticker:
+        tickerData = financeUtils.retrieveData(
+            ticker=args.ticker, filter={"option": 1, "period": args.period}
+        )
+    else:
+        tickerData = _synthetic_history()
+    indicators = financeUtils.getTechnicalIndicators(tickerData)
+
+    prompt = Prompt()
+    baseline = None
+    for encoding in IndicatorEncoder.ENCODINGS:
+        text = prompt.market_analysis(indicators, encoding=encoding)
+        tokens = ContextManager.count_tokens(text)
+        baseline = baseline or tokens
+        print(
+            f"{encoding:8s} {tokens:6d} tokens  {len(text):6d} chars  "
+            f"{100 * (1 - tokens / baseline):5.1f}% fewer than raw"
+        )
+
+
+if __name__ == "__main__":
+    main()
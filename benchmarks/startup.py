@@ -0,0 +1,66 @@
+"""
+Benchmark cold-start latency of AIWorkGroup for each greeting mode.
+
+A local OpenAI-compatible stub server answers every completion after --latency
+seconds, standing in for a model round-trip. The response cache is disabled so
+every greeting reaches the server.
+
+    PYTHONPATH=src python benchmarks/startup.py --latency 1.0
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from client_pool import _StubHandler
+
+from cerebrum.config.Config import Config
+from cerebrum.toolkit.AIWorkGroup import AIWorkGroup
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="Seconds per stub completion"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    class SlowStubHandler(_StubHandler):
+        def do_POST(self):
+            time.sleep(args.latency)
+            super().do_POST()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    aiConfig = Config._default_config["utils"]["AI"]
+    aiConfig["baseURL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    aiConfig["apiKey"] = "stub"
+    aiConfig["cache"]["enabled"] = False
+
+    results = {}
+    for mode in AIWorkGroup.GREETING_MODES:
+        timings = []
+        for _ in range(args.runs):
+            system = AIWorkGroup(interactive_mode=False, greeting_mode=mode)
+            timings.append(system.startup_time)
+            system.shutdown()
+            system.wait(timeout=5)
+        results[mode] = timings
+
+    time.sleep(0.2)  # Let the last shutdown finish printing its thread listing
+    print()
+    for mode, timings in results.items():
+        print(
+            f"{mode:10s} startup median {statistics.median(timings):6.2f} s  max "
+            f"{max(timings):6.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
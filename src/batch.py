@@ -0,0 +1,317 @@
+"""
+Analyze a list of tickers through AIWorkGroup and write one JSON line per report.
+
+Tickers come from the command line, from a text file with one ticker per line,
+or from a CSV file with a 'ticker' column and optional 'period', 'start_date' and
+'end_date' columns (rows with dates are fetched by date range). Up to
+--concurrency tasks run through the pipeline at once. Every finished task is
+appended to the output file as soon as it is done, with its timings per stage.
+A rerun skips the tickers that already have a successful line, so an interrupted
+run resumes where it stopped. Tasks run at the 'batch' priority by default, so
+interactive requests to the same agents go first, and are shed once past --timeout.
+
+    PYTHONPATH=src python src/batch.py --file universe.csv --output reports.jsonl \
+        --concurrency 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Dict, List
+
+from cerebrum.toolkit.AIWorkGroup import AIWorkGroup
+from cerebrum.toolkit.TaskScheduler import TaskScheduler
+from cerebrum.toolkit.Topics import Topics
+
+
+class StageTimer:
+    """
+    Times the pipeline stages of each task from the messages published on the broker.
+
+    A stage starts when its topic is published for a task and ends when the next
+    topic of the same task is published; repeated stages (e.g. several feedback
+    rounds) are added up.
+    """
+
+    STAGES = {
+        Topics.MARKET_ANALYSIS: "analysis",
+        Topics.USER_FEEDBACK: "feedback",
+        Topics.MARKET_ANALYSIS_FEEDBACK: "reanalysis",
+        Topics.CHIEF_REVIEW: "review",
+        Topics.MARKET_ANALYSIS_REVISE: "revision",
+    }
+
+    def __init__(self, broker):
+        self.lock = threading.Lock()
+        # task_id -> started, current stage and timings
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        for topic in self.STAGES:
+            broker.subscribe(
+                topic,
+                lambda message, topic=topic: self._enter(message["task_id"], topic),
+                inline=True,
+            )
+
+    def start(self, task_id: str):
+        """Start timing a task, its first stage is the wait for a free user proxy."""
+        now = time.perf_counter()
+        with self.lock:
+            self.tasks[task_id] = {
+                "started": now,
+                "stage": "queue",
+                "since": now,
+                "timings": {},
+            }
+
+    def _enter(self, task_id: str, topic: Topics):
+        now = time.perf_counter()
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                self._close(task, now)
+                task["stage"], task["since"] = self.STAGES[topic], now
+
+    @staticmethod
+    def _close(task: Dict[str, Any], now: float):
+        timings = task["timings"]
+        timings[task["stage"]] = timings.get(task["stage"], 0) + now - task["since"]
+
+    def finish(self, task_id: str) -> Dict[str, float]:
+        """
+        Stop timing a task.
+
+        Returns:
+            Seconds per stage and in 'total', rounded to milliseconds
+        """
+        now = time.perf_counter()
+        with self.lock:
+            task = self.tasks.pop(task_id, None)
+        if task is None:
+            return {}
+        self._close(task, now)
+        timings = dict(task["timings"], total=now - task["started"])
+        return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+
+def read_jobs(args) -> List[Dict[str, Any]]:
+    """Read the tickers and their filters from the command line or the input file."""
+    default = {"option": 1, "period": args.period}
+    if not args.file:
+        return [
+            {"ticker": ticker.upper(), "filter": dict(default)}
+            for ticker in args.tickers
+        ]
+
+    jobs = []
+    with open(args.file, newline="", encoding="utf-8") as f:
+        if args.file.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                row = {
+                    key.strip().lower(): (value or "").strip()
+                    for key, value in row.items()
+                    if key
+                }
+                if not row.get("ticker"):
+                    continue
+                if row.get("start_date") and row.get("end_date"):
+                    filter = {
+                        "option": 2,
+                        "start_date": row["start_date"],
+                        "end_date": row["end_date"],
+                    }
+                else:
+                    filter = {"option": 1, "period": row.get("period") or args.period}
+                jobs.append({"ticker": row["ticker"].upper(), "filter": filter})
+        else:
+            for line in f:
+                ticker = line.split("#")[0].strip()
+                if ticker:
+                    jobs.append({"ticker": ticker.upper(), "filter": dict(default)})
+    return jobs
+
+
+def _key(job: Dict[str, Any]) -> str:
+    return json.dumps([job["ticker"], job["filter"]], sort_keys=True)
+
+
+def finished_keys(path: str) -> set:
+    """Keys of the jobs that already have a successful line in the output file."""
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Line cut off by an interrupted run
+            if row.get("status") == "ok":
+                keys.add(_key(row))
+    return keys
+
+
+def run(
+    jobs: List[Dict[str, Any]],
+    system: AIWorkGroup,
+    output,
+    concurrency: int,
+    timeout: float,
+    priority="batch",
+    refresh: bool = False,
+) -> Dict[str, int]:
+    """
+    Run the jobs through the work group, at most concurrency at once.
+
+    Args:
+        jobs: Tickers and filters to analyze
+        system: A work group in service mode
+        output: Text file the JSON lines are appended to
+        concurrency: Maximum tasks in flight
+        timeout: Seconds before a task is given up and written as an error
+        priority: Priority of the tasks, see TaskScheduler.priority()
+        refresh: Analyze again even if the report cache holds a valid report
+
+    Returns:
+        Number of 'ok' and 'error' lines written
+    """
+    timer = StageTimer(system.broker)
+    pending = deque(jobs)
+    inflight = {}  # Future -> (job, task_id, deadline)
+    counts = {"ok": 0, "error": 0}
+
+    while pending or inflight:
+        while pending and len(inflight) < concurrency:
+            job = pending.popleft()
+            task_id = TaskScheduler.task_id(
+                f"task_{str(uuid.uuid4())}", priority, time.time() + timeout
+            )
+            timer.start(task_id)
+            future = system.submit(
+                job["ticker"], job["filter"], task_id=task_id, refresh=refresh
+            )
+            inflight[future] = (job, task_id, time.monotonic() + timeout)
+
+        done, _ = wait(list(inflight), timeout=1.0, return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future, (job, task_id, deadline) in list(inflight.items()):
+            if future in done and not future.cancelled() and future.exception() is None:
+                report = future.result()
+                row = dict(
+                    job,
+                    task_id=task_id,
+                    status="ok",
+                    report=report["report"],
+                    structured=report.get("structured"),
+                    cached=report.get("cached", False),
+                )
+            elif future in done or now > deadline:
+                if future in done:
+                    error = (
+                        "cancelled" if future.cancelled() else str(future.exception())
+                    )
+                else:
+                    future.cancel()
+                    error = f"timed out after {timeout:g}s"
+                row = dict(job, task_id=task_id, status="error", error=error)
+            else:
+                continue
+            del inflight[future]
+            row["timings"] = timer.finish(task_id)
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+            output.flush()  # Each line is durable as soon as its task is done
+            counts[row["status"]] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "tickers", nargs="*", help="Tickers to analyze, instead of --file"
+    )
+    parser.add_argument(
+        "--file",
+        help="Text file with one ticker per line, or a CSV with a ticker column",
+    )
+    parser.add_argument(
+        "--output",
+        default="reports.jsonl",
+        help="JSON lines file, appended to and resumed from",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Tasks in flight, also the analyst replicas",
+    )
+    parser.add_argument(
+        "--period", default="3mo", help="Period of tickers without one in the input"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="Seconds before a task is given up"
+    )
+    parser.add_argument(
+        "--priority", default="batch", help="Priority class or number of the tasks"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached reports of unchanged tickers",
+    )
+    args = parser.parse_args()
+    if not args.tickers and not args.file:
+        parser.error("give tickers or --file")
+
+    jobs = read_jobs(args)
+    done = finished_keys(args.output)
+    todo = [job for job in jobs if _key(job) not in done]
+    print(
+        f"\033[90m共 {len(jobs)} 個任務，{len(jobs) - len(todo)} 個已完成，本次分析 {len(todo)} 個。"
+        "\033[0m"
+    )
+    if not todo:
+        return
+
+    concurrency = max(args.concurrency, 1)
+    # No task journal: a resumed task has no Future to write its line, reruns resume
+    # from the output file instead
+    system = AIWorkGroup(
+        interactive_mode=False,
+        greeting_mode="off",
+        service_mode=True,
+        journal=False,
+        replicas={"market_analyst": concurrency, "chief_analyst": concurrency},
+    )
+    startedAt = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as output:
+            counts = run(
+                todo,
+                system,
+                output,
+                concurrency,
+                args.timeout,
+                args.priority,
+                args.refresh,
+            )
+    finally:
+        system.shutdown()
+        system.wait(10)
+    print(
+        f"\033[90m完成 {counts['ok']} 個，失敗 {counts['error']} 個，"
+        f"耗時 {time.perf_counter() - startedAt:.1f} 秒，結果已寫入 {args.output}。\033[0m"
+    )
+    if counts["error"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,171 @@
 class Config:
     _default_config = {
-        'utils':{
-            'FinanceTools':[
-                {
-                    'name':'YahooFinance',
-                    'apiKey':'',
-                    'priority':1              
-                },
-                {
-                    'name':'Finhub',
-                    'apiKey':'',
-                    'priority':2              
-                }
+        "utils": {
+            "FinanceTools": [
+                {"name": "YahooFinance", "apiKey": "", "priority": 1},
+                {"name": "Finhub", "apiKey": "", "priority": 2},
             ],
-            'AI':{
-                'baseURL':'https://openrouter.ai/api/v1',
-                'apiKey':'',
-                'model':{
-                    'user_proxy':'meta-llama/llama-4-maverick:free',
-                    'market_analyst':'meta-llama/llama-4-maverick:free',
-                    'news_analyst':'meta-llama/llama-4-maverick:free',
-                    'chief_analyst':'meta-llama/llama-4-maverick:free'
-                }
-                
+            "dataCache": {
+                # Serve retrieveData from local per-ticker files, downloading only the
+                # missing bars
+                "enabled": False,
+                "path": "~/.cerebrum/ohlcv",  # Directory of the per-ticker files
+                # Seconds stored bars count as current during a session
+                "intradayTTL": 300,
+                "timezone": "America/New_York",  # Time zone of the session times
+                "session": ["09:30", "16:00"],  # Opening and closing time of a session
+                # Seconds after the close before the day's bar counts as final
+                "closeDelay": 900,
+            },
+            "dataFetch": {
+                "maxWorkers": 8  # Concurrent downloads of FinanceDataUtils.retrieveMany
+            },
+            "AI": {
+                "baseURL": "https://openrouter.ai/api/v1",
+                "apiKey": "",
+                "model": {
+                    "user_proxy": "meta-llama/llama-4-maverick:free",
+                    "market_analyst": "meta-llama/llama-4-maverick:free",
+                    "news_analyst": "meta-llama/llama-4-maverick:free",
+                    "chief_analyst": "meta-llama/llama-4-maverick:free",
+                },
+                # Models tried after (or hedged against) the role's model, in order
+                "fallback": {
+                    "user_proxy": ["meta-llama/llama-4-scout:free"],
+                    "market_analyst": [
+                        "meta-llama/llama-4-scout:free",
+                        "deepseek/deepseek-chat-v3-0324:free",
+                    ],
+                    "news_analyst": ["meta-llama/llama-4-scout:free"],
+                    "chief_analyst": [
+                        "meta-llama/llama-4-scout:free",
+                        "deepseek/deepseek-chat-v3-0324:free",
+                    ],
+                },
+                "retry": {
+                    # Attempts per model before moving down the fallback chain
+                    "maxAttempts": 3,
+                    "baseDelay": 1.0,  # Seconds, doubled on every retry
+                    "maxDelay": 20.0,  # Cap of the backoff delay
+                    "timeout": 90,  # Seconds per call
+                    # Race a duplicate request against the next fallback model
+                    "hedge": False,
+                    # Seconds before hedging until enough latencies are known
+                    "hedgeAfter": 30.0,
+                    # Hedge once a call is slower than this latency quantile
+                    "hedgeQuantile": 0.95,
+                    # Latencies needed before the quantile is used
+                    "hedgeMinSamples": 20,
+                },
+                "http": {
+                    "timeout": 120,  # Seconds before a request is abandoned
+                    "maxConnections": 100,  # Connection pool size of the shared client
+                    # Idle connections kept open for reuse
+                    "maxKeepaliveConnections": 20,
+                    "keepaliveExpiry": 120,  # Seconds an idle connection stays open
+                    "concurrency": {
+                        # Concurrent requests per base URL, override per URL by key
+                        "default": 16
+                    },
+                },
+                "greeting": {
+                    # 'sync', 'concurrent', 'deferred' (after the first task) or 'off'
+                    "mode": "concurrent",
+                    # Greeting printed in 'off' mode
+                    "cached": "您好，我已準備就緒，請提供需要分析的股票代碼。",
+                },
+                "prompt": {
+                    # 'raw', 'compact', 'table' or 'delta', see IndicatorEncoder
+                    "indicatorEncoding": "raw",
+                    "precision": 2,  # Decimals kept for prices and indicators
+                },
+                "structured": {
+                    # Analysts answer with JSON verdicts instead of markdown tables
+                    "enabled": False,
+                    # 'json_schema', or 'json_object' for services without
+                    # schema support
+                    "responseFormat": "json_schema",
+                    "maxTokens": 1200,  # Response length limit of a structured answer
+                },
+                "batch": {  # Watchlist analysis, several tickers per request
+                    "maxTickers": 10,
+                    "maxInputTokens": 16000,  # Prompt tokens per request
+                    "maxOutputTokens": 8000,  # Response tokens per request
+                    "outputTokensPerTicker": 700,  # Expected report length per ticker
+                    # Response length limit as a multiple of the expected length
+                    "outputHeadroom": 2.0,
+                },
+                "context": {
+                    "budget": {  # Tokens of chat history sent per call, per role
+                        "default": 8000,
+                        "market_analyst": 8000,
+                    },
+                    # 'truncate' drops older turns, 'summarize' replaces them
+                    # with a summary
+                    "strategy": "truncate",
+                    "keepRecent": 2,  # Latest messages always kept
+                },
+                # Publish completion deltas on Topics.stream(task_id) while generating
+                "stream": False,
+                "cache": {
+                    # Serve identical requests from the response cache
+                    # (replays earlier answers)
+                    "enabled": False,
+                    # On-disk tier, '' keeps it in memory only
+                    "path": "~/.cerebrum/llm_cache.sqlite3",
+                    "ttl": 86400,  # Seconds a cached response stays valid
+                    "memoryEntries": 256,  # Size of the in-memory LRU tier
+                    "diskEntries": 10000,  # Maximum rows in the on-disk tier
+                },
+            },
+        },
+        "broker": {
+            "dispatchMode": "thread",  # 'thread' (one thread per delivery) or 'pool'
+            "maxWorkers": 8,  # Worker threads in 'pool' mode
+            "queueSize": 100,  # Pending deliveries per topic in 'pool' mode
+            # 'block', 'drop_oldest' or 'reject' when a topic queue is full
+            "backpressure": "block",
+            "maxConcurrency": 500,  # Handlers running at once on the asyncio broker
+        },
+        "reportCache": {
+            # Answer repeated tasks from earlier final reports while the
+            # latest bar is unchanged
+            "enabled": False,
+            # SQLite file, '' keeps the cache in memory only
+            "path": "~/.cerebrum/report_cache.sqlite3",
+            "ttl": 86400,  # Seconds a cached report stays valid
+            # Maximum reports kept, least recently used are evicted first
+            "maxEntries": 5000,
+        },
+        "journal": {
+            # Record stage transitions and resume unreported tasks on
+            # startup (not in interactive mode)
+            "enabled": False,
+            # Append-only journal file, used by one work group at a time
+            "path": "~/.cerebrum/task_journal.bin",
+            # Force every record to disk, survives power loss as well as crashes
+            "fsync": False,
+            # Seconds after which an unreported task is no longer resumed
+            "maxAge": 86400,
+            # Startups a task is resumed at the same stage before it is given up
+            "maxResumes": 3,
+        },
+        "scheduler": {
+            # Priority classes of tasks, lower numbers are handled first
+            "priorities": {
+                "interactive": 0,
+                "default": 1,
+                "batch": 2,
             }
-        }
+        },
+        "review": {
+            "maxRounds": 1,  # LLM reviews per task before a report is presented as-is
+            # Present reports passing ReportValidator without the chief
+            # analyst's LLM review
+            "preValidate": True,
+            # Allowed deviation of the confidence in percentage points
+            "confidenceTolerance": 1.0,
+        },
     }
 
     def __init__(self):
@@ -1,8 +1,13 @@
+from cerebrum.toolkit.IndicatorEncoder import IndicatorEncoder
+
 
 class Prompt:
 
-   def market_analysis(self,indicators):
-        prompt = f'''
+    def market_analysis(self, indicators, encoding=None):
+        # Series are serialized per Config['utils']['AI']['prompt']
+        # unless an encoding is given
+        series = IndicatorEncoder(encoding).encode(indicators)
+        prompt = f"""
         **專業股票技術指標深入分析請求**
 
 **分析要求:**
@@ -28,63 +33,132 @@ class Prompt:
 
 **技術指標數據：**
 
-1. **成交量數據**：
-   - **過去20天的成交量**： `{indicators['volume']['Volume20']}`
-   - **過去50天的成交量**： `{indicators['volume']['Volume50']}`
+{series['table']}1. **成交量數據**：
+{series['volume']}
    - **成交量趨勢評估**： (由AI分析後填入：穩定、上升、下降、不規則)
 
 2. **價格數據**：（**注意：原始prompt中這部分可能有錯，假設是為了分析支撐位，修改如下）
-   - **過去20天價格走勢**： `{indicators['price']['Price20_Trend']}`
-   - **過去50天價格走勢**： `{indicators['price']['Price50_Trend']}`
+{series['price']}
    - **短期/中期支撐位分析**： (由AI分析後填入)
 
 3. **MA（移動平均線）**：
    - **MA20**： `{indicators['MA']['MA20']}`
    - **MA50**： `{indicators['MA']['MA50']}`
    - **一般分析指導**： `{indicators['MA']['direction']}`
-   - **深化分析**： 
+   - **深化分析**：
 
 4. **EMA (指數移動平均)**：
    - **EMA20**： `{indicators['EMA']['EMA20']}`
    - **EMA50**： `{indicators['EMA']['EMA50']}`
    - **一般分析指導**： `{indicators['EMA']['direction']}`
-   - **深化分析**： 
+   - **深化分析**：
 
 5. **MACD (加入交叉判斷與最近交叉)**：
-   - **最近20天的MACD數據**： `{indicators['MACD']['recent20MACD']}`
+   - **最近20天的MACD數據**： {series['macd']}
    - **當前MACD交叉信號**： `{indicators['MACD']['latest_MACD_signal']}`
    - **一般分析指導**： `{indicators['MACD']['direction']}`
-   - **深化分析**： 
+   - **深化分析**：
 
 6. **RSI**：
-   - **當前RSI值**： `{indicators['RSI']['latest_RSI']}`
+   - **當前RSI值**： `{series['RSI']}`
    - **一般分析指導**： `{indicators['RSI']['direction']}`
-   - **超買/超售深化分析**： 
+   - **超買/超售深化分析**：
 
 7. **布林通道 (Bollinger Bands)**：
    - **當前價格於布林通道位置**： `{indicators['BB']['latest_BB_signal']}`
    - **一般分析指導**： `{indicators['BB']['direction']}`
-   - **價格動能分析**： 
+   - **價格動能分析**：
 
 8. **隨機指標 (SO)**：
    - **當前KD隨機指標信號**： `{indicators['SO']['latest_KD_signal']}`
    - **一般分析指導**： `{indicators['SO']['direction']}`
-   - **買賣信號確認分析**： 
+   - **買賣信號確認分析**：
 
 9. **平均趨向指標 (ADX)**：
-   - **當前ADX**： `{indicators['ADX']['latest_ADX']}`
+   - **當前ADX**： `{series['ADX']}`
    - **一般分析指導**： `{indicators['ADX']['direction']}`
-   - **趨勢力量評估**： 
+   - **趨勢力量評估**：
 
 10. **成交量移動平均 (VOMA)**：
     - **當前成交量的平均MA**： `{indicators['VOMA']['latest_Volume_signal']}`
     - **一般分析指導**： `{indicators['VOMA']['direction']}`
-    - **成交量確認分析**： 
-        '''
+    - **成交量確認分析**：
+        """
         return prompt
 
-   def market_analysis_role(self):
-        return f'''
+    def ticker_indicators(self, ticker, indicators, encoding=None):
+        series = IndicatorEncoder(encoding).encode(indicators)
+        return f"""
+### {ticker}
+{series['table']}{series['volume']}
+{series['price']}
+   - **MA20/MA50**： `{indicators['MA']['MA20']}` / `{indicators['MA']['MA50']}`
+   - **EMA20/EMA50**： `{indicators['EMA']['EMA20']}` / `{indicators['EMA']['EMA50']}`
+   - **最近20天的MACD數據**： {series['macd']}；**當前MACD交叉信號**： `{indicators['MACD']['latest_MACD_signal']}`
+   - **當前RSI值**： `{series['RSI']}`
+   - **當前價格於布林通道位置**： `{indicators['BB']['latest_BB_signal']}`
+   - **當前KD隨機指標信號**： `{indicators['SO']['latest_KD_signal']}`
+   - **當前ADX**： `{series['ADX']}`
+   - **當前成交量的平均MA**： `{indicators['VOMA']['latest_Volume_signal']}`
+        """  # noqa: E501
+
+    def market_analysis_batch(self, sections):
+        tickers = "\n".join(sections)
+        return f"""
+        **多股票技術指標批量分析請求**
+
+**分析要求:**
+
+1. **逐一獨立分析**：以下每支股票各自獨立分析，不可混用不同股票的數據。
+2. **分析標準**：與單一股票分析相同，每個技術指標的分析結果必須清晰、準確，並考慮成交量的支持或背離。
+3. **一般分析指導**：
+   - MA/EMA：短期均線上穿長期均線且成交量增加，視為多頭訊號；反之為空頭
+   - MACD：黃金交叉且成交量上升為強多信號；死亡交叉為短空信號
+   - RSI：> 70 超買，< 30 超賣，搭配成交量放大更可信
+   - 布林通道：放量突破上軌可能延續漲勢；放量跌破下軌可能持續下跌
+   - KD：K上穿D為買入訊號（尤其在20以下）；K下穿D在80以上為賣出訊號
+   - ADX：> 25 趨勢明確，< 25 趨勢弱
+4. **置信度計算**：根據8個核心指標（每個權重12.5%）計算每支股票的置信度。
+5. **輸出格式**：只輸出一個JSON物件，不要輸出其他文字。每支股票的 `report` 為Markdown表格，格式如下：
+   `| **技術指標** | **分析結果** | **具體依據** | **成交量趨勢支持** |`，逐行列出8個指標，最後加上 **總結**（買入/賣出/持有）及 **置信度**（X%）兩行。
+
+```json
+{{"results": [{{"ticker": "<股票代碼>", "report": "<Markdown分析表格>"}}]}}
+```
+
+**各股票技術指標數據：**
+{tickers}
+        """  # noqa: E501
+
+    def structured_output(self, kind, schema=None):
+        formats = {
+            "market_analysis": (
+                "一個JSON物件：`ticker`、`indicators`（MA、EMA、MACD、RSI、BB、SO、ADX、VOMA 8個指標各一項，"
+                "含 `indicator`、`verdict`（買入/持有/賣出）、`volume_support`（成交量是否支持）、"
+                "`rationale`）、`summary`（買入/持有/賣出）、`confidence`（與總結一致的指標數 × 12.5）、"
+                "`rationale`"
+            ),
+            "market_analysis_batch": (
+                '一個JSON物件 `{"results": [...]}`，每支股票一項，每項含 `ticker`、`indicators`（MA、EMA、'
+                "MACD、RSI、BB、SO、ADX、VOMA 8個指標各一項，含 `indicator`、`verdict`（買入/持有/賣出）、"
+                "`volume_support`、`rationale`）、`summary`、`confidence`（與總結一致的指標數 × 12.5）"
+                "、`rationale`"
+            ),
+            "review": (
+                "一個JSON物件：`result`（APPROVED 或 REVISE_REQUIRED）、`feedback`（詳細反饋）、"
+                "`issues`（需要修改的具體問題列表）"
+            ),
+        }
+        schema_text = f"\n* **JSON Schema**：`{schema}`" if schema else ""
+        return f"""
+
+**結構化輸出（取代上述所有輸出格式要求）**：
+* 只輸出{formats[kind]}，不要輸出Markdown表格或其他文字。
+* 每個 `rationale` 不超過40字。{schema_text}
+        """
+
+    def market_analysis_role(self):
+        return """
 **角色定義與任務簡報**
 
 * **您的角色**：**高級量化股票市場分析師**，負責提供全面、可行的市場洞察。
@@ -116,18 +190,10 @@ class Prompt:
      * **準確性與精確度**：確保所有計算和解讀的準確。
      * **清晰性與易讀性**：以易於理解的方式呈現複雜分析。
      * **審核軌跡**：隱含地支持分析的底層資料/假設（不一定在輸出中詳細列出）
-        '''
-    
-   def chief_analyzer_review(self,analysis):
-        output_format = '''
-        {
-  "audit_result": {
-    "result": "REVISE_REQUIRED",
-    "feedback": "詳細的反饋結果" 
-  }
-}
-        '''
-        return f'''
+        """  # noqa: E501
+
+    def chief_analyzer_review(self, analysis):
+        return f"""
 * **您的角色**：**首席分析師（Chief Analysis Officer）**
 * **您的任務**：審核 **市場分析師** 提交的 **股票技術指標分析報告**，確保其質量、準確性和戰略意義。
 
@@ -158,10 +224,10 @@ class Prompt:
      - **重新提交** (`REVISE_REQUIRED`, `FALSE`, `0`)
        - **文字提示**：『**重新分析請求**：請根據反饋修改並重新提交。[詳細反饋]`
    * **輸入詳細反饋/討論議點**
-        '''
-    
-   def user_feedback(self,feedback):
-    return f'''
+        """
+
+    def user_feedback(self, feedback):
+        return f"""
     **重新分析請求**
 
 * **用戶滿意度**：未達用戶期待，請根據下述反饋修改。
@@ -178,10 +244,22 @@ class Prompt:
    - **[具體動作1，例如]**：重新計算均價線（MA）以反映最新趨勢。
    - **[具體動作2，例如]**：重新評估布林通道（Bollinger Bands）以提供更準確的買賣信號。
 4. **提交修訂分析**：確保回答所有用戶反饋點。
-    '''
-   
-   def revise_market_analysis(self,analysis,feedback):
-       return f'''
+    """
+
+    def summarize_history(self, transcript):
+        return f"""
+           **對話摘要請求**
+
+* **將以下分析師與用戶之間的較早對話整理為簡明摘要，供後續修正分析參考**。
+* **保留**：用戶提出的所有反饋要點、每輪分析的結論（買入/持有/賣出）及置信度、已作出的修改。
+* **省略**：原始數據、重複的表格內容和格式說明。
+* **摘要不超過300字**。
+* **較早的對話**：
+  {transcript}
+       """
+
+    def revise_market_analysis(self, analysis, feedback):
+        return f"""
            **重新修改請求**
 
 * **閱讀首席分析師的審核報告，對需要改進的分析內容進行修改，不需要改進的分析內容則不需要修改**。
@@ -190,4 +268,4 @@ class Prompt:
 * **你提交給首席分析師的分析內容**：
   {analysis}
 * **提交修訂之後的分析內容，確保修訂後的分析內容達到首席分析師所反饋的要求**。
-       '''
\ No newline at end of file
+       """
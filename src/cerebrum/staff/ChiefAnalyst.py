@@ -1,55 +1,182 @@
+from functools import partial
+from typing import Any, Dict
+
+from cerebrum.config.Prompt import Prompt
 from cerebrum.toolkit.AIClient import AIClient
 from cerebrum.toolkit.MessageBroker import MessageBroker
-from typing import Dict, Any, Callable
+from cerebrum.toolkit.ReportValidator import ReportValidator
+from cerebrum.toolkit.StructuredOutput import StructuredOutput
 from cerebrum.toolkit.Topics import Topics
-import random
-from cerebrum.config.Prompt import Prompt
-import json
+
 
 class ChiefAnalyst(AIClient):
+
+    GREETING = (
+        "您的角色**：首席分析師（Chief Analysis Officer）**，"
+        "審核 **市場分析師** 提交的 **股票技術指標分析報告**，確保其質量、準確性和戰略意義。"
+        "現在你正式開始工作，請向你的用戶進行簡短問候。"
+    )
+    GREETING_COLOR = "\033[31m"
+
     def __init__(self, broker: MessageBroker):
         super().__init__(broker, "chief_analyst")
         self.pending_tasks: Dict[str, Dict] = {}
-        self.reviewed_times = 0
-        greeting = [
-            {
-                'role':'user',
-                'content':'您的角色**：首席分析師（Chief Analysis Officer）**，審核 **市場分析師** 提交的 **股票技術指標分析報告**，確保其質量、準確性和戰略意義。現在你正式開始工作，請向你的用戶進行簡短問候。'
-            }
-        ]
-        greeting = self.call_ai(greeting)
-        print(f"\033[31m「問候」:{greeting}\033[0m")
-        self.broker.subscribe(Topics.CHIEF_REVIEW, self.handle_task)
-    
+        # Rule-based gate before the LLM review
+        self.validator = (
+            ReportValidator() if self.config["review"]["preValidate"] else None
+        )
+        # Reports presented by the gate vs sent to the LLM
+        self.review_counts = {
+            "skipped": 0,
+            "reviewed": 0,
+        }
+        # Replicas share reviews through the role's consumer group
+        self._subscribe(
+            Topics.CHIEF_REVIEW,
+            self.handle_task,
+            self.handle_task_async,
+            group=self.role,
+        )
+
+    DONE = "\033[31m首席分析師已經完成了報告分析，現在將報告提交給用戶助理並完成審核任務。\033[0m"
+
     def handle_task(self, message: Dict[str, Any]):
-        chatHistory = message['chatHistory']
-        analysis = message['content']
-        if self.reviewed_times <1:
-            #review the report
-            
+        self._handle_step(
+            message, message.get("ticker"), self._prepare_review, "review"
+        )
+        print(self.DONE)
+
+    async def handle_task_async(self, message: Dict[str, Any]):
+        await self._handle_step_async(
+            message, message.get("ticker"), self._prepare_review, "review"
+        )
+        print(self.DONE)
+
+    def _prepare_review(self, message: Dict[str, Any]):
+        """
+        Build the review prompt for a report.
+
+        Returns:
+            The review prompt and its submission, or None when the report is not
+            reviewed again and was presented to the user directly
+        """
+        analysis = message["content"]
+        # Carried in the messages, so any replica can pick up any round of any task
+        if message.get("reviews", 0) < self.config["review"]["maxRounds"]:
+            if self._passes_validation(message):
+                return None
+
+            # review the report
+
             prompt_config = Prompt()
             review_prompt = [
                 {
-                    'role':'user',
-                    'content':prompt_config.chief_analyzer_review(analysis)
+                    "role": "user",
+                    "content": prompt_config.chief_analyzer_review(analysis)
+                    + self._structured_instruction("review"),
                 }
             ]
-            self.reviewed_times +=1
-            review_result = self.call_ai(review_prompt)
-            print(f"首席分析師審核結果:{review_result}")
-            #print('Chief analyst review:',review_result)
-            self.broker.publish(Topics.MARKET_ANALYSIS_REVISE, {
-                        "task_id": message["task_id"],
-                        "type": "final_report",
-                        "review_feedback": review_result,
-                        'market_analysis':analysis
-                    })
+            return review_prompt, partial(self._submit_review, message)
 
         else:
-            self.broker.publish(Topics.PRESENT_REPORT, {
+            self.broker.publish(
+                Topics.PRESENT_REPORT,
+                {
+                    "task_id": message["task_id"],
+                    "type": "final_report",
+                    "report": analysis,
+                    "structured": message.get("structured"),
+                },
+            )
+        return None
+
+    def _passes_validation(self, message: Dict[str, Any]) -> bool:
+        """
+        Present the report directly when it passes the rule-based validation.
+
+        Returns:
+            True if the report was presented without an LLM review
+        """
+        if self.validator is None:
+            return False
+        result = self.validator.validate(message["content"], message.get("indicators"))
+        self.review_counts["skipped" if result["passed"] else "reviewed"] += 1
+        self._publish_skip_rate()
+        if not result["passed"]:
+            print(
+                f"\033[31m首席分析師：報告未通過規則檢查（{'；'.join(result['errors'])}），進行詳細審核。\033[0m"
+            )
+            return False
+
+        print(
+            "\033[31m首席分析師：報告格式與置信度檢查通過，直接提交給用戶助理。\033[0m"
+        )
+        self.broker.publish(
+            Topics.PRESENT_REPORT,
+            {
+                "task_id": message["task_id"],
+                "type": "final_report",
+                "report": message["content"],
+                "structured": message.get("structured"),
+            },
+        )
+        return True
+
+    def _publish_skip_rate(self):
+        """Publish the share of reports that skipped the LLM review."""
+        skipped, reviewed = (
+            self.review_counts["skipped"],
+            self.review_counts["reviewed"],
+        )
+        self.broker.publish(
+            Topics.METRICS,
+            {
+                "role": self.role,
+                "name": "chief_review.skip_rate",
+                "value": skipped / (skipped + reviewed),
+                "skipped": skipped,
+                "reviewed": reviewed,
+            },
+        )
+
+    def _submit_review(self, message: Dict[str, Any], review_result):
+        """
+        Send the review back to the market analyst for revision, or present an approved
+        report.
+        """
+        print(f"首席分析師審核結果:{review_result}")
+        # print('Chief analyst review:',review_result)
+        if self.structured:
+            try:
+                review = StructuredOutput.parse_review(review_result)
+            except ValueError:
+                review = None  # Let the market analyst revise against the raw review
+            if review is not None and review.approved:
+                # Nothing to revise, skip the revision round-trip
+                self.broker.publish(
+                    Topics.PRESENT_REPORT,
+                    {
+                        "task_id": message["task_id"],
+                        "type": "final_report",
+                        "report": message["content"],
+                        "structured": message.get("structured"),
+                    },
+                )
+                return
+            if review is not None:
+                review_result = review.to_text()
+        self.broker.publish(
+            Topics.MARKET_ANALYSIS_REVISE,
+            {
                 "task_id": message["task_id"],
+                "ticker": message.get("ticker"),
                 "type": "final_report",
-                "report": analysis
-            })
-        print(f"\033[31m首席分析師已經完成了報告分析，現在將報告提交給用戶助理並完成審核任務。\033[0m")
-    
+                "review_feedback": review_result,
+                "market_analysis": message["content"],
+                "indicators": message.get(
+                    "indicators"
+                ),  # For the review of the revision
+                "reviews": message.get("reviews", 0)
+                + 1,  # Review rounds done on this task
+            },
+        )
@@ -1,199 +1,675 @@
+import asyncio
+import json
+import traceback
+from functools import partial
+from typing import Any, Dict
+
+from cerebrum.config.Prompt import Prompt
 from cerebrum.toolkit.AIClient import AIClient
+from cerebrum.toolkit.ContextManager import ContextManager
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
 from cerebrum.toolkit.MessageBroker import MessageBroker
-from typing import Dict, Any, Callable
+from cerebrum.toolkit.StructuredOutput import StructuredOutput
 from cerebrum.toolkit.Topics import Topics
-import random
-from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
-from cerebrum.config.Prompt import Prompt
 
 
 class MarketAnalyst(AIClient):
     """AI agent specialized in market technical analysis."""
-    
+
+    GREETING = "您的角色**：**高級量化股票市場分析師**，負責提供全面、可行的市場洞察。現在你正式開始工作，請向你的用戶進行簡短問候。"
+    GREETING_COLOR = "\033[38;5;208m"
+
     def __init__(self, broker: MessageBroker, interactive_mode):
         """
         Initialize the Market Analyst.
-        
+
         Args:
             broker: Message broker for communication
             interactive_mode: Whether to enable interactive user feedback
         """
         super().__init__(broker, "market_analyst")
-        greeting = [
-            {
-                'role':'user',
-                'content':'您的角色**：**高級量化股票市場分析師**，負責提供全面、可行的市場洞察。現在你正式開始工作，請向你的用戶進行簡短問候。'
-            }
-        ]
-        greeting = self.call_ai(greeting)
-        print(f"\033[38;5;208m「問候」:{greeting}\033[0m")
-        #print(f"\033[92minit: \033[0m")
+        # print(f"\033[92minit: \033[0m")
         self.tickerData = None  # Cache for ticker data
+        # Keeps feedback rounds within budget
+        self.context = ContextManager(self.role, summarize=self._summarize_history)
 
-        # Register message handlers
-        self.broker.subscribe(Topics.MARKET_ANALYSIS, self.handle_task)
-        self.broker.subscribe(Topics.MARKET_ANALYSIS_REVISE, self.handle_revise)
+        # Register message handlers, replicas share the work through
+        # the role's consumer group
+        self._subscribe(
+            Topics.MARKET_ANALYSIS,
+            self.handle_task,
+            self.handle_task_async,
+            group=self.role,
+        )
+        self._subscribe(
+            Topics.MARKET_ANALYSIS_BATCH,
+            self.handle_batch,
+            self.handle_batch_async,
+            group=self.role,
+        )
+        self._subscribe(
+            Topics.MARKET_ANALYSIS_REVISE,
+            self.handle_revise,
+            self.handle_revise_async,
+            group=self.role,
+        )
 
         # Additional handler for interactive feedback mode
         if interactive_mode:
-            self.broker.subscribe(Topics.MARKET_ANALYSIS_FEEDBACK, 
-                                self.handle_analysis_with_feedback)
-    
+            self._subscribe(
+                Topics.MARKET_ANALYSIS_FEEDBACK,
+                self.handle_analysis_with_feedback,
+                self.handle_analysis_with_feedback_async,
+                group=self.role,
+            )
+
     def handle_task(self, message: Dict[str, Any]):
         """Handle market analysis tasks."""
-        print(f"\033[38;5;208m 高級市場分析師：開始分析工作\033[0m")
-        
-        
-        task_id = message["task_id"]
-        ticker = message["data"]['ticker']
-        filter = message['data']['filter']
-        isInteractiveMode = message['isInteractiveMode']
+        self._handle_step(
+            message,
+            message["data"]["ticker"],
+            self._prepare_analysis,
+            "market_analysis",
+        )
 
-        # 1. Retrieve market data
-        financeUtils = FinanceDataUtils()
-        tickerData = financeUtils.retrieveData(
-            ticker=ticker,
-            filter=filter
+    async def handle_task_async(self, message: Dict[str, Any]):
+        """Handle market analysis tasks on the event loop."""
+        await self._handle_step_async(
+            message,
+            message["data"]["ticker"],
+            self._prepare_analysis,
+            "market_analysis",
         )
 
+    def _prepare_analysis(self, message: Dict[str, Any]):
+        """
+        Retrieve market data of a task and return its analysis prompt and submission.
+        """
+        print("\033[38;5;208m 高級市場分析師：開始分析工作\033[0m")
+        indicators = self._indicators(message)
+        prompt = self._analysis_prompt(indicators)
+        return prompt, partial(
+            self._submit_analysis, message, prompt, indicators=indicators
+        )
+
+    def _indicators(self, message: Dict[str, Any]):
+        """Retrieve market data of a task and calculate its technical indicators."""
+        ticker = message["data"]["ticker"]
+        filter = message["data"]["filter"]
+
+        # 1. Retrieve market data, unless the user proxy already did
+        # for the report cache
+        financeUtils = FinanceDataUtils()
+        tickerData = message["data"].get("tickerData")
+        if tickerData is None:
+            tickerData = financeUtils.retrieveData(ticker=ticker, filter=filter)
+
         # 2. Calculate technical indicators
-        indicators = financeUtils.getTechnicalIndicators(tickerData)
-        
-        # 3. Prepare analysis prompt
+        return financeUtils.getTechnicalIndicators(tickerData)
+
+    def _analysis_prompt(self, indicators: Dict[str, Any]):
+        """Build the single-ticker analysis prompt."""
         prompt_config = Prompt()
         system_role = prompt_config.market_analysis_role()
-        user_prompt = prompt_config.market_analysis(indicators)
-        
+        user_prompt = prompt_config.market_analysis(
+            indicators
+        ) + self._structured_instruction("market_analysis")
+
         prompt = [
-            {
-                'role': 'system',
-                'content': system_role
-            },
-            {
-                'role': 'user',
-                'content': user_prompt
-            }
+            {"role": "system", "content": system_role},
+            {"role": "user", "content": user_prompt},
         ]
-        
-        analysis = self.call_ai(prompt)
+        return prompt
+
+    def _structure(self, response: str, ticker: str):
+        """
+        Parse a response in structured mode.
+
+        Returns:
+            Tuple of the report as markdown and the structured result as a dict, or
+            the response as-is and None when structured mode is off or parsing fails
+        """
+        if not self.structured:
+            return response, None
+        try:
+            result = StructuredOutput.parse_analysis(response, ticker)
+        except ValueError as e:
+            print(
+                f"\033[38;5;208m高級市場分析師：結構化結果解析失敗（{e}），改用原始回覆。\033[0m"
+            )
+            return response, None
+        return result.to_markdown(), StructuredOutput.to_dict(result)
+
+    def _submit_analysis(
+        self, message: Dict[str, Any], prompt, analysis, indicators=None
+    ):
+        """
+        Forward a fresh analysis, with the indicators it was based on, to the user or
+        the chief analyst.
+        """
+        task_id = message["task_id"]
+        ticker = message["data"]["ticker"]
+        isInteractiveMode = message["isInteractiveMode"]
+        analysis, structured = self._structure(analysis, ticker)
+
         chat_history = prompt
-        chat_history.append(
-            {
-                'role': 'assistant',
-                'content': analysis
-            }
-        )
+        chat_history.append({"role": "assistant", "content": analysis})
 
         try:
             if isInteractiveMode:
-                # Interactive mode: collect user feedback       
-                self.broker.publish(Topics.USER_FEEDBACK, {
-                    "task_id": task_id,
-                    "ticker": ticker,
-                    "role": "market_analyzer",
-                    "content": analysis,
-                    "chatHistory": chat_history,
-                    "retries": self.max_retries
-                })
+                # Interactive mode: collect user feedback
+                self.broker.publish(
+                    Topics.USER_FEEDBACK,
+                    {
+                        "task_id": task_id,
+                        "ticker": ticker,
+                        "role": "market_analyzer",
+                        "content": analysis,
+                        "chatHistory": chat_history,
+                        "retries": self.max_retries,
+                        "indicators": indicators,
+                        "structured": structured,
+                    },
+                )
             else:
                 # Non-interactive mode: send directly to chief analyst
-                print(f"\033[38;5;208m高級市場分析師：\033[0m")
+                print("\033[38;5;208m高級市場分析師：\033[0m")
                 print(f"{analysis}")
-                #print(analysis)
-                print(f"\033[38;5;208m高級市場分析師：完成工作了，現在向首席分析師提交分析報告進行審核。\033[0m")
-                #print('completed analyze, now passing to chief analyzer to review')
-                self.broker.publish(Topics.CHIEF_REVIEW, {
-                    "task_id": task_id,
-                    "ticker": ticker,
-                    "role": "market_analyzer",
-                    "content": analysis,
-                    "chatHistory": chat_history,
-                    "retries": self.max_retries
-                })
+                # print(analysis)
+                print(
+                    "\033[38;5;208m高級市場分析師：完成工作了，現在向首席分析師提交分析報告進行審核。\033[0m"
+                )
+                # print('completed analyze, now passing to chief analyzer to review')
+                self.broker.publish(
+                    Topics.CHIEF_REVIEW,
+                    {
+                        "task_id": task_id,
+                        "ticker": ticker,
+                        "role": "market_analyzer",
+                        "content": analysis,
+                        "chatHistory": chat_history,
+                        "retries": self.max_retries,
+                        "indicators": indicators,
+                        "structured": structured,
+                    },
+                )
+        except Exception:
+            print("\033[38;5;208m高級市場分析師：系統故障，分析處理失敗\033[0m")
+
+    def handle_batch(self, message: Dict[str, Any]):
+        """
+        Handle a watchlist of market analysis tasks with one request per batch of
+        tickers.
+        """
+        for batch in self._prepared_batches(message):
+            try:
+                prompt, options = self._batch_prompt(batch)
+                response = self.call_ai(prompt, **options)
+            except Exception as e:
+                self._requeue_batch(batch, e)  # Later batches still go ahead
+                continue
+            self._submit_batch(batch, response)
+
+    async def handle_batch_async(self, message: Dict[str, Any]):
+        """
+        Handle a watchlist of market analysis tasks on the event loop, batches run
+        concurrently.
+        """
+        batches = await asyncio.to_thread(self._prepared_batches, message)
+
+        async def analyze(batch):
+            try:
+                prompt, options = self._batch_prompt(batch)
+                response = await self.call_ai_async(prompt, **options)
+            except Exception as e:
+                self._requeue_batch(batch, e)  # The other batches still go ahead
+                return
+            self._submit_batch(batch, response)
+
+        await asyncio.gather(*(analyze(batch) for batch in batches))
+
+    def _prepared_batches(self, message: Dict[str, Any]):
+        """
+        Prepare and plan the batches of a batch message.
+
+        Tasks that can't be prepared are reported as failed, and so are all of
+        them if planning fails.
+        """
+        items = self._prepare_batch(message)
+        try:
+            return self._plan_batches(items)
         except Exception as e:
-            print(f"\033[38;5;208m高級市場分析師：系統故障，分析處理失敗\033[0m")
-            #print(f"Market analyzer action failed:{str(e)}")
+            traceback.print_exc()
+            for item in items:
+                self._report_failure(
+                    item["task"]["task_id"], item["task"]["data"]["ticker"], e
+                )
+            return []
+
+    def _prepare_batch(self, message: Dict[str, Any]):
+        """
+        Calculate the indicators of every task in a batch message, all tickers in one
+        pass.
+
+        A history the vectorized pass can't handle fails the whole pass, the
+        indicators are then calculated per ticker. Tasks whose data or indicators
+        can't be had are reported as failed.
+
+        Returns:
+            List of dicts with the task message, its indicators, the ticker's prompt
+            section and the section's token count
+        """
+        tasks = message["tasks"]
+        print(f"\033[38;5;208m 高級市場分析師：開始批量分析 {len(tasks)} 支股票\033[0m")
+        histories = self._retrieve_batch(tasks)
+        financeUtils = FinanceDataUtils()
+        try:
+            indicators = financeUtils.getTechnicalIndicatorsMany(histories)
+        except Exception:
+            traceback.print_exc()
+            indicators = {}
+        prompt_config = Prompt()
+        items = []
+        for task in tasks:
+            task_id, ticker = task["task_id"], task["data"]["ticker"]
+            if task_id not in histories:
+                continue  # Reported by _retrieve_batch
+            with self._reporting_failure(task_id, ticker):
+                if task_id not in indicators:
+                    indicators[task_id] = financeUtils.getTechnicalIndicators(
+                        histories[task_id].copy()
+                    )
+                section = prompt_config.ticker_indicators(ticker, indicators[task_id])
+                items.append(
+                    {
+                        "task": task,
+                        "indicators": indicators[task_id],
+                        "section": section,
+                        "tokens": ContextManager.count_tokens(section),
+                    }
+                )
+        return items
+
+    def _retrieve_batch(self, tasks):
+        """
+        Retrieve the market data of a batch's tasks, in bulk per filter.
+
+        Tasks whose data cannot be retrieved are reported as failed.
+
+        Returns:
+            Dictionary mapping task_id to its market data
+        """
+        histories, byFilter = {}, {}
+        for task in tasks:
+            # Retrieved by the user proxy for the report cache
+            if task["data"].get("tickerData") is not None:
+                histories[task["task_id"]] = task["data"]["tickerData"]
+            else:
+                byFilter.setdefault(
+                    json.dumps(task["data"]["filter"], sort_keys=True), []
+                ).append(task)
+
+        financeUtils = FinanceDataUtils()
+        for group in byFilter.values():
+            try:
+                retrieved = financeUtils.retrieveMany(
+                    [task["data"]["ticker"] for task in group],
+                    group[0]["data"]["filter"],
+                )
+            except Exception:
+                traceback.print_exc()
+                retrieved = {}  # Every task of the group is reported below
+            for task in group:
+                ticker = task["data"]["ticker"]
+                if ticker.upper() in retrieved:
+                    histories[task["task_id"]] = retrieved[ticker.upper()]
+                    continue
+                print(f"\033[38;5;208m高級市場分析師：{ticker} 資料取得失敗\033[0m")
+                self.broker.publish(
+                    Topics.PRESENT_REPORT,
+                    {
+                        "task_id": task["task_id"],
+                        "type": "final_report",
+                        "report": f"{ticker}：資料取得失敗，無法完成分析。",
+                        "failed": True,  # Not a report to cache
+                    },
+                )
+        return histories
+
+    def _plan_batches(self, items):
+        """
+        Split tickers into batches that fit the input and output token limits of
+        Config['utils']['AI']['batch'].
+        """
+        batchConfig = self.config["utils"]["AI"]["batch"]
+        prompt_config = Prompt()
+        base = ContextManager.count_tokens(
+            prompt_config.market_analysis_role()
+        ) + ContextManager.count_tokens(prompt_config.market_analysis_batch([]))
+
+        batches, current, tokens = [], [], base
+        for item in items:
+            fits = (
+                len(current) < batchConfig["maxTickers"]
+                and tokens + item["tokens"] <= batchConfig["maxInputTokens"]
+                and (len(current) + 1) * batchConfig["outputTokensPerTicker"]
+                <= batchConfig["maxOutputTokens"]
+            )
+            if current and not fits:
+                batches.append(current)
+                current, tokens = [], base
+            current.append(item)
+            tokens += item["tokens"]
+        if current:
+            batches.append(current)
+        return batches
+
+    def _batch_prompt(self, batch):
+        """Build the prompt and call_ai options of one batch."""
+        prompt_config = Prompt()
+        prompt = [
+            {"role": "system", "content": prompt_config.market_analysis_role()},
+            {
+                "role": "user",
+                "content": (
+                    prompt_config.market_analysis_batch(
+                        [item["section"] for item in batch]
+                    )
+                    + self._structured_instruction("market_analysis_batch")
+                ),
+            },
+        ]
+        batchConfig = self.config["utils"]["AI"]["batch"]
+        # The per-ticker length is an estimate, a response cut off at it loses the
+        # tickers after the cut
+        max_tokens = int(
+            len(batch)
+            * batchConfig["outputTokensPerTicker"]
+            * batchConfig["outputHeadroom"]
+        )
+        options = self._structured_options("market_analysis_batch", max_tokens) or {
+            "max_tokens": max_tokens
+        }
+        return prompt, options
+
+    @staticmethod
+    def _parse_batch(response: str) -> Dict[str, str]:
+        """
+        Get the per-ticker reports of a batch response, keyed by upper-case ticker.
+
+        Of a response cut off by the token limit the complete reports are kept.
+        """
+        start, end = response.find("{"), response.rfind("}")
+        try:
+            results = (
+                json.loads(response[start : end + 1]).get("results", [])
+                if 0 <= start < end
+                else None
+            )
+        except (json.JSONDecodeError, AttributeError):
+            results = None
+        if not isinstance(results, list):
+            results = StructuredOutput.complete_results(response)
+        return {
+            str(result["ticker"]).upper(): result["report"]
+            for result in results
+            if isinstance(result, dict)
+            and result.get("ticker")
+            and result.get("report")
+        }
+
+    def _requeue_batch(self, batch, error: Exception):
+        """Fall back to single-ticker analyses of a batch whose request failed."""
+        print(
+            f"\033[38;5;208m高級市場分析師：批量分析失敗（{error}），改為逐一分析 {len(batch)} 支股票。\033[0m"
+        )
+        for item in batch:
+            self.broker.publish(Topics.MARKET_ANALYSIS, item["task"])
+
+    def _submit_batch(self, batch, response: str):
+        """
+        Split a batch response into per-task analyses, re-queueing tickers the model
+        missed.
+        """
+        if self.structured:
+            try:
+                # Each ticker's result goes on as its own structured response
+                reports = {
+                    ticker: json.dumps(
+                        StructuredOutput.to_dict(result), ensure_ascii=False
+                    )
+                    for ticker, result in StructuredOutput.parse_batch(response).items()
+                }
+            except ValueError:
+                reports = {}
+        else:
+            reports = self._parse_batch(response)
+        for item in batch:
+            task = item["task"]
+            report = reports.get(task["data"]["ticker"].upper())
+            if report is None:
+                # Fall back to a single-ticker analysis of this task
+                print(
+                    f"\033[38;5;208m高級市場分析師：批量結果缺少 {task['data']['ticker']}，改為單獨分析。"
+                    "\033[0m"
+                )
+                self.broker.publish(Topics.MARKET_ANALYSIS, task)
+                continue
+            self._submit_analysis(
+                task,
+                self._analysis_prompt(item["indicators"]),
+                report,
+                item["indicators"],
+            )
 
     def handle_analysis_with_feedback(self, message: Dict[str, Any]):
         """Handle analysis tasks incorporating user feedback."""
-        print(f"\033[38;5;208m高級市場分析師：正在理解用戶的反饋。\033[0m")
-        #print('Handling analysis task with user feedback')
-        
+        self._handle_step(
+            message,
+            message["data"]["ticker"],
+            self._prepare_feedback,
+            "market_analysis",
+        )
+
+    async def handle_analysis_with_feedback_async(self, message: Dict[str, Any]):
+        """Handle analysis tasks incorporating user feedback on the event loop."""
+        await self._handle_step_async(
+            message,
+            message["data"]["ticker"],
+            self._prepare_feedback,
+            "market_analysis",
+        )
+
+    def _prepare_feedback(self, message: Dict[str, Any]):
+        """
+        Add the user's feedback to the chat history.
+
+        Returns:
+            The chat history to re-analyze and its submission, or None when there
+            is no feedback and the current analysis was submitted to the chief analyst
+        """
+        print("\033[38;5;208m高級市場分析師：正在理解用戶的反饋。\033[0m")
+        # print('Handling analysis task with user feedback')
+
         task_id = message["task_id"]
-        ticker = message['data']['ticker']
-        chatHistory = message['data']['chatHistory']
-        feedback = message['data']['feedback']
-        currentAnalysis = message['data']['currentAnalysis']
+        ticker = message["data"]["ticker"]
+        chatHistory = message["data"]["chatHistory"]
+        feedback = message["data"]["feedback"]
+        currentAnalysis = message["data"]["currentAnalysis"]
 
-        if feedback == '' or feedback == 'no':
+        if feedback == "" or feedback == "no":
             # No feedback - submit to chief analyst
-            print(f"\033[38;5;208m高級市場分析師：用戶沒有進一步的反饋，現在我將報告提交給首席分析師進行審核。\033[0m")
-            self.broker.publish(Topics.CHIEF_REVIEW, {
-                "task_id": task_id,
-                "ticker": ticker,
-                "role": "market_analyzer",
-                "content": currentAnalysis,
-                "chatHistory": chatHistory,
-                "retries": self.max_retries
-            })
+            print(
+                "\033[38;5;208m高級市場分析師：用戶沒有進一步的反饋，現在我將報告提交給首席分析師進行審核。\033[0m"
+            )
+            self.broker.publish(
+                Topics.CHIEF_REVIEW,
+                {
+                    "task_id": task_id,
+                    "ticker": ticker,
+                    "role": "market_analyzer",
+                    "content": currentAnalysis,
+                    "chatHistory": chatHistory,
+                    "retries": message["data"]["retryAttempts"],
+                    "indicators": message["data"].get("indicators"),
+                    "structured": message["data"].get("structured"),
+                },
+            )
         else:
             # Process feedback and re-analyze
             prompt_config = Prompt()
             prompt = {
-                'role': 'user',
-                'content': prompt_config.user_feedback(feedback)
+                "role": "user",
+                "content": prompt_config.user_feedback(feedback)
+                + self._structured_instruction("market_analysis"),
             }
-            
+
             chatHistory.append(prompt)
-            #print(chatHistory)
-            
-            analysis = self.call_ai(chatHistory)
-            print(f"高級市場分析師：用戶提交了反饋「{feedback}」，我將根據要求進行修正分析。")
-            
-            self.max_retries = self.max_retries - 1
-            
-            if self.max_retries > 0:
-                # Still have retries remaining
-                chatHistory.append(
-                    {
-                        'role': 'assistant',
-                        'content': analysis
-                    }
+            # print(chatHistory)
+            chatHistory = self.context.compact(chatHistory, task_id)
+            # Later rounds grow from the compacted history
+            message["data"]["chatHistory"] = chatHistory
+            saved = self.context.saved(task_id)
+            if saved:
+                print(
+                    f"\033[38;5;208m高級市場分析師：已壓縮對話上下文，本任務累計節省約 {saved} tokens。\033[0m"
                 )
-                
-                self.broker.publish(Topics.USER_FEEDBACK, {
+            return chatHistory, partial(self._submit_feedback_analysis, message)
+        return None
+
+    def _summarize_history(self, messages):
+        """Summarize older feedback rounds for the 'summarize' context strategy."""
+        transcript = "\n\n".join(
+            f"[{message['role']}] {message['content']}" for message in messages
+        )
+        summary = self.call_ai(
+            [{"role": "user", "content": Prompt().summarize_history(transcript)}]
+        )
+        return f"「先前對話摘要」\n{summary}"
+
+    def _submit_feedback_analysis(self, message: Dict[str, Any], analysis):
+        """
+        Send a re-analysis back for feedback, or to the chief analyst when out of
+        retries.
+        """
+        task_id = message["task_id"]
+        ticker = message["data"]["ticker"]
+        chatHistory = message["data"]["chatHistory"]
+        feedback = message["data"]["feedback"]
+        print(
+            f"高級市場分析師：用戶提交了反饋「{feedback}」，我將根據要求進行修正分析。"
+        )
+        analysis, structured = self._structure(analysis, ticker)
+
+        # Feedback rounds left for this task
+        retries = message["data"]["retryAttempts"] - 1
+
+        if retries > 0:
+            # Still have retries remaining
+            chatHistory.append({"role": "assistant", "content": analysis})
+
+            self.broker.publish(
+                Topics.USER_FEEDBACK,
+                {
                     "task_id": task_id,
-                    "ticker": message['data']['ticker'],
+                    "ticker": message["data"]["ticker"],
                     "role": "market_analyzer",
                     "content": analysis,
                     "chatHistory": chatHistory,
-                    "retries": self.max_retries
-                })
-            else:
-                # Max retries reached - submit to chief analyst
-                print(f"\033[38;5;208m高級市場分析師：已經多次修正，現在將分析報告提交給首席分析師進行審核。\033[0m")
-                self.broker.publish(Topics.CHIEF_REVIEW, {
+                    "retries": retries,
+                    "indicators": message["data"].get("indicators"),
+                    "structured": structured,
+                },
+            )
+        else:
+            # Max retries reached - submit to chief analyst
+            print(
+                "\033[38;5;208m高級市場分析師：已經多次修正，現在將分析報告提交給首席分析師進行審核。\033[0m"
+            )
+            self.broker.publish(
+                Topics.CHIEF_REVIEW,
+                {
                     "task_id": task_id,
                     "ticker": ticker,
                     "role": "market_analyzer",
                     "content": analysis,
                     "chatHistory": chatHistory,
-                    "retries": self.max_retries
-                })
-    def handle_revise(self,message: Dict[str, Any]):
-        print(f"\033[38;5;208m高級市場分析師：正在根據首席分析師的審核結果進行修正。\033[0m")
-        #print('handling revise')
-        market_analysis = message['market_analysis']
-        review_feedback = message['review_feedback']
+                    "retries": retries,
+                    "indicators": message["data"].get("indicators"),
+                    "structured": structured,
+                },
+            )
+
+    def handle_revise(self, message: Dict[str, Any]):
+        self._handle_step(
+            message, message.get("ticker"), self._prepare_revision, "market_analysis"
+        )
+
+    async def handle_revise_async(self, message: Dict[str, Any]):
+        await self._handle_step_async(
+            message, message.get("ticker"), self._prepare_revision, "market_analysis"
+        )
+
+    def _prepare_revision(self, message: Dict[str, Any]):
+        """
+        Build the revision prompt from the chief analyst's review, returns it and its
+        submission.
+        """
+        print(
+            "\033[38;5;208m高級市場分析師：正在根據首席分析師的審核結果進行修正。\033[0m"
+        )
+        # print('handling revise')
+        market_analysis = message["market_analysis"]
+        review_feedback = message["review_feedback"]
         prompt_config = Prompt()
-        revise_prompt = [{
-                'role': 'user',
-                'content': prompt_config.revise_market_analysis(market_analysis,review_feedback)
-            }]
-        revised_result = self.call_ai(revise_prompt)
-        print(f"\033[38;5;208m高級市場分析師：修正完成，正在將報告提交給用戶助理並完成分析任務。\033[0m") 
-        self.broker.publish(Topics.PRESENT_REPORT, {
+        revise_prompt = [
+            {
+                "role": "user",
+                "content": (
+                    prompt_config.revise_market_analysis(
+                        market_analysis, review_feedback
+                    )
+                    + self._structured_instruction("market_analysis")
+                ),
+            }
+        ]
+        return revise_prompt, partial(self._submit_revision, message, revise_prompt)
+
+    def _submit_revision(self, message: Dict[str, Any], prompt, revised_result):
+        """
+        Send the revised report back for review until Config['review']['maxRounds'],
+        then to the user proxy.
+        """
+        report, structured = self._structure(revised_result, message.get("ticker"))
+        reviews = message.get("reviews", 0)
+        if reviews < self.config["review"]["maxRounds"]:
+            print(
+                f"\033[38;5;208m高級市場分析師：修正完成，將報告再次提交給首席分析師審核（第 {reviews + 1} 輪）。\033[0m"
+            )
+            self.broker.publish(
+                Topics.CHIEF_REVIEW,
+                {
+                    "task_id": message["task_id"],
+                    "ticker": message.get("ticker"),
+                    "role": "market_analyzer",
+                    "content": report,
+                    "chatHistory": prompt + [{"role": "assistant", "content": report}],
+                    "retries": 0,
+                    "indicators": message.get("indicators"),
+                    "structured": structured,
+                    "reviews": reviews,
+                },
+            )
+            return
+        print(
+            "\033[38;5;208m高級市場分析師：修正完成，正在將報告提交給用戶助理並完成分析任務。\033[0m"
+        )
+        self.broker.publish(
+            Topics.PRESENT_REPORT,
+            {
                 "task_id": message["task_id"],
                 "type": "final_report",
-                "report": revised_result
-        })
\ No newline at end of file
+                "report": report,
+                "structured": structured,
+            },
+        )
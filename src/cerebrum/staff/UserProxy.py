@@ -1,8 +1,15 @@
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
 from cerebrum.toolkit.AIClient import AIClient
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
 from cerebrum.toolkit.MessageBroker import MessageBroker
-from typing import Dict, Any, Callable
+from cerebrum.toolkit.ReportCache import ReportCache
+from cerebrum.toolkit.TaskScheduler import TaskScheduler
 from cerebrum.toolkit.Topics import Topics
-import uuid
 
 
 class UserProxy(AIClient):
@@ -10,65 +17,100 @@ class UserProxy(AIClient):
     User proxy agent that acts as interface between human users and AI analysts.
     Handles task delegation and feedback collection.
     """
-    
-    def __init__(self, broker: MessageBroker, interactive_mode):
+
+    GREETING = "您的角色**：**高級用戶助理**，負責處理用戶的反饋需求和協調各分析師的工作。現在你正式開始工作，請向你的用戶進行簡短問候。"
+    GREETING_COLOR = "\033[92m"
+
+    def __init__(
+        self, broker: MessageBroker, interactive_mode, service_mode: bool = False
+    ):
         """
         Initialize the UserProxy agent.
-        
+
         Args:
             broker: Message broker for communication
             interactive_mode: Whether to enable interactive user feedback
+            service_mode: Keep accepting tasks after the final reports instead of
+                shutting the system down once no task is left
         """
         super().__init__(broker, "user_proxy")
-        greeting = [
-            {
-                'role':'user',
-                'content':'您的角色**：**高級用戶助理**，負責處理用戶的反饋需求和協調各分析師的工作。現在你正式開始工作，請向你的用戶進行簡短問候。'
-            }
-        ]
-        greeting = self.call_ai(greeting)
-        
-        print(f"\033[92m「問候」:{greeting}\033[0m")  # greeting
 
-        self.interactive_mode = interactive_mode  # Controls user interruption for feedback
-        self.current_tasks: Dict[str, Dict] = {}  # Track active tasks
+        self.interactive_mode = (
+            interactive_mode  # Controls user interruption for feedback
+        )
+        self.service_mode = service_mode
+        # Track active tasks, the system shuts down once all are reported
+        self.current_tasks: Dict[str, Dict] = {}
+        # Shed tasks are completed from the publisher's thread
+        self.tasks_lock = threading.Lock()
+        cacheConfig = self.config["reportCache"]
+        # Final reports by ticker, filter and latest bar
+        self.report_cache = ReportCache.shared() if cacheConfig["enabled"] else None
+        # Runs the report cache lookups, which download data, off the proxy's thread
+        self.lookups = None
+        if self.report_cache is not None and not interactive_mode:
+            self.lookups = ThreadPoolExecutor(
+                max_workers=self.config["utils"]["dataFetch"]["maxWorkers"],
+                thread_name_prefix="UserProxy-cache",
+            )
         self.market_analyzer_history = []  # Chat history with market analyst
         self.market_analyzer_retries = 3  # Max retries for market analysis
         self.news_analyzer_history = []  # Chat history with news analyst
         self.news_analyzer_retries = 3  # Max retries for news analysis
 
         # Register message handlers
-        self.broker.subscribe(Topics.USER_INPUT, self.handle_task)
-        self.broker.subscribe(Topics.PRESENT_REPORT, self.handle_final_report)
+        self._subscribe(Topics.USER_INPUT, self.handle_task)
+        self._subscribe(Topics.USER_INPUT_BATCH, self.handle_watchlist)
+        self._subscribe(Topics.PRESENT_REPORT, self.handle_final_report, shed=False)
+        # Inline, a shed notice of an expired task would itself be shed from the inbox
+        self.broker.subscribe(Topics.TASK_SHED, self.handle_shed_task, inline=True)
 
         # Additional handlers for interactive mode
         if interactive_mode:
-            self.broker.subscribe(Topics.USER_FEEDBACK, self.handle_user_feedback)
-    
+            self._subscribe(
+                Topics.USER_FEEDBACK,
+                self.handle_user_feedback,
+                self.handle_user_feedback_async,
+            )
+
     def handle_task(self, message: Dict[str, Any]):
         """
         Handle incoming tasks and delegate to appropriate analysts.
-        
+
         Args:
-            message: Task message containing ticker and filter data
+            message: Task message containing ticker and filter data, optionally a
+                task_id, a priority (number or class name), a deadline (time.time()) and
+                refresh to analyze again even if a cached report is valid
         """
-        task_id = f'task_{str(uuid.uuid4())}'  # Generate unique task ID
-        ticker = message['data']['ticker']
-        filter = message['data']['filter']
-        
+        task = self._new_task(
+            message["data"]["ticker"],
+            message["data"]["filter"],
+            message.get("task_id"),
+            message.get("priority"),
+            message.get("deadline"),
+        )
+        if self.lookups is not None:
+            self.lookups.submit(self._delegate, task, message.get("refresh", False))
+        else:
+            self._delegate(task)
+
+    def _delegate(self, task: Dict[str, Any], refresh: bool = False):
+        """Answer a task from the report cache, or delegate it to the analysts."""
+        if self._present_cached(task, refresh):
+            return
+
+        if self.stream:
+            # Render the analysts' output as it is generated
+            self.broker.subscribe(
+                Topics.stream(task["task_id"]), self.handle_stream, inline=True
+            )
+
         # Delegate to Market Analyst
         topic_market_analysis = Topics.MARKET_ANALYSIS
-        self.broker.publish(topic_market_analysis, {
-            "task_id": task_id,
-            "data": {
-                'ticker': ticker,
-                'filter': filter
-            },
-            'isInteractiveMode': self.interactive_mode
-        })
+        self.broker.publish(topic_market_analysis, task)
 
         # Placeholder for News Analyst delegation
-        '''
+        """
         topic_news_analysis = Topics.MARKET_ANALYSIS
         self.broker.publish(topic_news_analysis, {
             "task_id": task_id,
@@ -76,54 +118,275 @@ class UserProxy(AIClient):
                 'ticker': ticker,
             }
         })
-        '''
-    
+        """
+
+    def handle_watchlist(self, message: Dict[str, Any]):
+        """
+        Handle a watchlist, analyzed by the Market Analyst in batches of tickers.
+
+        Args:
+            message: Contains the list of tickers and a shared filter, optionally a
+                priority, deadline and refresh flag shared by the tickers
+        """
+        tasks = [
+            self._new_task(
+                ticker,
+                message["data"]["filter"],
+                priority=message.get("priority"),
+                deadline=message.get("deadline"),
+            )
+            for ticker in message["data"]["tickers"]
+        ]
+        if self.lookups is not None:
+            self.lookups.submit(
+                self._delegate_watchlist,
+                tasks,
+                message["data"]["filter"],
+                message.get("refresh", False),
+            )
+        else:
+            self.broker.publish(Topics.MARKET_ANALYSIS_BATCH, {"tasks": tasks})
+
+    def _delegate_watchlist(self, tasks, filter: Dict[str, Any], refresh: bool = False):
+        """
+        Answer a watchlist's tasks from the report cache, delegating the rest as a
+        batch.
+        """
+        # One bulk retrieval for the cache lookups instead of one download per ticker
+        try:
+            histories = FinanceDataUtils().retrieveMany(
+                [task["data"]["ticker"] for task in tasks], filter
+            )
+        except Exception:
+            histories = {}  # The market analyst reports the failures
+        tasks = [
+            task
+            for task in tasks
+            if not self._present_cached(
+                task, refresh, histories.get(task["data"]["ticker"].upper())
+            )
+        ]
+        if tasks:
+            self.broker.publish(Topics.MARKET_ANALYSIS_BATCH, {"tasks": tasks})
+
+    def _new_task(
+        self,
+        ticker: str,
+        filter: Dict[str, Any],
+        task_id: str = None,
+        priority=None,
+        deadline: float = None,
+    ) -> Dict[str, Any]:
+        """
+        Create and track the analysis task message of a ticker.
+
+        The caller's task_id is used as-is, it carries its own schedule. A new
+        task_id is tagged with the priority and deadline, if any, so they reach
+        every downstream topic (see TaskScheduler).
+        """
+        if task_id is None:
+            task_id = f"task_{str(uuid.uuid4())}"  # Generate unique task ID
+            if priority is not None or deadline is not None:
+                task_id = TaskScheduler.task_id(task_id, priority, deadline)
+        self.track_task(task_id, ticker)
+        return {
+            "task_id": task_id,
+            "data": {"ticker": ticker, "filter": filter},
+            "isInteractiveMode": self.interactive_mode,
+        }
+
+    def track_task(self, task_id: str, ticker: str):
+        """
+        Track a task until its final report, also one resumed from the task journal.
+        """
+        with self.tasks_lock:
+            self.current_tasks[task_id] = {"ticker": ticker}
+
+    def _present_cached(
+        self, task: Dict[str, Any], refresh: bool = False, tickerData=None
+    ) -> bool:
+        """
+        Present the cached report of a task whose ticker has no new bar since.
+
+        On a miss a copy of the retrieved history is attached to the task, so the
+        market analyst doesn't download it again, and the report is cached once
+        final. Interactive tasks neither use nor fill the cache: their reports are
+        shaped by the user's feedback, and the user expects the feedback rounds.
+        Runs on the lookups pool, the retrieval may download.
+
+        Args:
+            task: Task message from _new_task
+            refresh: Skip the lookup, the new report replaces the cached one
+            tickerData: The task's history if already retrieved
+
+        Returns:
+            True if the task was answered from the cache
+        """
+        if self.report_cache is None or task["isInteractiveMode"]:
+            return False
+        task_id = task["task_id"]
+        ticker, filter = task["data"]["ticker"], task["data"]["filter"]
+        if tickerData is None:
+            try:
+                tickerData = FinanceDataUtils().retrieveData(
+                    ticker=ticker, filter=filter
+                )
+            except Exception:
+                return False  # The market analyst reports the failure
+        key = ReportCache.key(ticker, filter, tickerData)
+        if key is None:
+            return False
+        # The analyst adds its indicator columns
+        task["data"]["tickerData"] = tickerData.copy()
+
+        cached = None if refresh else self.report_cache.get(key)
+        if cached is None:
+            with self.tasks_lock:
+                self.current_tasks[task_id]["cache_key"] = key
+            return False
+
+        print(
+            f"\033[92m用戶助理:{ticker} 沒有新的行情數據，直接提供先前的分析報告。\033[0m"
+        )
+        self.broker.publish(
+            Topics.PRESENT_REPORT,
+            {
+                "task_id": task_id,
+                "type": "final_report",
+                "report": cached["report"],
+                "structured": cached["structured"],
+                "cached": True,
+            },
+        )
+        return True
+
     def handle_final_report(self, message: Dict[str, Any]):
         """
         Handle the final analysis report presentation.
-        
+
         Args:
             message: Contains the final report data
         """
         task_id = message["task_id"]
-        print(f"\033[92m用戶助理:最終的分析報告結果\033[0m") 
-        print(f"{message['report']}") 
-        #print(message['report'])
-        
+        print("\033[92m用戶助理:最終的分析報告結果\033[0m")
+        print(f"{message['report']}")
+        # print(message['report'])
+        with self.tasks_lock:
+            task = self.current_tasks.get(task_id) or {}
+        if task.get("cache_key") and not message.get("failed"):
+            self.report_cache.put(
+                task["cache_key"],
+                task["ticker"],
+                message["report"],
+                message.get("structured"),
+            )
+        self._complete_task(task_id, message["report"])
+
+    def handle_shed_task(self, message: Dict[str, Any]):
+        """
+        Handle a task dropped for missing its deadline.
+
+        Args:
+            message: Contains the task_id and the role that shed it
+        """
+        print(
+            f"\033[92m用戶助理:任務 {message['task_id']} 已超過截止時間，由 {message['role']} 放棄。"
+            "\033[0m"
+        )
+        self._complete_task(message["task_id"], None)
+
+    def _complete_task(self, task_id: str, report):
+        """
+        Stop tracking a task, and shut the system down once no task is left outside
+        service mode.
+        """
+        if self.stream:
+            self.broker.unsubscribe(Topics.stream(task_id), self.handle_stream)
+        with self.tasks_lock:
+            self.current_tasks.pop(task_id, None)
+            if self.current_tasks or self.service_mode or not self.active:
+                # Other tasks are still being analyzed, or the service keeps running
+                return
+            self.active = False  # Mark task as complete
+
         # Shutdown system after final report
-        self.active = False  # Mark task as complete
-        self.broker.publish(Topics.SYSTEM_SHUTDOWN, {
-            "task_id": task_id,
-            "data": {
-                'report': message['report']
-            }
-        })
-    
+        self.broker.publish(
+            Topics.SYSTEM_SHUTDOWN, {"task_id": task_id, "data": {"report": report}}
+        )
+
+    STREAM_COLORS = {"market_analyst": "\033[38;5;208m", "chief_analyst": "\033[31m"}
+
+    def handle_stream(self, message: Dict[str, Any]):
+        """
+        Render a streamed completion delta as soon as it arrives.
+
+        Args:
+            message: Contains the role, sequence number and text delta of a completion,
+                done once complete and reset if the stream failed and its output so far
+                is void
+        """
+        if message.get("reset"):
+            print(f"\n\033[33m{message['role']}：串流中斷，以上輸出作廢。\033[0m")
+            return
+        if message["seq"] == 0:
+            color = self.STREAM_COLORS.get(message["role"], "")
+            print(f"{color}{message['role']}:\033[0m")
+        print(message["delta"], end="", flush=True)
+        if message["done"]:
+            print()
 
     def handle_user_feedback(self, message: Dict[str, Any]):
         """
         Collect user feedback for analysis reports.
-        
+
         Args:
             message: Contains report content needing feedback
         """
 
-        print(f"分析結果：{message['content']}") 
+        print(f"分析結果：{message['content']}")
 
-        feedback = input(f"\033[92m用戶助理:用戶你好，請審閱{message['role']}的分析結果。如果你有什麼反饋，請告知。如果沒有，請輸入回車或'no'：\033[0m")
-        currentAnalysis = message['content']
-        
-        #return the feedback to market analyzer
-        self.broker.publish(Topics.MARKET_ANALYSIS_FEEDBACK, {
-            "task_id": message['task_id'],
-            "data": {
-                'ticker': message['ticker'],
-                'feedback': feedback,
-                'chatHistory': message['chatHistory'],
-                'retryAttempts': message['retries'],
-                'currentAnalysis': currentAnalysis
-            }
-        })
-        
-        return 'This is the modified report'
- 
\ No newline at end of file
+        feedback = input(self._feedback_question(message))
+        self._submit_user_feedback(message, feedback)
+
+        return "This is the modified report"
+
+    async def handle_user_feedback_async(self, message: Dict[str, Any]):
+        """
+        Collect user feedback without blocking the event loop.
+
+        Args:
+            message: Contains report content needing feedback
+        """
+        print(f"分析結果：{message['content']}")
+
+        feedback = await asyncio.to_thread(input, self._feedback_question(message))
+        self._submit_user_feedback(message, feedback)
+
+    def _feedback_question(self, message: Dict[str, Any]):
+        return (
+            f"\033[92m用戶助理:用戶你好，請審閱{message['role']}的分析結果。"
+            "如果你有什麼反饋，請告知。如果沒有，請輸入回車或'no'：\033[0m"
+        )
+
+    def _submit_user_feedback(self, message: Dict[str, Any], feedback):
+        """Return the user's feedback to the market analyst."""
+        currentAnalysis = message["content"]
+
+        # return the feedback to market analyzer
+        self.broker.publish(
+            Topics.MARKET_ANALYSIS_FEEDBACK,
+            {
+                "task_id": message["task_id"],
+                "data": {
+                    "ticker": message["ticker"],
+                    "feedback": feedback,
+                    "chatHistory": message["chatHistory"],
+                    "retryAttempts": message["retries"],
+                    "currentAnalysis": currentAnalysis,
+                    "indicators": message.get(
+                        "indicators"
+                    ),  # Lets the chief analyst validate against the computed signals
+                    "structured": message.get("structured"),
+                },
+            },
+        )
@@ -1,26 +1,45 @@
-from cerebrum.config.Config import Config
-from openai import OpenAI
+import asyncio
 import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict
+
+from cerebrum.config.Config import Config
+from cerebrum.config.Prompt import Prompt
+from cerebrum.toolkit.ClientRegistry import ClientRegistry
+from cerebrum.toolkit.LLMCache import LLMCache
 from cerebrum.toolkit.MessageBroker import MessageBroker
+from cerebrum.toolkit.RetryPolicy import LatencyTracker, RetryPolicy
+from cerebrum.toolkit.StructuredOutput import StructuredOutput
+from cerebrum.toolkit.TaskScheduler import TaskScheduler
 from cerebrum.toolkit.Topics import Topics
-from typing import Dict, Any, Callable
-import time
 
 
 class AIClient(threading.Thread):
     """
     Base class for AI client threads that handle specific AI tasks.
     Implements common functionality for interacting with AI services.
+    Messages are delivered to the client's inbox and handled one at a time
+    on the client's own thread, most urgent task first.
     """
-    
-    def __init__(self, 
-                 broker: MessageBroker, 
-                 role: str, 
-                 max_retries: int = 3,
-                 model: str = ''):
+
+    GREETING = None  # Prompt asking the model to greet the user, set by each role
+    GREETING_COLOR = "\033[0m"
+
+    # Runs hedged requests
+    _hedge_pool = ThreadPoolExecutor(
+        max_workers=32, thread_name_prefix="AIClient-hedge"
+    )
+
+    def __init__(
+        self, broker: MessageBroker, role: str, max_retries: int = 3, model: str = ""
+    ):
         """
         Initialize the AI client thread.
-        
+
         Args:
             broker: The message broker for pub/sub communication
             role: The specialized role of this AI client
@@ -35,64 +54,588 @@ class AIClient(threading.Thread):
         self.max_retries = max_retries
         self.model = model  # The LLM model this client will use
         self.active = True  # Thread running status flag
+        # (handler, message) pairs waiting for this client's thread
+        self.inbox = TaskScheduler(on_shed=self._shed)
+        self.busy = False  # Whether the client's thread is handling a message
+        self.stopped = threading.Event()  # Set once the run loop has exited
         self._register_handlers()  # Setup default message handlers
-        self.client = self.initClient()  # Initialize AI service client
-    
+        self.client = self.initClient()  # Shared AI service client
+        self.async_client = None  # AsyncOpenAI client, created on first async call
+        # Stream completions of tasks over the broker
+        self.stream = self.config["utils"]["AI"]["stream"]
+        cacheConfig = self.config["utils"]["AI"]["cache"]
+        # Response cache shared by all clients
+        self.cache = LLMCache.shared() if cacheConfig["enabled"] else None
+        # Retries, timeouts and hedging of service calls
+        self.retry_policy = RetryPolicy()
+        # Ask for JSON instead of markdown
+        self.structured = self.config["utils"]["AI"]["structured"]["enabled"]
+
     def initClient(self):
-        """Initialize and configure the AI service client."""
-        aiConfig = self.config['utils']['AI']
-        client = OpenAI(
-            base_url=aiConfig['baseURL'],
-            api_key=aiConfig['apiKey']
-        )
-        return client
-    
+        """Get the AI service client, shared with every other client of the process."""
+        aiConfig = self.config["utils"]["AI"]
+        return ClientRegistry.client(aiConfig)
+
+    def initAsyncClient(self):
+        """Get the asyncio AI service client shared on the running event loop."""
+        aiConfig = self.config["utils"]["AI"]
+        return ClientRegistry.async_client(aiConfig)
+
     def _register_handlers(self):
         """Register default message handlers for this client."""
-        # Default handler for system shutdown
-        self.broker.subscribe(Topics.SYSTEM_SHUTDOWN, self._handle_shutdown)
-    
-    def call_ai(self, prompt):
+        # Default handler for system shutdown, called immediately rather than queued
+        self.broker.subscribe(
+            Topics.SYSTEM_SHUTDOWN, self._handle_shutdown, inline=True
+        )
+
+    def _subscribe(
+        self,
+        topic: str,
+        handler: Callable,
+        async_handler: Callable = None,
+        group: str = None,
+        shed: bool = True,
+    ):
+        """
+        Subscribe the handler matching the broker's execution mode.
+
+        Args:
+            topic: The topic to subscribe to
+            handler: Blocking handler used with the threaded MessageBroker, run from
+                this client's inbox
+            async_handler: Coroutine handler used with the AsyncMessageBroker
+                (falls back to handler, which then runs on the event loop)
+            group: Optional consumer group shared with replicas of this client, each
+                message on the topic then goes to only one of them
+            shed: Drop the topic's messages of tasks past their deadline from the inbox
+                instead of handling them
+        """
+        if self.broker.is_async:
+            self.broker.subscribe(topic, async_handler or handler, group=group)
+        else:
+            self.broker.subscribe(
+                topic,
+                partial(self._post, handler, shed=shed),
+                inline=True,
+                group=group,
+                load=self.pending,
+            )
+
+    def pending(self) -> int:
+        """Number of messages waiting in or being handled from the inbox."""
+        return self.inbox.qsize() + (1 if self.busy else 0)
+
+    def _post(self, handler: Callable, message: Dict[str, Any], shed: bool = True):
+        """Queue a message on the inbox for the client's thread."""
+        self.inbox.put((handler, message), shed=shed)
+
+    def _shed(self, message: Dict[str, Any]):
+        """Report a task dropped from the inbox for missing its deadline."""
+        task_id = message.get("task_id")
+        print(f"\033[90m{self.role}：任務 {task_id} 已超過截止時間，不再處理。\033[0m")
+        self.broker.publish(
+            Topics.TASK_SHED,
+            {"task_id": task_id, "role": self.role, "reason": "deadline"},
+        )
+
+    @contextmanager
+    def _reporting_failure(self, task_id: str, ticker: str = None):
+        """
+        Report a task as failed when the handler body raises.
+
+        The run loop only logs handler errors, so without a final report the
+        task would stay tracked by the user proxy and its submit() Future would
+        never resolve.
+        """
+        try:
+            yield
+        except Exception as e:
+            traceback.print_exc()
+            self._report_failure(task_id, ticker, e)
+
+    def _handle_step(
+        self, message: Dict[str, Any], ticker: str, prepare: Callable, kind: str
+    ):
+        """
+        Run one pipeline step: prepare the prompt, call the model and hand the
+        response on, reporting the task as failed if any of it raises.
+
+        Args:
+            message: The task message
+            ticker: Ticker named in a failure report
+            prepare: Called with the message, returns the prompt and a callable
+                taking the model's response, or None when no model call is needed
+            kind: Structured response kind, a key of StructuredOutput.SCHEMAS
+        """
+        with self._reporting_failure(message["task_id"], ticker):
+            step = prepare(message)
+            if step is not None:
+                prompt, submit = step
+                submit(
+                    self.call_ai(
+                        prompt,
+                        task_id=message["task_id"],
+                        **self._structured_options(kind),
+                    )
+                )
+
+    async def _handle_step_async(
+        self, message: Dict[str, Any], ticker: str, prepare: Callable, kind: str
+    ):
+        """
+        _handle_step on the event loop, prepare runs on a worker thread as it may block.
+        """
+        with self._reporting_failure(message["task_id"], ticker):
+            step = await asyncio.to_thread(prepare, message)
+            if step is not None:
+                prompt, submit = step
+                submit(
+                    await self.call_ai_async(
+                        prompt,
+                        task_id=message["task_id"],
+                        **self._structured_options(kind),
+                    )
+                )
+
+    def _report_failure(self, task_id: str, ticker: str, error: Exception):
+        """Publish the failed final report of a task."""
+        print(f"\033[90m{self.role}：任務 {task_id} 處理失敗（{error}）\033[0m")
+        self.broker.publish(
+            Topics.PRESENT_REPORT,
+            {
+                "task_id": task_id,
+                "type": "final_report",
+                "report": f"{ticker or task_id}：分析失敗（{error}），無法完成分析。",
+                "failed": True,  # Not a report to cache
+                "role": self.role,
+            },
+        )
+
+    def _request(
+        self, prompt, max_tokens: int = None, response_format: Dict[str, Any] = None
+    ):
+        """Build the completion request parameters for a prompt."""
+        aiConfig = self.config["utils"]["AI"]
+        request = {
+            "model": aiConfig["model"][self.role],
+            "messages": prompt,
+            "temperature": 0.7,  # Controls randomness of output
+            "max_tokens": max_tokens or 3000,  # Limit response length
+        }
+        if response_format is not None:
+            request["response_format"] = response_format
+        return request
+
+    def _structured_options(self, kind: str, max_tokens: int = None) -> Dict[str, Any]:
+        """
+        Get the call_ai arguments of a structured response in structured mode.
+
+        Args:
+            kind: A key of StructuredOutput.SCHEMAS
+            max_tokens: Response length limit, defaults to the structured mode's limit
+
+        Returns:
+            response_format and max_tokens, or nothing when structured mode is off
+        """
+        if not self.structured:
+            return {}
+        structuredConfig = self.config["utils"]["AI"]["structured"]
+        return {
+            "response_format": StructuredOutput.response_format(
+                kind, structuredConfig["responseFormat"]
+            ),
+            "max_tokens": max_tokens or structuredConfig["maxTokens"],
+        }
+
+    def _structured_instruction(self, kind: str) -> str:
+        """
+        Prompt text asking for a structured response, empty when structured mode is off.
+        """
+        if not self.structured:
+            return ""
+        structuredConfig = self.config["utils"]["AI"]["structured"]
+        # Without schema support the schema itself has to be in the prompt
+        schema = (
+            StructuredOutput.schema_text(kind)
+            if structuredConfig["responseFormat"] == "json_object"
+            else None
+        )
+        return Prompt().structured_output(kind, schema)
+
+    def greet(self, cached: str = None):
+        """
+        Print this role's greeting to the user.
+
+        Args:
+            cached: Greeting to print instead of asking the model, e.g. in 'off'
+                greeting mode
+        """
+        if self.GREETING is None:
+            return
+        greeting = (
+            cached
+            if cached is not None
+            else self.call_ai([{"role": "user", "content": self.GREETING}])
+        )
+        print(f"{self.GREETING_COLOR}「問候」:{greeting}\033[0m")
+
+    def call_ai(
+        self,
+        prompt,
+        use_cache: bool = True,
+        task_id: str = None,
+        max_tokens: int = None,
+        response_format: Dict[str, Any] = None,
+    ):
         """
         Make a request to the AI service.
-        
+
+        Args:
+            prompt: The input messages/prompt for the AI
+            use_cache: Whether an identical earlier response may be returned instead
+                of calling the service (the fresh response is still cached)
+            task_id: Task the request belongs to; in streaming mode the deltas are
+                published on Topics.stream(task_id) as they arrive
+            max_tokens: Response length limit, defaults to 3000
+            response_format: Optional response_format parameter, e.g. from
+                StructuredOutput
+
+        Returns:
+            The content of the AI's response
+        """
+        request = self._request(prompt, max_tokens, response_format)
+        streaming = self.stream and task_id is not None
+        cacheKey = LLMCache.key(**request) if self.cache is not None else None
+        if cacheKey and use_cache:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                if streaming:
+                    self._publish_delta(task_id, 0, cached, done=True)
+                return cached
+
+        content = self._complete(request, task_id if streaming else None)
+
+        if cacheKey and content:
+            self.cache.put(cacheKey, content)
+        return content
+
+    async def call_ai_async(
+        self,
+        prompt,
+        use_cache: bool = True,
+        task_id: str = None,
+        max_tokens: int = None,
+        response_format: Dict[str, Any] = None,
+    ):
+        """
+        Make a non-blocking request to the AI service from the event loop.
+
         Args:
             prompt: The input messages/prompt for the AI
-            
+            use_cache: Whether an identical earlier response may be returned instead
+                of calling the service (the fresh response is still cached)
+            task_id: Task the request belongs to; in streaming mode the deltas are
+                published on Topics.stream(task_id) as they arrive
+            max_tokens: Response length limit, defaults to 3000
+            response_format: Optional response_format parameter, e.g. from
+                StructuredOutput
+
         Returns:
             The content of the AI's response
         """
-        aiConfig = self.config['utils']['AI']
-        role = self.role
-        model = aiConfig['model'][role]
-        
-        result = self.client.chat.completions.create(
-            model=model,
-            messages=prompt,
-            temperature=0.7,  # Controls randomness of output
-            max_tokens=3000  # Limit response length
+        if self.async_client is None:
+            self.async_client = self.initAsyncClient()
+        request = self._request(prompt, max_tokens, response_format)
+        streaming = self.stream and task_id is not None
+        cacheKey = LLMCache.key(**request) if self.cache is not None else None
+        if cacheKey and use_cache:
+            cached = self.cache.get(cacheKey)
+            if cached is not None:
+                if streaming:
+                    self._publish_delta(task_id, 0, cached, done=True)
+                return cached
+
+        content = await self._complete_async(request, task_id if streaming else None)
+
+        if cacheKey and content:
+            self.cache.put(cacheKey, content)
+        return content
+
+    def _models(self, request: Dict[str, Any]):
+        """The request's model followed by the role's fallback chain from Config."""
+        fallback = self.config["utils"]["AI"]["fallback"].get(self.role, [])
+        return [request["model"]] + [
+            model for model in fallback if model != request["model"]
+        ]
+
+    def _retry_notice(self, model: str, error: Exception, delay: float):
+        print(
+            f"\033[33m{self.role}：AI服務請求失敗（{model}，{type(error).__name__}），"
+            f"{delay:.1f}秒後重試\033[0m"
+        )
+
+    def _complete(self, request: Dict[str, Any], stream_task_id: str = None) -> str:
+        """
+        Run a completion with retries, moving down the role's fallback chain once a
+        model has used up its attempts. Streaming if a task is given.
+        """
+        policy = self.retry_policy
+        models = self._models(request)
+        error = None
+        for index, model in enumerate(models):
+            backup = models[index + 1] if index + 1 < len(models) else None
+            for attempt in range(policy.max_attempts):
+                try:
+                    if policy.hedge and backup and stream_task_id is None:
+                        return self._hedged(request, model, backup)
+                    return self._attempt({**request, "model": model}, stream_task_id)
+                except Exception as e:
+                    if not policy.is_retryable(e):
+                        raise
+                    error = e
+                    if attempt + 1 < policy.max_attempts:
+                        delay = policy.backoff(attempt)
+                        self._retry_notice(model, e, delay)
+                        time.sleep(delay)
+        raise error
+
+    def _attempt(self, request: Dict[str, Any], stream_task_id: str = None) -> str:
+        """
+        Run one completion under the base URL's concurrency limit and per-call timeout.
+        """
+        with ClientRegistry.limiter(self.config["utils"]["AI"]["baseURL"]):
+            return self._call(request, stream_task_id)
+
+    def _call(self, request: Dict[str, Any], stream_task_id: str = None) -> str:
+        """
+        Run one completion with the per-call timeout, the caller holds a limiter slot.
+        """
+        request = {**request, "timeout": self.retry_policy.timeout}
+        start = time.perf_counter()
+        if stream_task_id is not None:
+            content = self._stream_completion(request, stream_task_id)
+        else:
+            result = self.client.chat.completions.create(**request)
+            content = result.choices[0].message.content
+        LatencyTracker.record(request["model"], time.perf_counter() - start)
+        return content
+
+    def _hedged(self, request: Dict[str, Any], primary: str, backup: str) -> str:
+        """
+        Send the request to the primary model and, if it hasn't answered within its
+        recent latency quantile, a duplicate to the backup model. The first answer wins.
+
+        Both requests' limiter slots are held here and handed back once the race is
+        decided, so the losing request, which can't be interrupted and finishes in
+        the background within the per-call timeout, doesn't hold up other calls.
+        """
+        limiter = ClientRegistry.limiter(self.config["utils"]["AI"]["baseURL"])
+        limiter.acquire()
+        slots = 1
+        futures = [self._hedge_pool.submit(self._call, {**request, "model": primary})]
+        try:
+            done, _ = wait(futures, timeout=self.retry_policy.hedge_delay(primary))
+            # Wait for a slot unless the primary answers first
+            while not done and not futures[0].done():
+                if limiter.acquire(timeout=0.05):
+                    slots += 1
+                    futures.append(
+                        self._hedge_pool.submit(
+                            self._call, {**request, "model": backup}
+                        )
+                    )
+                    break
+
+            error = None
+            for future in as_completed(futures):
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            for future in futures:
+                future.cancel()  # A loser still queued on the hedge pool never starts
+            for _ in range(slots):
+                limiter.release()
+
+    async def _complete_async(
+        self, request: Dict[str, Any], stream_task_id: str = None
+    ) -> str:
+        """
+        Run a completion on the event loop with retries and the role's fallback chain.
+        """
+        policy = self.retry_policy
+        models = self._models(request)
+        error = None
+        for index, model in enumerate(models):
+            backup = models[index + 1] if index + 1 < len(models) else None
+            for attempt in range(policy.max_attempts):
+                try:
+                    if policy.hedge and backup and stream_task_id is None:
+                        return await self._hedged_async(request, model, backup)
+                    return await self._attempt_async(
+                        {**request, "model": model}, stream_task_id
+                    )
+                except Exception as e:
+                    if not policy.is_retryable(e):
+                        raise
+                    error = e
+                    if attempt + 1 < policy.max_attempts:
+                        delay = policy.backoff(attempt)
+                        self._retry_notice(model, e, delay)
+                        await asyncio.sleep(delay)
+        raise error
+
+    async def _attempt_async(
+        self, request: Dict[str, Any], stream_task_id: str = None
+    ) -> str:
+        """
+        Run one completion on the event loop under the concurrency limit and per-call
+        timeout.
+        """
+        request = {**request, "timeout": self.retry_policy.timeout}
+        async with ClientRegistry.async_limiter(self.config["utils"]["AI"]["baseURL"]):
+            start = time.perf_counter()
+            if stream_task_id is not None:
+                content = await self._stream_completion_async(request, stream_task_id)
+            else:
+                result = await self.async_client.chat.completions.create(**request)
+                content = result.choices[0].message.content
+        LatencyTracker.record(request["model"], time.perf_counter() - start)
+        return content
+
+    async def _hedged_async(
+        self, request: Dict[str, Any], primary: str, backup: str
+    ) -> str:
+        """Hedged request on the event loop, the losing request is cancelled."""
+        pending = {
+            asyncio.ensure_future(self._attempt_async({**request, "model": primary}))
+        }
+        done, _ = await asyncio.wait(
+            pending, timeout=self.retry_policy.hedge_delay(primary)
+        )
+        if not done:
+            pending.add(
+                asyncio.ensure_future(self._attempt_async({**request, "model": backup}))
+            )
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    def _stream_completion(self, request: Dict[str, Any], task_id: str) -> str:
+        """
+        Consume a streamed completion, publishing each delta, and return the full text.
+
+        A stream failing partway publishes a reset marker before the error goes to
+        the retry loop, so subscribers discard the partial output; the next attempt
+        streams again from seq 0.
+        """
+        parts = []
+        try:
+            for chunk in self.client.chat.completions.create(**request, stream=True):
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    self._publish_delta(task_id, len(parts), delta)
+                    parts.append(delta)
+        except Exception:
+            if parts:
+                self._publish_delta(task_id, len(parts), "", done=True, reset=True)
+            raise
+        self._publish_delta(task_id, len(parts), "", done=True)
+        return "".join(parts)
+
+    async def _stream_completion_async(
+        self, request: Dict[str, Any], task_id: str
+    ) -> str:
+        """Consume a streamed completion on the event loop, publishing each delta."""
+        parts = []
+        try:
+            async for chunk in await self.async_client.chat.completions.create(
+                **request, stream=True
+            ):
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    self._publish_delta(task_id, len(parts), delta)
+                    parts.append(delta)
+        except Exception:
+            if parts:
+                self._publish_delta(task_id, len(parts), "", done=True, reset=True)
+            raise
+        self._publish_delta(task_id, len(parts), "", done=True)
+        return "".join(parts)
+
+    def _publish_delta(
+        self,
+        task_id: str,
+        seq: int,
+        delta: str,
+        done: bool = False,
+        reset: bool = False,
+    ):
+        """
+        Publish one piece of a streamed completion on the task's stream topic.
+
+        Args:
+            reset: The stream failed, the deltas published so far are void
+        """
+        self.broker.publish(
+            Topics.stream(task_id),
+            {
+                "task_id": task_id,
+                "role": self.role,
+                "seq": seq,
+                "delta": delta,
+                "done": done,
+                "reset": reset,
+            },
         )
 
-        return result.choices[0].message.content
-    
     def _handle_shutdown(self, _):
         """Handle system shutdown command."""
-        print(f'\033[92m{self.role} client is shutting down\033[0m')  # Green text
+        print(f"\033[92m{self.role} client is shutting down\033[0m")  # Green text
+        self.stop()
+
+    def stop(self):
+        """Ask the run loop to exit once the current message is handled."""
         self.active = False  # Set flag to terminate thread
-    
+        self.inbox.put((None, None))  # Wake the run loop if it is waiting
+
     def handle_task(self, message: Dict[str, Any]):
         """
         Process a task message (to be implemented by child classes).
-        
+
         Args:
             message: The task message dictionary
-            
+
         Raises:
             NotImplementedError: If child class doesn't implement this
         """
         raise NotImplementedError("Child classes must implement handle_task")
-    
+
     def run(self):
-        """Main thread execution loop."""
-        while self.active:
-            time.sleep(0.1)  # Small delay to prevent CPU overuse
\ No newline at end of file
+        """Main thread execution loop, blocks on the inbox while idle."""
+        try:
+            while self.active:
+                handler, message = self.inbox.get()
+                if handler is None or not self.active:
+                    break
+                self.busy = True
+                try:
+                    handler(message)
+                except Exception:
+                    traceback.print_exc()  # Keep the client alive on handler errors
+                finally:
+                    self.busy = False
+        finally:
+            self.stopped.set()
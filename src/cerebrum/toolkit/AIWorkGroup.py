@@ -1,75 +1,448 @@
-from cerebrum.config.Config import Config
-from openai import OpenAI
 import threading
-from cerebrum.toolkit.MessageBroker import MessageBroker
-from cerebrum.toolkit.Topics import Topics
-from typing import Dict, Any, Callable
 import time
-from cerebrum.staff.UserProxy import UserProxy
-from cerebrum.staff.MarketAnalyst import MarketAnalyst
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict
+
+from cerebrum.config.Config import Config
 from cerebrum.staff.ChiefAnalyst import ChiefAnalyst
+from cerebrum.staff.MarketAnalyst import MarketAnalyst
+from cerebrum.staff.UserProxy import UserProxy
+from cerebrum.toolkit.AsyncMessageBroker import AsyncMessageBroker
+from cerebrum.toolkit.MessageBroker import MessageBroker
+from cerebrum.toolkit.TaskJournal import TaskJournal
+from cerebrum.toolkit.TaskScheduler import TaskScheduler
+from cerebrum.toolkit.Topics import Topics
 
 
 class AIWorkGroup:
     """A group of AI agents working together to handle financial analysis tasks."""
-    
-    def __init__(self, interactive_mode):
+
+    ROLES = ("user_proxy", "chief_analyst", "market_analyst")
+    # Roles that share work as consumer groups
+    SCALABLE_ROLES = (
+        "chief_analyst",
+        "market_analyst",
+    )
+    GREETING_MODES = ("sync", "concurrent", "deferred", "off")
+
+    def __init__(
+        self,
+        interactive_mode,
+        broker: MessageBroker = None,
+        execution_mode: str = "thread",
+        roles: list = None,
+        replicas: Dict[str, int] = None,
+        greeting_mode: str = None,
+        service_mode: bool = False,
+        journal: bool = None,
+    ):
         """
         Initialize the AI work group.
-        
+
         Args:
             interactive_mode: Whether to run in interactive user mode
+            broker: Optional pre-configured message broker (e.g. 'pool' dispatch mode,
+                or a broker with a Transport to agents in other processes)
+            execution_mode: 'thread' runs each agent on its own thread, 'async' runs all
+                handlers as coroutines on one asyncio event loop
+            roles: Roles to run in this process, defaults to all of ROLES
+            replicas: Number of instances per role, e.g. {'market_analyst': 4};
+                only SCALABLE_ROLES can have more than one
+            greeting_mode: How agents greet the user at startup, defaults to
+                Config['utils']['AI']['greeting']['mode']:
+                'sync' greets one agent after another, 'concurrent' greets all at once,
+                'deferred' greets in the background once the first task is accepted,
+                'off' prints the cached greeting without calling the model
+            service_mode: Keep running after the final reports and take tasks through
+                submit() until shutdown() is called, instead of shutting down once the
+                submitted tickers have been reported
+            journal: Record the stage transitions of tasks and resume the unreported
+                ones from their last stage on startup, defaults to
+                Config['journal']['enabled']. Only the process running the user
+                proxy keeps the journal, and never in interactive mode, where a
+                resumed task would hold up the user's query or ask for feedback on
+                an earlier one. In 'async' execution mode call resume() once the
+                broker has been started
         """
-        self.broker = MessageBroker()  # Message broker for inter-agent communication
+        startedAt = time.perf_counter()
+        greetingConfig = Config().config["utils"]["AI"]["greeting"]
+        greeting_mode = greeting_mode or greetingConfig["mode"]
+        if execution_mode not in ("thread", "async"):
+            raise ValueError(f"Unknown execution mode: {execution_mode}")
+        if greeting_mode not in self.GREETING_MODES:
+            raise ValueError(f"Unknown greeting mode: {greeting_mode}")
+        self.execution_mode = execution_mode
+        if broker is None:
+            broker = (
+                AsyncMessageBroker() if execution_mode == "async" else MessageBroker()
+            )
+        self.broker = broker  # Message broker for inter-agent communication
         self.clients = []  # List to store all AI client threads
-        
+
         # Initialize core components
         self.interactive_mode = interactive_mode
-        self._init_clients()
-        self.broker.subscribe(Topics.SYSTEM_SHUTDOWN, self.handle_shutdown)
+        self.service_mode = service_mode
+        self.roles = list(roles or self.ROLES)
+        unknown = set(self.roles) - set(self.ROLES)
+        if unknown:
+            raise ValueError(f"Unknown roles: {sorted(unknown)}")
         self.running = True  # System running status flag
-    
-    def _init_clients(self):
-        """Initialize all AI role clients."""
-        roles = [
-            UserProxy(self.broker, self.interactive_mode),  # User interface agent
-            ChiefAnalyst(self.broker),  # Chief analysis agent
-            MarketAnalyst(self.broker, self.interactive_mode),  # Market analysis agent
+        self.stopped = threading.Event()  # Set once the system has shut down
+        # task_id -> Future of a task given to submit()
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+        self._init_clients(replicas)
+        self.broker.subscribe(Topics.SYSTEM_SHUTDOWN, self.handle_shutdown)
+        self.journal = self._init_journal(journal)
+        self.broker.subscribe(Topics.PRESENT_REPORT, self._resolve, inline=True)
+        self.broker.subscribe(Topics.TASK_SHED, self._reject, inline=True)
+
+        self.greeting_mode = greeting_mode
+        self._cached_greeting = greetingConfig["cached"]
+        # Held once the deferred greetings have started
+        self._deferred_greeting = threading.Lock()
+        self._greet()
+        # Seconds until the group accepts work
+        self.startup_time = time.perf_counter() - startedAt
+        print(
+            f"\033[90m工作組已啟動，耗時 {self.startup_time:.2f} 秒（問候模式：{greeting_mode}）\033[0m"
+        )
+        if execution_mode == "thread":
+            self.resume()
+
+    def _init_clients(self, replicas: Dict[str, int] = None):
+        """
+        Initialize all AI role clients.
+
+        Args:
+            replicas: Number of instances per role, defaults to one each
+        """
+        replicas = replicas or {}
+        for role, count in replicas.items():
+            if count > 1 and role not in self.SCALABLE_ROLES:
+                raise ValueError(f"Role {role} can't be replicated")
+
+        factories = {
+            "user_proxy": lambda: UserProxy(
+                self.broker, self.interactive_mode, self.service_mode
+            ),  # User interface agent
+            "chief_analyst": lambda: ChiefAnalyst(self.broker),  # Chief analysis agent
+            "market_analyst": lambda: MarketAnalyst(
+                self.broker, self.interactive_mode
+            ),  # Market analysis agent
             # Can add BacktestAnalyst and SentimentAnalyst here
+        }
+        roles = [
+            factories[role]()
+            for role in self.ROLES
+            if role in self.roles
+            for _ in range(replicas.get(role, 1))
         ]
-        
-        # Start all client threads
+
+        # Start all client threads (async handlers run on the
+        # broker's event loop instead)
         for client in roles:
-            client.start()
+            if self.execution_mode == "thread":
+                client.start()
             self.clients.append(client)
-    
+
+    def _init_journal(self, enabled: bool = None):
+        """
+        Open the task journal, dropping the records of reported tasks, when this process
+        runs the user proxy.
+        """
+        journalConfig = Config().config["journal"]
+        enabled = journalConfig["enabled"] if enabled is None else enabled
+        if not enabled or self.interactive_mode or "user_proxy" not in self.roles:
+            return None
+        try:
+            journal = TaskJournal(
+                journalConfig["path"],
+                fsync=journalConfig["fsync"],
+                max_age=journalConfig["maxAge"],
+                max_resumes=journalConfig["maxResumes"],
+            )
+        except RuntimeError:
+            print(
+                f"\033[33m任務日誌 {journalConfig['path']} 已被其他工作組使用，本工作組不記錄任務日誌。\033[0m"
+            )
+            return None
+        journal.compact()
+        journal.attach(self.broker)
+        return journal
+
+    def resume(self) -> int:
+        """
+        Publish the last recorded stage of every unreported task in the journal again.
+
+        Returns:
+            Number of tasks resumed
+        """
+        if self.journal is None:
+            return 0
+        pending = self.journal.incomplete()
+        resumed = 0
+        for topic, message in pending:
+            for task in (
+                message["tasks"] if topic == Topics.MARKET_ANALYSIS_BATCH else [message]
+            ):
+                ticker = task.get("ticker") or task["data"]["ticker"]
+                for client in self.clients:
+                    if isinstance(client, UserProxy):
+                        client.track_task(task["task_id"], ticker)
+                resumed += 1
+        if resumed:
+            print(f"\033[90m從任務日誌恢復 {resumed} 個未完成的任務。\033[0m")
+        for topic, message in pending:
+            self.broker.publish(topic, message)
+        return resumed
+
+    def _greet(self):
+        """Greet the user from every agent according to the greeting mode."""
+        if self.greeting_mode == "off":
+            for client in self.clients:
+                client.greet(cached=self._cached_greeting)
+        elif self.greeting_mode == "sync":
+            for client in self.clients:
+                client.greet()
+        elif self.greeting_mode == "concurrent":
+            self._greet_concurrently()
+        else:
+            # Called inline so the greetings start right after the user
+            # proxy has queued the task
+            self.broker.subscribe(Topics.USER_INPUT, self._greet_deferred, inline=True)
+
+    def _greet_concurrently(self):
+        """
+        Greet from all agents at once, so startup costs one round-trip instead of one
+        per agent.
+        """
+        if not self.clients:
+            return
+        with ThreadPoolExecutor(
+            max_workers=len(self.clients), thread_name_prefix="AIWorkGroup-greeting"
+        ) as pool:
+            for future in [pool.submit(client.greet) for client in self.clients]:
+                future.result()
+
+    def _greet_deferred(self, message: Dict[str, Any]):
+        """Greet in the background once, after the first task has been accepted."""
+        if not self._deferred_greeting.acquire(blocking=False):
+            return  # A concurrent task already started them
+        self.broker.unsubscribe(Topics.USER_INPUT, self._greet_deferred)
+        threading.Thread(
+            target=self._greet_concurrently, name="AIWorkGroup-greeting", daemon=True
+        ).start()
+
+    def submit(
+        self,
+        ticker: str,
+        filter: Dict[str, Any],
+        task_id: str = None,
+        priority=None,
+        deadline: float = None,
+        refresh: bool = False,
+    ) -> Future:
+        """
+        Submit an analysis task, many can be in flight at once.
+
+        Args:
+            ticker: Stock ticker to analyze
+            filter: Data filter, e.g. {'option': 1, 'period': '3mo'}
+            task_id: Optional caller-chosen task ID, must be unique among running tasks
+            priority: Optional priority, a number (lower first) or a class name of
+                Config['scheduler']['priorities'] such as 'interactive' or 'batch'
+            deadline: Optional time.time() after which the task is shed rather than
+                handled by the next agent
+            refresh: Analyze again even if the report cache holds a valid report
+
+        Returns:
+            Future resolved with the PRESENT_REPORT message of the task (task_id,
+            report and structured result), failed with RuntimeError if the task
+            failed and with TimeoutError if it was shed, cancelled if the system
+            shuts down first. With a priority or
+            deadline the task_id is tagged with them, see TaskScheduler.task_id()
+        """
+        task_id = task_id or f"task_{str(uuid.uuid4())}"
+        if priority is not None or deadline is not None:
+            task_id = TaskScheduler.task_id(task_id, priority, deadline)
+        future = Future()
+        with self._futures_lock:
+            if task_id in self._futures:
+                raise ValueError(f"Task {task_id} is already running")
+            self._futures[task_id] = future
+        self.broker.publish(
+            Topics.USER_INPUT,
+            {
+                "task_id": task_id,
+                "data": {"ticker": ticker, "filter": filter},
+                "refresh": refresh,
+            },
+        )
+        return future
+
+    def _resolve(self, message: Dict[str, Any]):
+        """
+        Complete the future of a submitted task with its final report, or fail it with a
+        failure report.
+        """
+        with self._futures_lock:
+            future = self._futures.pop(message["task_id"], None)
+        # The caller may have given up on it
+        if future is None or not future.set_running_or_notify_cancel():
+            return
+        if message.get("failed"):
+            future.set_exception(RuntimeError(message["report"]))
+        else:
+            future.set_result(message)
+
+    def _reject(self, message: Dict[str, Any]):
+        """
+        Fail the future of a submitted task that was shed for missing its deadline.
+        """
+        with self._futures_lock:
+            future = self._futures.pop(message["task_id"], None)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_exception(
+                TimeoutError(
+                    f"Task {message['task_id']} missed its deadline at "
+                    f"{message['role']}"
+                )
+            )
+
+    def queue_stats(self) -> Dict[str, Dict[int, Dict[str, float]]]:
+        """
+        Get the inbox waits per role and priority class ('thread' execution mode).
+
+        Returns:
+            Dictionary mapping role to priority to the number of messages waiting,
+            handed out and shed, and their average and maximum wait in seconds,
+            summed over the role's replicas
+        """
+        result = {}
+        for client in self.clients:
+            for priority, stats in client.inbox.stats().items():
+                merged = result.setdefault(client.role, {}).get(priority)
+                if merged is None:
+                    result[client.role][priority] = dict(stats)
+                    continue
+                count = merged["dequeued"] + merged["shed"]
+                added = stats["dequeued"] + stats["shed"]
+                if count + added:
+                    merged["avg_wait"] = (
+                        merged["avg_wait"] * count + stats["avg_wait"] * added
+                    ) / (count + added)
+                for key in ("waiting", "dequeued", "shed"):
+                    merged[key] += stats[key]
+                merged["max_wait"] = max(merged["max_wait"], stats["max_wait"])
+        return result
+
     def shutdown(self):
         """Shut down the entire system gracefully."""
         # Publish shutdown message to all subscribed clients
         self.broker.publish(Topics.SYSTEM_SHUTDOWN, {})
 
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until the system has shut down.
+
+        Args:
+            timeout: Maximum seconds to wait, None waits forever
+
+        Returns:
+            True if the system has shut down
+        """
+        return self.stopped.wait(timeout)
+
     def handle_shutdown(self, message: Dict[str, Any]):
         """
         Handle system shutdown by stopping all client threads.
-        
+
         Args:
             message: Shutdown message (contents ignored)
         """
         for client in self.clients:
-            client.active = False  # Signal thread to stop
+            client.stop()  # Signal thread to stop
+            if self.execution_mode == "async" or client is threading.current_thread():
+                continue
             client.join(timeout=3)  # Wait for thread to finish
-            
+
             if client.is_alive():
                 print(f"Warning: {client.role} thread did not exit properly")
-        
+
         self.running = False  # Update system status
-        
+        with self._futures_lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.cancel()  # Tasks still in flight won't be reported
+        self.broker.close(timeout=3)  # Stop broker workers in 'pool' mode
+        if self.journal is not None:
+            self.journal.close()
+        self.stopped.set()  # Wake anyone blocked in wait()
+
         # Debug: Print all remaining threads
         for thread in threading.enumerate():
             print(f"Thread: {thread.name}, daemon: {thread.daemon}")
 
 
-'''
+"""
+# Example usage (service mode, tasks run concurrently and the system stays up)
+system = AIWorkGroup(
+    interactive_mode=False, service_mode=True, replicas={'market_analyst': 4}
+)
+futures = [
+    system.submit(ticker, {'option': 1, 'period': '3mo'}, priority='batch')
+    for ticker in ['AAPL', 'MSFT', 'NVDA']
+]
+urgent = system.submit(
+    'TSLA',
+    {'option': 1, 'period': '3mo'},
+    priority='interactive',
+    deadline=time.time() + 60,
+)
+print(urgent.result()['report'])
+for future in futures:
+    print(future.result()['report'])
+system.shutdown()
+"""
+
+
+"""
+# Example usage (MarketAnalyst in a separate process, same for another host over tcp://)
+from cerebrum.toolkit.Transport import SocketHub, SocketTransport
+
+# Process 1: hub, user proxy and chief analyst
+hub = SocketHub('unix:///tmp/cerebrum.sock').start()
+system = AIWorkGroup(interactive_mode=False,
+                     broker=MessageBroker(transport=SocketTransport('unix:///tmp/cerebrum.sock')),
+                     roles=['user_proxy', 'chief_analyst'])
+
+# Process 2: market analyst worker
+worker = AIWorkGroup(interactive_mode=False,
+                     broker=MessageBroker(transport=SocketTransport('unix:///tmp/cerebrum.sock')),
+                     roles=['market_analyst'])
+worker.wait()
+"""
+
+
+"""
+# Example usage (async mode)
+async def main():
+    system = AIWorkGroup(interactive_mode=False, execution_mode='async')
+    system.broker.start()
+    system.resume()  # Unreported tasks of the previous run
+    for ticker in ['AAPL', 'MSFT', 'NVDA']:
+        system.broker.publish(Topics.USER_INPUT, {
+            "data": {'ticker': ticker, 'filter': {'option': 1, 'period': '3mo'}}
+        })
+    await system.broker.join()
+
+asyncio.run(main())
+"""
+
+
+"""
 # Example usage
 user_input = input('Please input ticker:')
 
@@ -87,8 +460,7 @@ system.broker.publish(Topics.USER_INPUT, {
     }
 })
 
-# Main loop
-while system.running:
-    time.sleep(0.1)
+# Block until the final report triggers shutdown
+system.wait()
 
-'''
\ No newline at end of file
+"""
@@ -0,0 +1,98 @@
+import asyncio
+import inspect
+import traceback
+from typing import Any, Dict
+
+from cerebrum.config.Config import Config
+from cerebrum.toolkit.MessageBroker import MessageBroker
+
+
+class AsyncMessageBroker(MessageBroker):
+    """
+    Message broker that dispatches to subscribers as tasks on a single asyncio event
+    loop.
+    Coroutine callbacks are awaited, plain callbacks run directly on the loop.
+    """
+
+    is_async = True
+
+    def __init__(self, max_concurrency: int = None, transport=None):
+        """
+        Initialize the AsyncMessageBroker.
+
+        Args:
+            max_concurrency: Maximum number of handlers running at once (defaults to
+                Config)
+            transport: Optional Transport to brokers in other processes or hosts
+        """
+        self.max_concurrency = (
+            max_concurrency or Config().config["broker"]["maxConcurrency"]
+        )
+        self.loop = None  # Event loop the handlers run on, bound by start()
+        self._semaphore = None
+        # Keep references so running tasks are not garbage collected
+        self._tasks = set()
+        super().__init__(transport=transport)
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        Bind the broker to an event loop.
+
+        Args:
+            loop: The loop to dispatch on, defaults to the currently running loop
+        """
+        self.loop = loop or asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _dispatch(self, topic: str, callback, message: Dict[str, Any]):
+        """Schedule one delivery on the event loop, from any thread."""
+        if self.loop is None:
+            try:
+                self.start()
+            except RuntimeError:
+                raise RuntimeError(
+                    "AsyncMessageBroker.start() must be called with a running event "
+                    "loop"
+                )
+
+        if self._in_loop_thread():
+            self._schedule(callback, message)
+        else:
+            self.loop.call_soon_threadsafe(self._schedule, callback, message)
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _schedule(self, callback, message: Dict[str, Any]):
+        task = self.loop.create_task(self._run(callback, message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, callback, message: Dict[str, Any]):
+        """Run one handler under the concurrency limit."""
+        async with self._semaphore:
+            try:
+                result = callback(message)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                traceback.print_exc()  # Don't let one handler take down the loop
+
+    async def join(self):
+        """
+        Wait until all in-flight handlers, including ones they publish, have finished.
+        """
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def in_flight(self) -> int:
+        """Get the number of handlers currently scheduled on the loop."""
+        return len(self._tasks)
+
+    def close(self, timeout: float = None):
+        """Disconnect the transport, handlers live on the caller's event loop."""
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+from typing import Any, Dict
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from cerebrum.config.Config import Config
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of AI service clients shared by all AIClient instances.
+
+    One client (and so one keep-alive connection pool) is kept per base URL and API
+    key, so every role and replica reuses warm connections instead of paying its
+    own TCP/TLS handshakes. Requests to a base URL are also capped by a shared
+    concurrency limit from Config['utils']['AI']['http']['concurrency'].
+    """
+
+    _lock = threading.Lock()
+    _clients: Dict[tuple, OpenAI] = {}
+    # Also keyed by event loop, pools are loop-bound
+    _async_clients: Dict[tuple, AsyncOpenAI] = {}
+    _limiters: Dict[str, threading.BoundedSemaphore] = {}
+    _async_limiters: Dict[tuple, asyncio.Semaphore] = {}
+
+    @staticmethod
+    def _http_config() -> Dict[str, Any]:
+        return Config().config["utils"]["AI"]["http"]
+
+    @classmethod
+    def _limits(cls) -> httpx.Limits:
+        httpConfig = cls._http_config()
+        return httpx.Limits(
+            max_connections=httpConfig["maxConnections"],
+            max_keepalive_connections=httpConfig["maxKeepaliveConnections"],
+            keepalive_expiry=httpConfig["keepaliveExpiry"],
+        )
+
+    @classmethod
+    def client(cls, aiConfig: Dict[str, Any]) -> OpenAI:
+        """
+        Get the shared client for an AI service.
+
+        Args:
+            aiConfig: The Config['utils']['AI'] section (baseURL and apiKey)
+
+        Returns:
+            The OpenAI client shared by all callers with the same base URL and key
+        """
+        key = (aiConfig["baseURL"], aiConfig["apiKey"])
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = OpenAI(
+                    base_url=aiConfig["baseURL"],
+                    api_key=aiConfig["apiKey"],
+                    timeout=cls._http_config()["timeout"],
+                    max_retries=0,  # AIClient retries with its own RetryPolicy
+                    http_client=DefaultHttpxClient(limits=cls._limits()),
+                )
+            return cls._clients[key]
+
+    @classmethod
+    def async_client(cls, aiConfig: Dict[str, Any]) -> AsyncOpenAI:
+        """
+        Get the shared asyncio client for an AI service on the running event loop.
+
+        Args:
+            aiConfig: The Config['utils']['AI'] section (baseURL and apiKey)
+
+        Returns:
+            The AsyncOpenAI client shared by all callers on this loop
+        """
+        key = (aiConfig["baseURL"], aiConfig["apiKey"], asyncio.get_running_loop())
+        with cls._lock:
+            if key not in cls._async_clients:
+                cls._async_clients[key] = AsyncOpenAI(
+                    base_url=aiConfig["baseURL"],
+                    api_key=aiConfig["apiKey"],
+                    timeout=cls._http_config()["timeout"],
+                    max_retries=0,  # AIClient retries with its own RetryPolicy
+                    http_client=DefaultAsyncHttpxClient(limits=cls._limits()),
+                )
+            return cls._async_clients[key]
+
+    @classmethod
+    def _concurrency(cls, baseURL: str) -> int:
+        concurrency = cls._http_config()["concurrency"]
+        return concurrency.get(baseURL, concurrency["default"])
+
+    @classmethod
+    def limiter(cls, baseURL: str) -> threading.BoundedSemaphore:
+        """
+        Get the semaphore limiting concurrent requests to a base URL.
+
+        Args:
+            baseURL: The AI service base URL
+
+        Returns:
+            Semaphore shared by all threads calling that base URL
+        """
+        with cls._lock:
+            if baseURL not in cls._limiters:
+                cls._limiters[baseURL] = threading.BoundedSemaphore(
+                    cls._concurrency(baseURL)
+                )
+            return cls._limiters[baseURL]
+
+    @classmethod
+    def async_limiter(cls, baseURL: str) -> asyncio.Semaphore:
+        """
+        Get the semaphore limiting concurrent requests to a base URL on the running
+        loop.
+
+        Args:
+            baseURL: The AI service base URL
+
+        Returns:
+            Semaphore shared by all coroutines on this loop calling that base URL
+        """
+        key = (baseURL, asyncio.get_running_loop())
+        with cls._lock:
+            if key not in cls._async_limiters:
+                cls._async_limiters[key] = asyncio.Semaphore(cls._concurrency(baseURL))
+            return cls._async_limiters[key]
+
+    @classmethod
+    def reset(cls):
+        """Close the shared clients and forget all clients and limiters."""
+        with cls._lock:
+            clients = list(cls._clients.values())
+            cls._clients.clear()
+            cls._async_clients.clear()
+            cls._limiters.clear()
+            cls._async_limiters.clear()
+        for client in clients:
+            client.close()
@@ -0,0 +1,210 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from cerebrum.config.Config import Config
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate
+    tiktoken = None
+
+
+class ContextManager:
+    """
+    Keeps a role's chat history within its token budget.
+
+    Feedback loops resend the whole chat history every round, so input tokens grow
+    with each revision. When a history is over budget, the system prompt and the
+    first user message (the analysis request carrying the indicators) are pinned,
+    the most recent turns are kept, and the turns in between are either dropped
+    ('truncate') or replaced by one summary message ('summarize'). If that is
+    still not enough, the oldest unpinned messages are shortened.
+    """
+
+    STRATEGIES = ("truncate", "summarize")
+    MESSAGE_OVERHEAD = 4  # Tokens the chat format adds per message
+    TRUNCATED = "…（已截斷）"
+    # CJK characters and punctuation
+    _CJK = re.compile(
+        r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+    )
+    _encoding = None
+    _encoding_lock = threading.Lock()
+
+    def __init__(
+        self,
+        role: str,
+        budget: int = None,
+        strategy: str = None,
+        keep_recent: int = None,
+        summarize: Optional[Callable[[List[Dict[str, Any]]], str]] = None,
+        max_tasks: int = 1000,
+    ):
+        """
+        Initialize the ContextManager.
+
+        Args:
+            role: The role whose budget applies, see
+                Config['utils']['AI']['context']['budget']
+            budget: Token budget of a history, defaults to the role's budget in Config
+            strategy: 'truncate' or 'summarize', defaults to Config
+            keep_recent: Number of latest messages always kept, defaults to Config
+            summarize: Called with the turns to compact, returns their summary;
+                required by the 'summarize' strategy, which otherwise truncates
+            max_tasks: Number of tasks whose savings are remembered
+        """
+        contextConfig = Config().config["utils"]["AI"]["context"]
+        self.role = role
+        self.budget = budget or contextConfig["budget"].get(
+            role, contextConfig["budget"]["default"]
+        )
+        self.strategy = strategy or contextConfig["strategy"]
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {self.strategy}")
+        self.keep_recent = (
+            keep_recent if keep_recent is not None else contextConfig["keepRecent"]
+        )
+        self.summarize = summarize
+        self.max_tasks = max_tasks
+        self.lock = threading.Lock()
+        self._saved = OrderedDict()  # task_id -> tokens saved, oldest task first
+
+    @classmethod
+    def count_tokens(cls, text: str) -> int:
+        """
+        Count the tokens of a text.
+
+        Uses tiktoken's cl100k_base encoding when installed, otherwise estimates one
+        token per CJK character and one per four other characters.
+        """
+        if not text:
+            return 0
+        if tiktoken is not None:
+            with cls._encoding_lock:
+                if cls._encoding is None:
+                    cls._encoding = tiktoken.get_encoding("cl100k_base")
+            return len(cls._encoding.encode(text, disallowed_special=()))
+        cjk = len(cls._CJK.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    @classmethod
+    def message_tokens(cls, message: Dict[str, Any]) -> int:
+        """Count the tokens of one chat message, including the format overhead."""
+        return (
+            cls.count_tokens(str(message.get("content") or "")) + cls.MESSAGE_OVERHEAD
+        )
+
+    @classmethod
+    def total_tokens(cls, messages: List[Dict[str, Any]]) -> int:
+        """Count the tokens of a whole chat history."""
+        return sum(cls.message_tokens(message) for message in messages)
+
+    def compact(
+        self, messages: List[Dict[str, Any]], task_id: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fit a chat history into the budget.
+
+        Args:
+            messages: The chat history, left unchanged
+            task_id: Task the history belongs to, for the savings report
+
+        Returns:
+            The history itself when within budget, otherwise a compacted copy
+        """
+        before = self.total_tokens(messages)
+        if before <= self.budget:
+            return messages
+
+        pinned = self._pinned(messages)
+        recentStart = max(len(messages) - self.keep_recent, 0)
+        middle = [i for i in range(recentStart) if i not in pinned]
+
+        summary = None
+        if middle and self.strategy == "summarize" and self.summarize is not None:
+            summary = {
+                "role": "assistant",
+                "content": self.summarize([messages[i] for i in middle]),
+            }
+
+        compacted = []
+        for i, message in enumerate(messages):
+            if i in pinned or i >= recentStart:
+                compacted.append(dict(message))
+            elif summary is not None and i == middle[0]:
+                # The summary takes the place of the turns it covers
+                compacted.append(summary)
+        compacted = self._shorten(compacted, self._pinned(compacted))
+
+        self._record(task_id, before - self.total_tokens(compacted))
+        return compacted
+
+    def _pinned(self, messages: List[Dict[str, Any]]) -> set:
+        """Indexes of the system prompts and the first user message."""
+        pinned = {
+            i for i, message in enumerate(messages) if message.get("role") == "system"
+        }
+        firstUser = next(
+            (i for i, message in enumerate(messages) if message.get("role") == "user"),
+            None,
+        )
+        if firstUser is not None:
+            pinned.add(firstUser)
+        return pinned
+
+    def _shorten(
+        self, messages: List[Dict[str, Any]], pinned: set
+    ) -> List[Dict[str, Any]]:
+        """
+        Cut the oldest unpinned messages, except the latest one, until within budget.
+        """
+        excess = self.total_tokens(messages) - self.budget
+        for i, message in enumerate(messages[:-1]):
+            if excess <= 0:
+                break
+            if i in pinned:
+                continue
+            content = str(message.get("content") or "")
+            tokens = self.count_tokens(content)
+            keep = max(tokens - excess - self.count_tokens(self.TRUNCATED), 0)
+            # Cut by the share of characters matching the share of tokens to keep
+            message["content"] = (
+                content[: len(content) * keep // tokens] + self.TRUNCATED
+                if keep
+                else self.TRUNCATED
+            )
+            excess -= tokens - self.count_tokens(message["content"])
+        return messages
+
+    def _record(self, task_id: str, saved: int):
+        with self.lock:
+            self._saved[task_id] = self._saved.get(task_id, 0) + saved
+            self._saved.move_to_end(task_id)
+            while len(self._saved) > self.max_tasks:
+                self._saved.popitem(last=False)
+
+    def saved(self, task_id: str) -> int:
+        """Get the tokens saved so far on a task."""
+        with self.lock:
+            return self._saved.get(task_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the savings report.
+
+        Returns:
+            Dictionary with the role, budget, strategy, tokens saved per task and in
+            total
+        """
+        with self.lock:
+            tasks = dict(self._saved)
+        return {
+            "role": self.role,
+            "budget": self.budget,
+            "strategy": self.strategy,
+            "tasks": tasks,
+            "saved": sum(tasks.values()),
+        }
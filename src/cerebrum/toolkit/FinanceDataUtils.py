@@ -1,190 +1,448 @@
-from cerebrum.config.Config import Config
-import yfinance as yf
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+import numpy as np
 import pandas as pd
 import talib
-import numpy as np
+import yfinance as yf
+
+from cerebrum.config.Config import Config
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine
+from cerebrum.toolkit.IndicatorRegistry import IndicatorRegistry
+from cerebrum.toolkit.OHLCVStore import OHLCVStore
 
 
 class FinanceDataUtils:
-    """A utility class for retrieving financial data and calculating technical indicators."""
-    
+    """
+    A utility class for retrieving financial data and calculating technical indicators.
+
+    Downloads are shared by all instances: concurrent requests for the same ticker
+    and filter wait for the one download in flight instead of starting their own.
+    """
+
+    _inflight: Dict[tuple, Future] = {}  # (ticker, filter) -> download in flight
+    _inflight_lock = threading.Lock()
+    _fetch_stats = {"requests": 0, "fetches": 0, "coalesced": 0}
+    _pool = None  # Bounded pool of retrieveMany
+
     def __init__(self):
         """Initialize FinanceDataUtils with configuration and default tool."""
         config = Config()
         self.config = config.config
         self.tool = self.toolKit(1)  # Get the highest priority tool by default
-    
+        # Local daily bars
+        self.store = (
+            OHLCVStore.shared()
+            if self.config["utils"]["dataCache"]["enabled"]
+            else None
+        )
+
     def toolKit(self, priority):
         """
         Get the finance tool with specified priority from config.
-        
+
         Args:
             priority: The priority level of the tool to retrieve
-            
+
         Returns:
             The finance tool configuration dictionary
         """
-        return next(tool for tool in self.config['utils']['FinanceTools'] 
-                   if tool['priority'] == priority)
-    
+        return next(
+            tool
+            for tool in self.config["utils"]["FinanceTools"]
+            if tool["priority"] == priority
+        )
+
     def retrieveData(self, ticker, filter):
         """
         Retrieve stock data based on ticker and filter parameters.
-        
+
+        A request for a ticker and filter already being downloaded waits for that
+        download. Every caller, the one that downloaded included, gets its own
+        copy of the result.
+
         Args:
             ticker: The stock ticker symbol
             filter: Dictionary containing retrieval parameters (period or date range)
-            
+
         Returns:
             Pandas DataFrame containing the stock data
         """
-        if self.tool['name'] == 'YahooFinance':
+        key = self._flight_key(ticker, filter)
+        future, leader = self._claim(key)
+        if not leader:
+            return self._copy(future.result())
+        try:
+            data = self._retrieve(ticker, filter)
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, data)
+        return self._copy(data)  # Waiters share the settled frame
+
+    def retrieveMany(self, tickers: Iterable[str], filter) -> Dict[str, pd.DataFrame]:
+        """
+        Retrieve the stock data of many tickers with the same filter.
+
+        With the local store each ticker is served from it on a bounded thread pool,
+        so only missing bars are downloaded; without it the tickers are downloaded
+        in one grouped call. Either way tickers already being downloaded are not
+        downloaded again.
+
+        Args:
+            tickers: The stock ticker symbols
+            filter: Dictionary containing retrieval parameters (period or date range)
+
+        Returns:
+            Dictionary mapping each upper-cased ticker to its DataFrame, tickers
+            that could not be retrieved are left out
+        """
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        if (
+            self.tool["name"] == "YahooFinance"
+            and self.store is None
+            and len(tickers) > 1
+        ):
+            futures = self._download_grouped(tickers, filter)
+        else:
+            pool = self._executor()
+            futures = {
+                ticker: pool.submit(self.retrieveData, ticker, filter)
+                for ticker in tickers
+            }
+
+        histories = {}
+        for ticker, future in futures.items():
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"\033[90m{ticker} 資料取得失敗（{e}）\033[0m")
+                continue
+            if data is not None and not data.empty:
+                histories[ticker] = data
+        return histories
+
+    def _download_grouped(self, tickers: List[str], filter) -> Dict[str, Future]:
+        """
+        Download the tickers not in flight in one call, returns a future per ticker.
+        """
+        futures, led = {}, {}
+        for ticker in tickers:
+            key = self._flight_key(ticker, filter)
+            future, leader = self._claim(key)
+            futures[ticker] = future
+            if leader:
+                led[ticker] = (key, future)
+        if not led:
+            return futures
+
+        try:
+            window = (
+                {"period": filter["period"]}
+                if filter["option"] == 1
+                else {"start": filter["start_date"], "end": filter["end_date"]}
+            )
+            grouped = yf.download(
+                list(led),
+                group_by="ticker",
+                auto_adjust=True,
+                actions=True,
+                threads=self.config["utils"]["dataFetch"]["maxWorkers"],
+                progress=False,
+                **window,
+            )
+        except Exception as e:
+            for key, future in led.values():
+                self._settle(key, future, error=e)
+            return futures
+
+        for ticker, (key, future) in led.items():
+            if not isinstance(grouped.columns, pd.MultiIndex):
+                data = grouped.dropna(how="all")  # Only column level of a single ticker
+            elif ticker in grouped.columns.get_level_values(0):
+                data = grouped[ticker].dropna(how="all")
+            else:
+                data = pd.DataFrame()  # Unknown ticker, as Ticker.history returns it
+            self._settle(key, future, data)
+        # The settled frames are shared with the waiters, every caller gets its own copy
+        return {ticker: self._copied(future) for ticker, future in futures.items()}
+
+    @staticmethod
+    def _flight_key(ticker, filter) -> tuple:
+        return ticker.upper(), json.dumps(filter, sort_keys=True, default=str)
+
+    @classmethod
+    def _claim(cls, key: tuple):
+        """
+        Join the download in flight for a key, or start one.
+
+        Returns:
+            Tuple of the download's future and whether the caller must download
+            and settle it
+        """
+        with cls._inflight_lock:
+            cls._fetch_stats["requests"] += 1
+            future = cls._inflight.get(key)
+            if future is not None:
+                cls._fetch_stats["coalesced"] += 1
+                return future, False
+            future = cls._inflight[key] = Future()
+            cls._fetch_stats["fetches"] += 1
+            return future, True
+
+    @classmethod
+    def _settle(cls, key: tuple, future: Future, data=None, error: Exception = None):
+        """Finish a download, later requests for the key start a new one."""
+        with cls._inflight_lock:
+            cls._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(data)
+
+    @staticmethod
+    def _copy(data):
+        return data.copy() if data is not None else None
+
+    @classmethod
+    def _copied(cls, future: Future) -> Future:
+        copied = Future()
+        try:
+            copied.set_result(cls._copy(future.result()))
+        except Exception as e:
+            copied.set_exception(e)
+        return copied
+
+    @classmethod
+    def _executor(cls) -> ThreadPoolExecutor:
+        with cls._inflight_lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(
+                    max_workers=Config().config["utils"]["dataFetch"]["maxWorkers"],
+                    thread_name_prefix="data-fetch",
+                )
+            return cls._pool
+
+    @classmethod
+    def fetch_stats(cls) -> Dict[str, float]:
+        """
+        Get the download counters shared by all instances.
+
+        Returns:
+            Dictionary with the data requests, the downloads they started
+            ('fetches'), the requests that waited for a download in flight
+            ('coalesced') and their share of the requests ('coalescing_ratio')
+        """
+        with cls._inflight_lock:
+            stats = dict(cls._fetch_stats)
+        stats["coalescing_ratio"] = (
+            stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0
+        )
+        return stats
+
+    def _retrieve(self, ticker, filter):
+        """Retrieve stock data without coalescing, see retrieveData."""
+        if self.tool["name"] == "YahooFinance" and self.store is not None:
+            # Local bars first, only the missing ones are downloaded
+            return self.store.retrieve(ticker, filter, self._history)
+
+        if self.tool["name"] == "YahooFinance":
             stock_data = yf.Ticker(ticker)
-            if filter['option'] == 1:  # Search by period
-                '''
+            if filter["option"] == 1:  # Search by period
+                """
                 Supported period options: 1d,5d,1mo,1y
-                '''
-                period = filter['period']
+                """
+                period = filter["period"]
                 stock_data = stock_data.history(period=period)
             else:  # Search by start and end date
-                start_date = filter['start_date']
-                end_date = filter['end_date']
+                start_date = filter["start_date"]
+                end_date = filter["end_date"]
                 stock_data = stock_data.history(start=start_date, end=end_date)
-            
+
             return stock_data
 
-        elif self.tool['name'] == 'FinHub':
+        elif self.tool["name"] == "FinHub":
             pass  # To supplement other tools
-    
+
+    @staticmethod
+    def _history(ticker, **window):
+        """
+        Download daily bars of a ticker, window is period=... or start=... and end=...
+        """
+        return yf.Ticker(ticker).history(**window)
+
     def getTechnicalIndicators(self, data):
         """
         Calculate various technical indicators for the given stock data.
-        
+
         Args:
             data: Pandas DataFrame containing stock data
-            
+
         Returns:
             Dictionary containing all calculated technical indicators
         """
         # Calculate Moving Averages
-        MA20 = round(talib.SMA(data['Close'], timeperiod=20).iloc[-1], 2)
-        MA50 = round(talib.SMA(data['Close'], timeperiod=50).iloc[-1], 2)
+        MA20 = round(talib.SMA(data["Close"], timeperiod=20).iloc[-1], 2)
+        MA50 = round(talib.SMA(data["Close"], timeperiod=50).iloc[-1], 2)
 
         # Calculate Exponential Moving Averages
-        EMA20 = round(talib.EMA(data['Close'], timeperiod=20).iloc[-1], 2)
-        EMA50 = round(talib.EMA(data['Close'], timeperiod=50).iloc[-1], 2)
+        EMA20 = round(talib.EMA(data["Close"], timeperiod=20).iloc[-1], 2)
+        EMA50 = round(talib.EMA(data["Close"], timeperiod=50).iloc[-1], 2)
 
         # Get recent volume data
-        recent20Volume = data['Volume'].tail(20).tolist()
-        recent50Volume = data['Volume'].tail(50).tolist()
+        recent20Volume = data["Volume"].tail(20).tolist()
+        recent50Volume = data["Volume"].tail(50).tolist()
 
         # Calculate MACD indicators
-        data['MACD'], data['MACD_signal'], data['MACD_hist'] = talib.MACD(data['Close'])
-        data['MACD_prev'] = data['MACD'].shift(1)
-        data['MACD_signal_prev'] = data['MACD_signal'].shift(1)
+        data["MACD"], data["MACD_signal"], data["MACD_hist"] = talib.MACD(data["Close"])
+        data["MACD_prev"] = data["MACD"].shift(1)
+        data["MACD_signal_prev"] = data["MACD_signal"].shift(1)
 
-        data['MACD_signal_flag'] = np.where(
-            (data['MACD_prev'] < data['MACD_signal_prev']) & (data['MACD'] > data['MACD_signal']),
-            '黃金交叉',
+        data["MACD_signal_flag"] = np.where(
+            (data["MACD_prev"] < data["MACD_signal_prev"])
+            & (data["MACD"] > data["MACD_signal"]),
+            "黃金交叉",
             np.where(
-                (data['MACD_prev'] > data['MACD_signal_prev']) & (data['MACD'] < data['MACD_signal']),
-                '死亡交叉',
-                '無交叉'
-            )
+                (data["MACD_prev"] > data["MACD_signal_prev"])
+                & (data["MACD"] < data["MACD_signal"]),
+                "死亡交叉",
+                "無交叉",
+            ),
         )
-        recent20MACD = data['MACD'].tail(20).tolist()
-        latest_cross = data[data['MACD_signal_flag'].isin(['黃金交叉', '死亡交叉'])].iloc[-1]['MACD_signal_flag']
-        
+        recent20MACD = data["MACD"].tail(20).tolist()
+        latest_cross = data[
+            data["MACD_signal_flag"].isin(["黃金交叉", "死亡交叉"])
+        ].iloc[-1]["MACD_signal_flag"]
+
         # Calculate RSI
-        data['RSI'] = talib.RSI(data['Close'], timeperiod=14)
-        conditions = [data['RSI'] > 70, data['RSI'] < 30]
-        choices = ['超買', '超賣']
-        data['RSI_signal'] = np.select(conditions, choices, default='中性')
-        latest_RSI_signal = data['RSI_signal'].iloc[-1]
-        latest_RSI = data['RSI'].iloc[-1]
+        data["RSI"] = talib.RSI(data["Close"], timeperiod=14)
+        conditions = [data["RSI"] > 70, data["RSI"] < 30]
+        choices = ["超買", "超賣"]
+        data["RSI_signal"] = np.select(conditions, choices, default="中性")
+        latest_RSI = data["RSI"].iloc[-1]
 
         # Calculate Bollinger Bands
-        data['UpperBB'], data['MiddleBB'], data['LowerBB'] = talib.BBANDS(data['Close'], timeperiod=20)
-        data['BB_signal'] = np.where(
-            data['Close'] > data['UpperBB'], 
-            '突破上軌', 
-            np.where(
-                data['Close'] < data['LowerBB'], 
-                '跌破下軌', 
-                '中間'
-            )
+        data["UpperBB"], data["MiddleBB"], data["LowerBB"] = talib.BBANDS(
+            data["Close"], timeperiod=20
+        )
+        data["BB_signal"] = np.where(
+            data["Close"] > data["UpperBB"],
+            "突破上軌",
+            np.where(data["Close"] < data["LowerBB"], "跌破下軌", "中間"),
         )
-        latest_BB_signal = data[data['BB_signal'].isin(['突破上軌', '跌破下軌','中間'])].iloc[-1]['BB_signal']
+        latest_BB_signal = data[
+            data["BB_signal"].isin(["突破上軌", "跌破下軌", "中間"])
+        ].iloc[-1]["BB_signal"]
 
         # Calculate Stochastic Oscillator
-        data['slowk'], data['slowd'] = talib.STOCH(data['High'], data['Low'], data['Close'])
-        data['KD_signal'] = np.where(data['slowk'] > data['slowd'], 'K上穿D', 'K下穿D')
-        latest_KD_signal = data[data['KD_signal'].isin(['K上穿D', 'K下穿D'])].iloc[-1]['KD_signal']
+        data["slowk"], data["slowd"] = talib.STOCH(
+            data["High"], data["Low"], data["Close"]
+        )
+        data["KD_signal"] = np.where(data["slowk"] > data["slowd"], "K上穿D", "K下穿D")
+        latest_KD_signal = data[data["KD_signal"].isin(["K上穿D", "K下穿D"])].iloc[-1][
+            "KD_signal"
+        ]
 
         # Calculate ADX
-        data['ADX'] = talib.ADX(data['High'], data['Low'], data['Close'], timeperiod=14)
-        data['ADX_signal'] = np.where(data['ADX'] > 25, '趨勢明確', '趨勢弱')
-        latest_ADX_signal = data[data['ADX_signal'].isin(['趨勢明確', '趨勢弱'])].iloc[-1]['ADX_signal']
-        latest_ADX = data['ADX'].iloc[-1]
+        data["ADX"] = talib.ADX(data["High"], data["Low"], data["Close"], timeperiod=14)
+        data["ADX_signal"] = np.where(data["ADX"] > 25, "趨勢明確", "趨勢弱")
+        latest_ADX = data["ADX"].iloc[-1]
 
         # Calculate Volume indicators
-        data['Volume_MA20'] = data['Volume'].rolling(window=20).mean()
-        data['Volume_signal'] = np.where(
-            data['Volume'] > data['Volume_MA20'], 
-            '放量', 
-            '縮量'
+        data["Volume_MA20"] = data["Volume"].rolling(window=20).mean()
+        data["Volume_signal"] = np.where(
+            data["Volume"] > data["Volume_MA20"], "放量", "縮量"
         )
-        latest_Volume_signal = data[data['Volume_signal'].isin(['放量', '縮量'])].iloc[-1]['Volume_signal']
+        latest_Volume_signal = data[data["Volume_signal"].isin(["放量", "縮量"])].iloc[
+            -1
+        ]["Volume_signal"]
 
-        #price trend
-        price_trend_20 = data['Close'].tail(20).tolist()
-        price_trend_50 = data['Close'].tail(50).tolist()
+        # price trend
+        price_trend_20 = data["Close"].tail(20).tolist()
+        price_trend_50 = data["Close"].tail(50).tolist()
 
         # Compile all indicators into a dictionary
         indicators = {
-            'volume': {
-                'Volume20': recent20Volume,
-                'Volume50': recent50Volume,
+            "volume": {
+                "Volume20": recent20Volume,
+                "Volume50": recent50Volume,
             },
-            'price':{
-                'Price20_Trend':price_trend_20,
-                'Price50_Trend':price_trend_50,
+            "price": {
+                "Price20_Trend": price_trend_20,
+                "Price50_Trend": price_trend_50,
             },
-            'MA': {
-                'MA20': MA20,
-                'MA50': MA50,
-                'direction': '若MA20上穿MA50且成交量增加，視為多頭訊號；反之為空頭'
+            "MA": {
+                "MA20": MA20,
+                "MA50": MA50,
+                "direction": IndicatorEngine.DIRECTIONS["MA"],
             },
-            'EMA': {
-                'EMA20': EMA20,
-                'EMA50': EMA50,
-                'direction': 'EMA20上穿EMA50且成交量同步增加，視為短期買入訊號' 
+            "EMA": {
+                "EMA20": EMA20,
+                "EMA50": EMA50,
+                "direction": IndicatorEngine.DIRECTIONS["EMA"],
             },
-            'MACD': {
-                'recent20MACD': recent20MACD,
-                'latest_MACD_signal': latest_cross,
-                'direction': '若黃金交叉且成交量上升，則為強多信號；反之為短空信號'
+            "MACD": {
+                "recent20MACD": recent20MACD,
+                "latest_MACD_signal": latest_cross,
+                "direction": IndicatorEngine.DIRECTIONS["MACD"],
             },
-            'RSI': {
-                'latest_RSI': latest_RSI,
-                'direction': 'RSI > 70 為超買（需小心回檔）；RSI < 30 為超賣（可能反彈），搭配成交量放大更可信'
+            "RSI": {
+                "latest_RSI": latest_RSI,
+                "direction": IndicatorEngine.DIRECTIONS["RSI"],
             },
-            'BB': {
-                'latest_BB_signal': latest_BB_signal,
-                'direction': '價格突破布林上軌且成交量增加，可能延續漲勢；跌破下軌加上放量，可能持續下跌'
+            "BB": {
+                "latest_BB_signal": latest_BB_signal,
+                "direction": IndicatorEngine.DIRECTIONS["BB"],
             },
-            'SO': {
-               'latest_KD_signal': latest_KD_signal,
-                'direction': 'K上穿D為買入訊號，尤其在20以下位置；K下穿D在80以上為賣出訊號，需觀察成交量是否同步' 
+            "SO": {
+                "latest_KD_signal": latest_KD_signal,
+                "direction": IndicatorEngine.DIRECTIONS["SO"],
             },
-            'ADX': {
-                'latest_ADX': latest_ADX,
-                'direction': 'ADX > 25 表示有趨勢，可結合MACD方向進行交易'
+            "ADX": {
+                "latest_ADX": latest_ADX,
+                "direction": IndicatorEngine.DIRECTIONS["ADX"],
             },
-            'VOMA': {
-                'latest_Volume_signal': latest_Volume_signal,
-                'direction': '量增有助於確認價格趨勢是否有效'
-            }
+            "VOMA": {
+                "latest_Volume_signal": latest_Volume_signal,
+                "direction": IndicatorEngine.DIRECTIONS["VOMA"],
+            },
+        }
+
+        return indicators
+
+    def getTechnicalIndicatorsMany(self, histories):
+        """
+        Calculate the technical indicators of many histories in one vectorized pass.
+
+        Args:
+            histories: Dictionary mapping a key (e.g. ticker) to its Pandas DataFrame
+
+        Returns:
+            Dictionary mapping each key to its indicators, as from
+            getTechnicalIndicators
+        """
+        return IndicatorEngine().run(histories)
+
+    def getIndicators(self, histories, specs):
+        """
+        Calculate only the requested indicators of many histories, e.g. for a screen.
+
+        Args:
+            histories: Dictionary mapping a key (e.g. ticker) to its Pandas DataFrame
+            specs: Indicator specs such as ['rsi', {'name': 'sma', 'period': 200}],
+                see IndicatorRegistry
+
+        Returns:
+            Dictionary mapping each key to the latest value of every output per
+            indicator label, e.g. {'AAPL': {'RSI14': {'value': 61.2, 'code': 0}, ...}}
+        """
+        if not histories:
+            return {}
+        engine, registry = IndicatorEngine(), IndicatorRegistry()
+        panel = engine.panel(histories)
+        results = registry.evaluate(panel, specs)
+        return {
+            key: registry.latest(results, row) for row, key in enumerate(panel["keys"])
         }
-        
-        return indicators
\ No newline at end of file
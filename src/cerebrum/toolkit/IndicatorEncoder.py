@@ -0,0 +1,152 @@
+import math
+from typing import Any, Dict, List
+
+from cerebrum.config.Config import Config
+
+
+class IndicatorEncoder:
+    """
+    Serializes the indicator series of FinanceDataUtils.getTechnicalIndicators for
+    prompts.
+
+    'raw' interpolates the Python lists as they are. The other encodings send each
+    series once (the 20-day lists are the tail of the 50-day ones), use a fixed
+    precision and volumes in thousands:
+        'compact' comma-separated values
+        'table'   one CSV table of close, volume and MACD per day
+        'delta'   first value followed by day-over-day changes
+    NaN values, such as the MACD warm-up on histories shorter than its window, are
+    left out of the series and blank as single values.
+    """
+
+    ENCODINGS = ("raw", "compact", "table", "delta")
+
+    def __init__(self, encoding: str = None, precision: int = None):
+        """
+        Initialize the IndicatorEncoder.
+
+        Args:
+            encoding: One of ENCODINGS, defaults to
+                Config['utils']['AI']['prompt']['indicatorEncoding']
+            precision: Decimals kept for prices and indicators, defaults to Config
+        """
+        promptConfig = Config().config["utils"]["AI"]["prompt"]
+        self.encoding = encoding or promptConfig["indicatorEncoding"]
+        if self.encoding not in self.ENCODINGS:
+            raise ValueError(f"Unknown indicator encoding: {self.encoding}")
+        self.precision = (
+            precision if precision is not None else promptConfig["precision"]
+        )
+
+    def encode(self, indicators: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Encode the series and unrounded values of an indicators dict.
+
+        Args:
+            indicators: Output of FinanceDataUtils.getTechnicalIndicators
+
+        Returns:
+            Prompt fragments: 'table', 'volume', 'price', 'macd', 'RSI' and 'ADX'
+        """
+        if self.encoding == "raw":
+            return {
+                "table": "",
+                "volume": (
+                    f"   - **過去20天的成交量**： `{indicators['volume']['Volume20']}`\n"
+                    f"   - **過去50天的成交量**： `{indicators['volume']['Volume50']}`"
+                ),
+                "price": (
+                    f"   - **過去20天價格走勢**： `{indicators['price']['Price20_Trend']}`\n"
+                    f"   - **過去50天價格走勢**： `{indicators['price']['Price50_Trend']}`"
+                ),
+                "macd": f"`{indicators['MACD']['recent20MACD']}`",
+                "RSI": f"{indicators['RSI']['latest_RSI']}",
+                "ADX": f"{indicators['ADX']['latest_ADX']}",
+            }
+
+        # In thousands of shares
+        volume = [value / 1000 for value in indicators["volume"]["Volume50"]]
+        price = indicators["price"]["Price50_Trend"]
+        # NaN until the MACD has enough bars
+        macd = self._finite(indicators["MACD"]["recent20MACD"])
+        days = len(price)
+        encoded = {
+            "table": "",
+            "RSI": self._number(indicators["RSI"]["latest_RSI"], self.precision),
+            "ADX": self._number(indicators["ADX"]["latest_ADX"], self.precision),
+        }
+
+        if self.encoding == "table":
+            encoded["table"] = self._table(price, volume, macd)
+            encoded["volume"] = (
+                f"   - **過去{days}天的成交量（千股）**： 見行情數據表「成交量」欄，最後20行即過去20天"
+            )
+            encoded["price"] = (
+                f"   - **過去{days}天價格走勢**： 見行情數據表「收盤」欄，最後20行即過去20天"
+            )
+            encoded["macd"] = "見行情數據表「MACD」欄"
+        elif self.encoding == "delta":
+            encoded["volume"] = (
+                f"   - **過去{len(volume)}天的成交量（千股，首值後為逐日變化，最後20個即過去20天）**： "
+                f"`{self._deltas(volume, 0)}`"
+            )
+            encoded["price"] = (
+                f"   - **過去{days}天價格走勢（首值後為逐日變化，最後20個即過去20天）**： "
+                f"`{self._deltas(price, self.precision)}`"
+            )
+            encoded["macd"] = (
+                f"`{self._deltas(macd, self.precision)}`（首值後為逐日變化）"
+            )
+        else:
+            encoded["volume"] = (
+                f"   - **過去{len(volume)}天的成交量（千股，最後20個即過去20天）**： "
+                f"`{self._values(volume, 0)}`"
+            )
+            encoded["price"] = (
+                f"   - **過去{days}天價格走勢（最後20個即過去20天）**： "
+                f"`{self._values(price, self.precision)}`"
+            )
+            encoded["macd"] = f"`{self._values(macd, self.precision)}`"
+        return encoded
+
+    @staticmethod
+    def _finite(values: List[float]) -> List[float]:
+        return [value for value in values if not math.isnan(value)]
+
+    @staticmethod
+    def _number(value: float, precision: int) -> str:
+        if math.isnan(value):
+            return ""
+        text = f"{value:.{precision}f}"
+        # Avoid '-0.00'
+        return "0" if text.lstrip("-") == f"{0:.{precision}f}" else text
+
+    def _values(self, values: List[float], precision: int) -> str:
+        return ",".join(self._number(value, precision) for value in values)
+
+    def _deltas(self, values: List[float], precision: int) -> str:
+        values = self._finite(values)
+        if not values:
+            return ""
+        # Differences of the rounded values, so adding them up
+        # reproduces every rounded value
+        scale = 10**precision
+        rounded = [round(value * scale) for value in values]
+        parts = [self._number(rounded[0] / scale, precision)]
+        for previous, current in zip(rounded, rounded[1:]):
+            change = self._number((current - previous) / scale, precision)
+            parts.append(
+                change if change.startswith("-") or change == "0" else "+" + change
+            )
+        return ",".join(parts)
+
+    def _table(self, price: List[float], volume: List[float], macd: List[float]) -> str:
+        """CSV rows from oldest to newest, MACD only on the days it covers."""
+        macd = [None] * (len(price) - len(macd)) + list(macd)
+        rows = ["收盤,成交量,MACD"]
+        for close, shares, value in zip(price, volume, macd):
+            macdText = self._number(value, self.precision) if value is not None else ""
+            closeText = self._number(close, self.precision)
+            rows.append(f"{closeText},{self._number(shares, 0)},{macdText}")
+        table = "\n".join(rows)
+        return f"**行情數據表**（最近{len(price)}個交易日，由舊到新；成交量單位千股）：\n```\n{table}\n```\n"
@@ -0,0 +1,568 @@
+from typing import Any, Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+
+class IndicatorEngine:
+    """
+    Technical indicators of many tickers in one vectorized pass.
+
+    Histories are stacked into a panel of 2-D arrays, tickers × bars, right-aligned
+    on each ticker's latest bar and padded with NaN before its first one. Every
+    indicator follows the TA-Lib definition used by
+    FinanceDataUtils.getTechnicalIndicators and is computed for all tickers at
+    once; the recursive ones (EMA, RSI, ADX) step through the bars with the tickers
+    as one vector. Signals are int8 codes, mapped to the labels of SIGNALS only
+    when the indicators dict of a ticker is built for a prompt. compute() calculates
+    the indicators of SPECS through IndicatorRegistry, which also calculates other
+    selections of indicators and parameters.
+    """
+
+    FIELDS = ("High", "Low", "Close", "Volume")
+    SIGNALS = {  # Signal code -> label
+        "MACD": {1: "黃金交叉", -1: "死亡交叉", 0: "無交叉"},
+        "RSI": {1: "超買", -1: "超賣", 0: "中性"},
+        "BB": {1: "突破上軌", -1: "跌破下軌", 0: "中間"},
+        "KD": {1: "K上穿D", -1: "K下穿D"},
+        "ADX": {1: "趨勢明確", 0: "趨勢弱"},
+        "Volume": {1: "放量", -1: "縮量"},
+    }
+    DIRECTIONS = {  # General guidance sent with each indicator
+        "MA": "若MA20上穿MA50且成交量增加，視為多頭訊號；反之為空頭",
+        "EMA": "EMA20上穿EMA50且成交量同步增加，視為短期買入訊號",
+        "MACD": "若黃金交叉且成交量上升，則為強多信號；反之為短空信號",
+        "RSI": "RSI > 70 為超買（需小心回檔）；RSI < 30 為超賣（可能反彈），搭配成交量放大更可信",
+        "BB": "價格突破布林上軌且成交量增加，可能延續漲勢；跌破下軌加上放量，可能持續下跌",
+        "SO": "K上穿D為買入訊號，尤其在20以下位置；K下穿D在80以上為賣出訊號，需觀察成交量是否同步",
+        "ADX": "ADX > 25 表示有趨勢，可結合MACD方向進行交易",
+        "VOMA": "量增有助於確認價格趨勢是否有效",
+    }
+
+    SPECS = (  # Indicators of getTechnicalIndicators, see IndicatorRegistry
+        {"name": "sma", "period": 20, "as": "MA20"},
+        {"name": "sma", "period": 50, "as": "MA50"},
+        {"name": "ema", "period": 20, "as": "EMA20"},
+        {"name": "ema", "period": 50, "as": "EMA50"},
+        {"name": "macd", "fast": 12, "slow": 26, "signal": 9, "as": "MACD"},
+        {"name": "rsi", "period": 14, "overbought": 70, "oversold": 30, "as": "RSI"},
+        {"name": "bbands", "period": 20, "deviations": 2.0, "as": "BB"},
+        {"name": "stoch", "fastk": 5, "slowk": 3, "slowd": 3, "as": "KD"},
+        {"name": "adx", "period": 14, "threshold": 25, "as": "ADX"},
+        {"name": "volume_ma", "period": 20, "as": "Volume"},
+    )
+    COLUMNS = {  # Name in compute()'s result -> (label, output) of SPECS
+        "MA20": ("MA20", "value"),
+        "MA50": ("MA50", "value"),
+        "EMA20": ("EMA20", "value"),
+        "EMA50": ("EMA50", "value"),
+        "MACD": ("MACD", "line"),
+        "MACD_signal": ("MACD", "signal"),
+        "MACD_hist": ("MACD", "hist"),
+        "MACD_code": ("MACD", "code"),
+        "MACD_latest_cross": ("MACD", "latest_cross"),
+        "RSI": ("RSI", "value"),
+        "RSI_code": ("RSI", "code"),
+        "UpperBB": ("BB", "upper"),
+        "MiddleBB": ("BB", "middle"),
+        "LowerBB": ("BB", "lower"),
+        "BB_code": ("BB", "code"),
+        "slowk": ("KD", "k"),
+        "slowd": ("KD", "d"),
+        "KD_code": ("KD", "code"),
+        "ADX": ("ADX", "value"),
+        "ADX_code": ("ADX", "code"),
+        "Volume_MA20": ("Volume", "value"),
+        "Volume_code": ("Volume", "code"),
+    }
+
+    def panel(self, histories: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+        """
+        Stack histories into a panel.
+
+        Args:
+            histories: Dictionary mapping a key (e.g. ticker) to its history, as
+                returned by FinanceDataUtils.retrieveData
+
+        Returns:
+            Dictionary with the 'keys' in row order, the index of each row's
+            'first' bar and a tickers × bars array per field of FIELDS
+        """
+        keys = list(histories)
+        bars = max((len(data) for data in histories.values()), default=0)
+        panel = {
+            "keys": keys,
+            "first": np.array(
+                [bars - len(histories[key]) for key in keys], dtype=np.int64
+            ),
+        }
+        for field in self.FIELDS:
+            values = np.full((len(keys), bars), np.nan)
+            for row, key in enumerate(keys):
+                data = histories[key]
+                if len(data):
+                    values[row, bars - len(data) :] = data[field].to_numpy(dtype=float)
+            panel[field] = values
+        return panel
+
+    def compute(self, panel: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """
+        Calculate the indicators and signal codes of getTechnicalIndicators for a panel.
+
+        Returns:
+            Dictionary of tickers × bars arrays: indicator values (NaN where a
+            ticker's history is too short) and int8 signal codes ('*_code'), plus
+            'MACD_latest_cross', the code of each ticker's most recent MACD cross
+        """
+        from cerebrum.toolkit.IndicatorRegistry import (
+            IndicatorRegistry,  # Built on this class's indicators
+        )
+
+        results = IndicatorRegistry().evaluate(panel, self.SPECS)
+        return {
+            name: results[label][output]
+            for name, (label, output) in self.COLUMNS.items()
+        }
+
+    def indicators(
+        self, panel: Dict[str, Any], result: Dict[str, np.ndarray], row: int
+    ) -> Dict[str, Any]:
+        """
+        Build the indicators dict of one row, as returned by
+        FinanceDataUtils.getTechnicalIndicators.
+
+        Args:
+            panel: Output of panel()
+            result: Output of compute() for the panel
+            row: Row of the ticker in the panel
+
+        Returns:
+            Dictionary containing the ticker's indicators, signals as labels
+        """
+        start = panel["first"][row]
+        latest = {
+            name: values[row, -1] for name, values in result.items() if values.ndim == 2
+        }
+        latest["MACD_latest_cross"] = result["MACD_latest_cross"][row]
+        return self.compile(
+            panel["Volume"][row, start:][-50:],
+            panel["Close"][row, start:][-50:],
+            result["MACD"][row, start:][-20:],
+            latest,
+        )
+
+    @classmethod
+    def compile(
+        cls, volume50, close50, macd20, latest: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Build an indicators dict.
+
+        Args:
+            volume50: Volumes of the last 50 bars
+            close50: Closes of the last 50 bars
+            macd20: MACD line of the last 20 bars
+            latest: Latest value of each indicator and signal code, named as in
+                compute()
+
+        Returns:
+            Dictionary containing all indicators, signals as labels
+        """
+        volume = [
+            int(value) if value.is_integer() else value
+            for value in np.asarray(volume50, dtype=float).tolist()
+        ]
+        close = np.asarray(close50, dtype=float).tolist()
+
+        def label(signal: str, name: str) -> str:
+            return cls.SIGNALS[signal][int(latest[name])]
+
+        return {
+            "volume": {
+                "Volume20": volume[-20:],
+                "Volume50": volume,
+            },
+            "price": {
+                "Price20_Trend": close[-20:],
+                "Price50_Trend": close,
+            },
+            "MA": {
+                "MA20": round(float(latest["MA20"]), 2),
+                "MA50": round(float(latest["MA50"]), 2),
+                "direction": cls.DIRECTIONS["MA"],
+            },
+            "EMA": {
+                "EMA20": round(float(latest["EMA20"]), 2),
+                "EMA50": round(float(latest["EMA50"]), 2),
+                "direction": cls.DIRECTIONS["EMA"],
+            },
+            "MACD": {
+                "recent20MACD": np.asarray(macd20, dtype=float).tolist(),
+                "latest_MACD_signal": label("MACD", "MACD_latest_cross"),
+                "direction": cls.DIRECTIONS["MACD"],
+            },
+            "RSI": {
+                "latest_RSI": float(latest["RSI"]),
+                "direction": cls.DIRECTIONS["RSI"],
+            },
+            "BB": {
+                "latest_BB_signal": label("BB", "BB_code"),
+                "direction": cls.DIRECTIONS["BB"],
+            },
+            "SO": {
+                "latest_KD_signal": label("KD", "KD_code"),
+                "direction": cls.DIRECTIONS["SO"],
+            },
+            "ADX": {
+                "latest_ADX": float(latest["ADX"]),
+                "direction": cls.DIRECTIONS["ADX"],
+            },
+            "VOMA": {
+                "latest_Volume_signal": label("Volume", "Volume_code"),
+                "direction": cls.DIRECTIONS["VOMA"],
+            },
+        }
+
+    def run(self, histories: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, Any]]:
+        """
+        Calculate the indicators dicts of many histories in one pass.
+
+        Args:
+            histories: Dictionary mapping a key (e.g. ticker) to its history
+
+        Returns:
+            Dictionary mapping each key to its indicators dict
+        """
+        if not histories:
+            return {}
+        panel = self.panel(histories)
+        result = self.compute(panel)
+        return {
+            key: self.indicators(panel, result, row)
+            for row, key in enumerate(panel["keys"])
+        }
+
+    # Indicators, x is a tickers × bars array and first the
+    # index of each row's first bar
+
+    @classmethod
+    def sma(cls, x: np.ndarray, first: np.ndarray, period: int) -> np.ndarray:
+        """Simple moving average, valid from first + period - 1."""
+        return np.where(
+            cls._valid(x, first, period - 1),
+            cls._rolling_sum(x, period) / period,
+            np.nan,
+        )
+
+    @classmethod
+    def ema(
+        cls,
+        x: np.ndarray,
+        first: np.ndarray,
+        period: int,
+        seed: int = None,
+        mean: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Exponential moving average, seeded with the SMA of the period bars up to
+        first + seed (period - 1 by default, later for MACD's fast EMA).
+
+        mean is that SMA if already calculated.
+        """
+        seed = first + (period - 1 if seed is None else seed)
+        if mean is None:
+            mean = cls.sma(x, seed - (period - 1), period)
+        k = 2.0 / (period + 1)
+        out = np.full(x.shape, np.nan)
+        value = np.full(x.shape[0], np.nan)
+        for t in range(int(seed.min(initial=x.shape[1])), x.shape[1]):
+            value = np.where(t == seed, mean[:, t], (x[:, t] - value) * k + value)
+            out[:, t] = value
+        return out
+
+    @classmethod
+    def macd(
+        cls,
+        close: np.ndarray,
+        first: np.ndarray,
+        fast: int = 12,
+        slow: int = 26,
+        signal: int = 9,
+    ):
+        """MACD line, signal and histogram, valid from first + slow + signal - 2."""
+        line = cls.ema(close, first, fast, seed=slow - 1) - cls.ema(close, first, slow)
+        signalLine = cls.ema(line, first + slow - 1, signal)
+        line = np.where(cls._valid(close, first, slow + signal - 2), line, np.nan)
+        return line, signalLine, line - signalLine
+
+    @classmethod
+    def rsi(cls, close: np.ndarray, first: np.ndarray, period: int = 14) -> np.ndarray:
+        """Wilder's RSI, valid from first + period."""
+        change = np.diff(close, axis=1, prepend=np.nan)
+        gain, loss = np.where(change > 0, change, 0.0), np.where(
+            change < 0, -change, 0.0
+        )
+        seed = first + period
+        gainMean, lossMean = cls.sma(gain, first + 1, period), cls.sma(
+            loss, first + 1, period
+        )
+        out = np.full(close.shape, np.nan)
+        avgGain = avgLoss = np.full(close.shape[0], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for t in range(int(seed.min(initial=close.shape[1])), close.shape[1]):
+                avgGain = np.where(
+                    t == seed,
+                    gainMean[:, t],
+                    (avgGain * (period - 1) + gain[:, t]) / period,
+                )
+                avgLoss = np.where(
+                    t == seed,
+                    lossMean[:, t],
+                    (avgLoss * (period - 1) + loss[:, t]) / period,
+                )
+                total = avgGain + avgLoss
+                out[:, t] = np.where(cls._zero(total), 0.0, 100 * (avgGain / total))
+        return np.where(cls._valid(close, first, period), out, np.nan)
+
+    @classmethod
+    def bbands(
+        cls,
+        close: np.ndarray,
+        first: np.ndarray,
+        period: int = 20,
+        deviations: float = 2.0,
+        middle: np.ndarray = None,
+    ):
+        """
+        Bollinger upper, middle and lower bands on the population standard deviation.
+        """
+        if middle is None:
+            middle = cls.sma(close, first, period)
+        deviation = cls.stddev(middle, cls.sma(close * close, first, period))
+        return middle + deviations * deviation, middle, middle - deviations * deviation
+
+    @staticmethod
+    def stddev(mean: np.ndarray, meanSquare: np.ndarray) -> np.ndarray:
+        """
+        Population standard deviation from the rolling means of values and their
+        squares.
+        """
+        variance = meanSquare - mean * mean
+        deviation = np.where(variance < 1e-8, 0.0, np.sqrt(np.maximum(variance, 0.0)))
+        return np.where(np.isnan(variance), np.nan, deviation)
+
+    @classmethod
+    def stoch(
+        cls,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        first: np.ndarray,
+        fastk: int = 5,
+        slowk: int = 3,
+        slowd: int = 3,
+    ):
+        """
+        Slow stochastic %K and %D with SMA smoothing, valid from first + fastk + slowk +
+        slowd - 3.
+        """
+        highest, lowest = cls._rolling(high, fastk, np.max), cls._rolling(
+            low, fastk, np.min
+        )
+        fast = cls.fast_k(highest, lowest, close, first, fastk)
+        k = cls.sma(fast, first + fastk - 1, slowk)
+        d = cls.sma(k, first + fastk + slowk - 2, slowd)
+        return (
+            np.where(cls._valid(close, first, fastk + slowk + slowd - 3), k, np.nan),
+            d,
+        )
+
+    @classmethod
+    def fast_k(
+        cls,
+        highest: np.ndarray,
+        lowest: np.ndarray,
+        close: np.ndarray,
+        first: np.ndarray,
+        fastk: int = 5,
+    ) -> np.ndarray:
+        """
+        Fast stochastic %K from the rolling highest high and lowest low, valid from
+        first + fastk - 1.
+        """
+        diff = (highest - lowest) / 100.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fast = np.where(diff != 0, (close - lowest) / diff, 0.0)
+        return np.where(cls._valid(close, first, fastk - 1), fast, np.nan)
+
+    @classmethod
+    def adx(
+        cls,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        first: np.ndarray,
+        period: int = 14,
+    ) -> np.ndarray:
+        """Wilder's ADX, valid from first + 2 * period - 1."""
+        return cls.adx_from(*cls.directional_movement(high, low, close), first, period)
+
+    @classmethod
+    def adx_from(
+        cls,
+        plusDM: np.ndarray,
+        minusDM: np.ndarray,
+        trueRange: np.ndarray,
+        first: np.ndarray,
+        period: int = 14,
+    ) -> np.ndarray:
+        """Wilder's ADX from the output of directional_movement()."""
+        count = trueRange.shape[0]
+        plus, minus, rangeSum, sumDX = (np.zeros(count) for _ in range(4))
+        value = np.full(count, np.nan)
+        out = np.full(trueRange.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for t in range(
+                int(first.min(initial=trueRange.shape[1])) + 1, trueRange.shape[1]
+            ):
+                phase = t - first  # Bars since each row's first
+                initial, smoothed = (phase >= 1) & (phase < period), phase >= period
+                # The first period - 1 moves are summed, later ones smoothed in
+                plus = np.where(
+                    initial,
+                    plus + plusDM[:, t],
+                    np.where(smoothed, plus - plus / period + plusDM[:, t], plus),
+                )
+                minus = np.where(
+                    initial,
+                    minus + minusDM[:, t],
+                    np.where(smoothed, minus - minus / period + minusDM[:, t], minus),
+                )
+                rangeSum = np.where(
+                    initial,
+                    rangeSum + trueRange[:, t],
+                    np.where(
+                        smoothed,
+                        rangeSum - rangeSum / period + trueRange[:, t],
+                        rangeSum,
+                    ),
+                )
+                plusDI, minusDI = 100 * (plus / rangeSum), 100 * (minus / rangeSum)
+                total = minusDI + plusDI
+                dx = 100 * (np.abs(minusDI - plusDI) / total)
+                moved = smoothed & ~cls._zero(rangeSum) & ~cls._zero(total)
+                sumDX = np.where(moved & (phase <= 2 * period - 1), sumDX + dx, sumDX)
+                value = np.where(
+                    phase == 2 * period - 1,
+                    sumDX / period,
+                    np.where(
+                        moved & (phase > 2 * period - 1),
+                        (value * (period - 1) + dx) / period,
+                        value,
+                    ),
+                )
+                out[:, t] = np.where(phase >= 2 * period - 1, value, np.nan)
+        return out
+
+    @classmethod
+    def atr(
+        cls, trueRange: np.ndarray, first: np.ndarray, period: int = 14
+    ) -> np.ndarray:
+        """
+        Wilder's average true range from the true range of directional_movement(), valid
+        from first + period.
+        """
+        seed = first + period
+        mean = cls.sma(trueRange, first + 1, period)  # The first bar has no true range
+        out = np.full(trueRange.shape, np.nan)
+        value = np.full(trueRange.shape[0], np.nan)
+        for t in range(int(seed.min(initial=trueRange.shape[1])), trueRange.shape[1]):
+            value = np.where(
+                t == seed, mean[:, t], (value * (period - 1) + trueRange[:, t]) / period
+            )
+            out[:, t] = value
+        return out
+
+    @classmethod
+    def directional_movement(cls, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+        """
+        +DM, -DM and true range of each bar against the previous one, NaN on a row's
+        first bar.
+        """
+        up = high - cls._shift(high)
+        down = cls._shift(low) - low
+        plusDM = np.where((up > 0) & (up > down), up, 0.0)
+        minusDM = np.where((down > 0) & (up < down), down, 0.0)
+        previous = cls._shift(close)
+        trueRange = np.maximum(
+            high - low, np.maximum(np.abs(high - previous), np.abs(low - previous))
+        )
+        return plusDM, minusDM, trueRange
+
+    # Helpers
+
+    @staticmethod
+    def _valid(x: np.ndarray, first: np.ndarray, lookback) -> np.ndarray:
+        """Mask of the bars at least lookback bars after each row's first."""
+        return np.arange(x.shape[1])[None, :] >= (first + lookback)[:, None]
+
+    @staticmethod
+    def _zero(x: np.ndarray) -> np.ndarray:
+        return (-1e-8 < x) & (x < 1e-8)
+
+    @staticmethod
+    def _shift(x: np.ndarray) -> np.ndarray:
+        """Previous bar's value, NaN on the first bar."""
+        shifted = np.full(x.shape, np.nan)
+        shifted[:, 1:] = x[:, :-1]
+        return shifted
+
+    @staticmethod
+    def _rolling_sum(x: np.ndarray, period: int) -> np.ndarray:
+        """
+        Sum of each bar and the period - 1 before it, NaN treated as 0 (callers mask the
+        padding).
+        """
+        cumulative = np.zeros((x.shape[0], x.shape[1] + 1))
+        np.cumsum(np.nan_to_num(x), axis=1, out=cumulative[:, 1:])
+        total = np.full(x.shape, np.nan)
+        if x.shape[1] >= period:
+            total[:, period - 1 :] = cumulative[:, period:] - cumulative[:, :-period]
+        return total
+
+    @staticmethod
+    def _rolling(x: np.ndarray, period: int, reduce: Callable) -> np.ndarray:
+        """Reduce each bar and the period - 1 before it, e.g. with np.max."""
+        out = np.full(x.shape, np.nan)
+        if x.shape[1] >= period:
+            out[:, period - 1 :] = reduce(
+                np.lib.stride_tricks.sliding_window_view(x, period, axis=1), axis=2
+            )
+        return out
+
+    @classmethod
+    def cross(cls, line: np.ndarray, signal: np.ndarray) -> np.ndarray:
+        """
+        Cross codes: 1 where line crosses above signal, -1 below, 0 otherwise (also next
+        to NaN).
+        """
+        linePrev, signalPrev = cls._shift(line), cls._shift(signal)
+        return np.select(
+            [
+                (linePrev < signalPrev) & (line > signal),
+                (linePrev > signalPrev) & (line < signal),
+            ],
+            [1, -1],
+            0,
+        ).astype(np.int8)
+
+    @staticmethod
+    def _latest_nonzero(codes: np.ndarray) -> np.ndarray:
+        """Each row's last nonzero code, 0 if none."""
+        if codes.shape[1] == 0:
+            return np.zeros(codes.shape[0], dtype=np.int8)
+        nonzero = codes != 0
+        last = codes.shape[1] - 1 - np.argmax(nonzero[:, ::-1], axis=1)
+        return np.where(
+            nonzero.any(axis=1), codes[np.arange(codes.shape[0]), last], 0
+        ).astype(np.int8)
@@ -0,0 +1,326 @@
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import numpy as np
+
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine as Engine
+
+Node = tuple  # (kind, *arguments), arguments that are nodes are the node's inputs
+
+
+# Node constructors
+
+
+def field(name: str) -> Node:
+    return ("field", name)
+
+
+def sma(source: Node, period: int, lag: int = 0) -> Node:
+    """
+    Mean of period values, valid from lag + period - 1 bars after a row's first (source
+    starts at lag).
+    """
+    return ("sma", ("rolling_sum", source, period), period, lag)
+
+
+def ema(source: Node, period: int, seed: int = None, lag: int = 0) -> Node:
+    """
+    EMA seeded with the mean of the period values up to seed bars after the source's
+    first (starting at lag).
+    """
+    seed = period - 1 if seed is None else seed
+    return (
+        "ema",
+        source,
+        sma(source, period, lag + seed - (period - 1)),
+        period,
+        lag + seed,
+    )
+
+
+def directional_movement() -> Node:
+    return ("directional_movement", field("High"), field("Low"), field("Close"))
+
+
+# Node kinds: compute(first, *arguments) with the input
+# nodes' arrays in place of the nodes
+
+NODES: Dict[str, Callable] = {
+    "rolling_sum": lambda first, x, period: Engine._rolling_sum(x, period),
+    "rolling_max": lambda first, x, period: Engine._rolling(x, period, np.max),
+    "rolling_min": lambda first, x, period: Engine._rolling(x, period, np.min),
+    "sma": lambda first, total, period, lag: np.where(
+        Engine._valid(total, first + lag, period - 1), total / period, np.nan
+    ),
+    "ema": lambda first, x, mean, period, seed: Engine.ema(
+        x, first, period, seed=seed, mean=mean
+    ),
+    "square": lambda first, x: x * x,
+    "sub": lambda first, a, b: a - b,
+    "mask": lambda first, x, lookback: np.where(
+        Engine._valid(x, first, lookback), x, np.nan
+    ),
+    "rsi": lambda first, x, period: Engine.rsi(x, first, period),
+    "stddev": lambda first, mean, meanSquare: Engine.stddev(mean, meanSquare),
+    "band": lambda first, middle, deviation, width: middle + width * deviation,
+    "fast_k": lambda first, highest, lowest, close, period: Engine.fast_k(
+        highest, lowest, close, first, period
+    ),
+    "directional_movement": lambda first, high, low, close: Engine.directional_movement(
+        high, low, close
+    ),
+    "item": lambda first, values, index: values[index],
+    "adx": lambda first, movement, period: Engine.adx_from(*movement, first, period),
+    "atr": lambda first, trueRange, period: Engine.atr(trueRange, first, period),
+    # Signal codes
+    "cross": lambda first, a, b: Engine.cross(a, b),
+    "latest_nonzero": lambda first, codes: Engine._latest_nonzero(codes),
+    "bands": lambda first, x, upper, lower: np.select(
+        [x > upper, x < lower], [1, -1], 0
+    ).astype(np.int8),
+    "compare": lambda first, a, b: np.where(a > b, 1, -1).astype(np.int8),
+    "above": lambda first, x, threshold: np.where(x > threshold, 1, 0).astype(np.int8),
+}
+
+
+# Indicators: output nodes from the parameters
+
+
+def _sma(p):
+    return {"value": sma(field(p["source"]), p["period"])}
+
+
+def _ema(p):
+    return {"value": ema(field(p["source"]), p["period"])}
+
+
+def _macd(p):
+    close = field("Close")
+    unmasked = ("sub", ema(close, p["fast"], seed=p["slow"] - 1), ema(close, p["slow"]))
+    line = ("mask", unmasked, p["slow"] + p["signal"] - 2)
+    signal = ema(unmasked, p["signal"], lag=p["slow"] - 1)
+    cross = ("cross", line, signal)
+    return {
+        "line": line,
+        "signal": signal,
+        "hist": ("sub", line, signal),
+        "code": cross,
+        "latest_cross": ("latest_nonzero", cross),
+    }
+
+
+def _rsi(p):
+    value = ("rsi", field("Close"), p["period"])
+    return {"value": value, "code": ("bands", value, p["overbought"], p["oversold"])}
+
+
+def _bbands(p):
+    close = field("Close")
+    middle = sma(close, p["period"])
+    deviation = ("stddev", middle, sma(("square", close), p["period"]))
+    upper, lower = ("band", middle, deviation, p["deviations"]), (
+        "band",
+        middle,
+        deviation,
+        -p["deviations"],
+    )
+    return {
+        "upper": upper,
+        "middle": middle,
+        "lower": lower,
+        "code": ("bands", close, upper, lower),
+    }
+
+
+def _stoch(p):
+    fast = (
+        "fast_k",
+        ("rolling_max", field("High"), p["fastk"]),
+        ("rolling_min", field("Low"), p["fastk"]),
+        field("Close"),
+        p["fastk"],
+    )
+    k = sma(fast, p["slowk"], lag=p["fastk"] - 1)
+    d = sma(k, p["slowd"], lag=p["fastk"] + p["slowk"] - 2)
+    k = ("mask", k, p["fastk"] + p["slowk"] + p["slowd"] - 3)
+    return {"k": k, "d": d, "code": ("compare", k, d)}
+
+
+def _adx(p):
+    value = ("adx", directional_movement(), p["period"])
+    return {"value": value, "code": ("above", value, p["threshold"])}
+
+
+def _atr(p):
+    return {"value": ("atr", ("item", directional_movement(), 2), p["period"])}
+
+
+def _volume_ma(p):
+    volume = field("Volume")
+    value = sma(volume, p["period"])
+    return {"value": value, "code": ("compare", volume, value)}
+
+
+class IndicatorRegistry:
+    """
+    Declarative technical indicators over an IndicatorEngine panel.
+
+    Callers request only the indicators they need, each by a spec: a registered
+    name, optionally with parameters and a label ('as') for its results:
+
+        'rsi'                                            # Defaults, labelled RSI14
+        {'name': 'sma', 'period': 200}                   # SMA200
+        {'name': 'rsi', 'period': 9, 'overbought': 80, 'as': 'fastRSI'}
+
+    An indicator is declared as output nodes. A node is a tuple of its kind and
+    arguments, the arguments that are nodes being its inputs; e.g. the 20-bar mean
+    of closes is ('sma', ('rolling_sum', ('field', 'Close'), 20), 20, 0). The nodes
+    of all requested indicators form one dependency graph in which equal nodes are
+    one node, so an intermediate shared by indicators (the 20-bar mean of SMA20
+    and the Bollinger middle band, the 26-bar EMA of EMA26 and MACD, the true
+    range of ADX and ATR) is computed once per panel.
+    """
+
+    INDICATORS: Dict[str, Tuple[Dict[str, Any], str, Callable]] = (
+        {  # name -> (defaults, label, outputs)
+            "sma": ({"period": 20, "source": "Close"}, "SMA{period}", _sma),
+            "ema": ({"period": 20, "source": "Close"}, "EMA{period}", _ema),
+            "macd": ({"fast": 12, "slow": 26, "signal": 9}, "MACD", _macd),
+            "rsi": (
+                {"period": 14, "overbought": 70, "oversold": 30},
+                "RSI{period}",
+                _rsi,
+            ),
+            "bbands": ({"period": 20, "deviations": 2.0}, "BB{period}", _bbands),
+            "stoch": ({"fastk": 5, "slowk": 3, "slowd": 3}, "STOCH", _stoch),
+            "adx": ({"period": 14, "threshold": 25}, "ADX{period}", _adx),
+            "atr": ({"period": 14}, "ATR{period}", _atr),
+            "volume_ma": ({"period": 20}, "VOMA{period}", _volume_ma),
+        }
+    )
+
+    @classmethod
+    def register(
+        cls,
+        name: str,
+        defaults: Dict[str, Any],
+        label: str,
+        outputs: Callable[[Dict[str, Any]], Dict[str, Node]],
+    ):
+        """
+        Register an indicator.
+
+        Args:
+            name: Name used in specs
+            defaults: Parameters and their default values
+            label: Default label of its results, formatted with the parameters
+            outputs: Called with the parameters, returns the node of each output
+        """
+        cls.INDICATORS[name] = (defaults, label, outputs)
+
+    def plan(
+        self, specs: List[Union[str, Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Dict[str, Node]], List[Node]]:
+        """
+        Build the dependency graph of specs.
+
+        Args:
+            specs: Indicator specs, see the class docstring
+
+        Returns:
+            Tuple of the output nodes per label and the distinct nodes to compute,
+            each after its inputs
+        """
+        outputs = {}
+        for spec in specs:
+            spec = {"name": spec} if isinstance(spec, str) else spec
+            if spec["name"] not in self.INDICATORS:
+                raise ValueError(f"Unknown indicator: {spec['name']}")
+            defaults, label, build = self.INDICATORS[spec["name"]]
+            unknown = set(spec) - set(defaults) - {"name", "as"}
+            if unknown:
+                raise ValueError(
+                    f"Unknown parameters of {spec['name']}: "
+                    f"{', '.join(sorted(unknown))}"
+                )
+            params = dict(
+                defaults,
+                **{key: value for key, value in spec.items() if key in defaults},
+            )
+            label = spec.get("as") or label.format(**params)
+            if label in outputs:
+                raise ValueError(
+                    f"Duplicate indicator label: {label}, set 'as' to tell them apart"
+                )
+            outputs[label] = build(params)
+
+        order, seen = [], set()
+
+        def visit(node: Node):
+            if node in seen:
+                return
+            seen.add(node)
+            for argument in node[1:]:
+                if self._is_node(argument):
+                    visit(argument)
+            order.append(node)
+
+        for nodes in outputs.values():
+            for node in nodes.values():
+                visit(node)
+        return outputs, order
+
+    def evaluate(
+        self, panel: Dict[str, Any], specs: List[Union[str, Dict[str, Any]]]
+    ) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Calculate the requested indicators of a panel.
+
+        Args:
+            panel: Output of IndicatorEngine.panel()
+            specs: Indicator specs, see the class docstring
+
+        Returns:
+            Dictionary mapping each label to its outputs, e.g.
+            {'RSI14': {'value': ..., 'code': ...}};
+            tickers × bars arrays, except 'latest_cross' with one code per ticker
+        """
+        outputs, order = self.plan(specs)
+        values = {}
+        for node in order:
+            if node[0] == "field":
+                values[node] = panel[node[1]]
+                continue
+            arguments = [
+                values[argument] if self._is_node(argument) else argument
+                for argument in node[1:]
+            ]
+            values[node] = NODES[node[0]](panel["first"], *arguments)
+        return {
+            label: {output: values[node] for output, node in nodes.items()}
+            for label, nodes in outputs.items()
+        }
+
+    @staticmethod
+    def latest(
+        results: Dict[str, Dict[str, np.ndarray]], row: int
+    ) -> Dict[str, Dict[str, Any]]:
+        """The latest value of every output of evaluate() for one row, codes as ints."""
+        latest = {}
+        for label, outputs in results.items():
+            latest[label] = {}
+            for output, values in outputs.items():
+                value = values[row] if values.ndim == 1 else values[row, -1]
+                latest[label][output] = (
+                    int(value)
+                    if np.issubdtype(values.dtype, np.integer)
+                    else float(value)
+                )
+        return latest
+
+    @staticmethod
+    def _is_node(argument) -> bool:
+        return (
+            isinstance(argument, tuple)
+            and bool(argument)
+            and (argument[0] == "field" or argument[0] in NODES)
+        )
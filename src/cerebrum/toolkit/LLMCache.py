@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from cerebrum.config.Config import Config
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM completions.
+
+    Entries are keyed on a hash of the model, messages, temperature and max_tokens of
+    a request. Lookups go to an in-memory LRU tier first and then to an on-disk SQLite
+    tier, which survives restarts. Both tiers expire entries after a TTL and evict
+    the least recently used entries beyond their size limit.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: float = 86400,
+        max_memory_entries: int = 256,
+        max_disk_entries: int = 10000,
+    ):
+        """
+        Initialize the LLMCache.
+
+        Args:
+            path: SQLite file for the on-disk tier, None keeps the cache in memory only
+            ttl: Seconds an entry stays valid
+            max_memory_entries: Size of the in-memory LRU tier
+            max_disk_entries: Maximum number of rows kept on disk
+        """
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created, value), most recently used last
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+        self._db = None
+        if path:
+            path = os.path.expanduser(path)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS completions_accessed ON completions "
+                "(accessed)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def shared(cls) -> "LLMCache":
+        """Get the process-wide cache configured in Config['utils']['AI']['cache']."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cacheConfig = Config().config["utils"]["AI"]["cache"]
+                cls._shared = cls(
+                    path=cacheConfig["path"],
+                    ttl=cacheConfig["ttl"],
+                    max_memory_entries=cacheConfig["memoryEntries"],
+                    max_disk_entries=cacheConfig["diskEntries"],
+                )
+            return cls._shared
+
+    @staticmethod
+    def key(model: str, messages, temperature: float, max_tokens: int, **extra) -> str:
+        """
+        Build the cache key of a request.
+
+        Args:
+            model: Model name
+            messages: Chat messages sent to the model
+            temperature: Sampling temperature
+            max_tokens: Response length limit
+            extra: Any other request parameters that change the response
+
+        Returns:
+            Hex SHA-256 digest of the canonical request
+        """
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **extra,
+        }
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached completion.
+
+        Args:
+            key: Key from LLMCache.key
+
+        Returns:
+            The cached completion, or None on a miss
+        """
+        now = time.time()
+        with self.lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created < self.ttl:
+                        self._db.execute(
+                            "UPDATE completions SET accessed = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        """
+        Store a completion in both tiers.
+
+        Args:
+            key: Key from LLMCache.key
+            value: The completion text
+        """
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, value)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, created, "
+                    "accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _remember(self, key: str, created: float, value: str):
+        """Put an entry in the LRU tier. Caller must hold lock."""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float):
+        """
+        Drop expired rows and the least recently used rows beyond the size limit. Caller
+        must hold lock.
+        """
+        self._db.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self._stats["evictions"] += excess
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss statistics.
+
+        Returns:
+            Dictionary with memory/disk hits, misses, writes, evictions, hit rate and
+            tier sizes
+        """
+        with self.lock:
+            stats = dict(self._stats)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (
+                (stats["memory_hits"] + stats["disk_hits"]) / lookups
+                if lookups
+                else 0.0
+            )
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                (stats["disk_entries"],) = self._db.execute(
+                    "SELECT COUNT(*) FROM completions"
+                ).fetchone()
+            return stats
+
+    def clear(self):
+        """Remove all entries from both tiers."""
+        with self.lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM completions")
+                self._db.commit()
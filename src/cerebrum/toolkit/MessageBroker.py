@@ -1,42 +1,334 @@
+import queue
 import threading
-from typing import Dict, Any
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict
+
+from cerebrum.config.Config import Config
+from cerebrum.toolkit.MessageCodec import MessageCodec
 
 
 class MessageBroker:
     """A simple thread-safe message broker for publish-subscribe pattern."""
-    
-    def __init__(self):
-        """Initialize the MessageBroker with empty subscriptions and a lock."""
-        self.subscriptions: Dict[str, list] = {}  # Topic to list of callbacks mapping
+
+    is_async = False  # Subscribers are plain callables, see AsyncMessageBroker
+    DISPATCH_MODES = ("thread", "pool")
+    BACKPRESSURE_POLICIES = ("block", "drop_oldest", "reject")
+
+    def __init__(
+        self,
+        dispatch_mode: str = None,
+        max_workers: int = None,
+        queue_size: int = None,
+        backpressure: str = None,
+        transport=None,
+    ):
+        """
+        Initialize the MessageBroker with empty subscriptions and a lock.
+
+        Args:
+            dispatch_mode: 'thread' starts one thread per delivery, 'pool' hands
+                deliveries to a fixed set of workers through per-topic queues
+            max_workers: Number of worker threads in 'pool' mode
+            queue_size: Maximum pending deliveries per topic in 'pool' mode
+            backpressure: What to do when a topic queue is full in 'pool' mode:
+                'block' waits for space, 'drop_oldest' discards the oldest
+                pending delivery, 'reject' raises queue.Full
+            transport: Optional Transport connecting this broker to brokers in other
+                processes or on other hosts; publishes are forwarded to them and their
+                publishes are delivered to the local subscribers
+        """
+        brokerConfig = Config().config["broker"]
+        self.dispatch_mode = dispatch_mode or brokerConfig["dispatchMode"]
+        self.max_workers = max_workers or brokerConfig["maxWorkers"]
+        self.queue_size = queue_size or brokerConfig["queueSize"]
+        self.backpressure = backpressure or brokerConfig["backpressure"]
+        if self.dispatch_mode not in self.DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode: {self.dispatch_mode}")
+        if self.backpressure not in self.BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {self.backpressure}")
+
+        # Topic to list of (callback, inline) mapping
+        self.subscriptions: Dict[str, list] = {}
+        # Topic to consumer group to (callback, inline, load) members
+        self.groups: Dict[str, Dict[str, list]] = {}
+        # (topic, group) to next round-robin position
+        self._group_cursors: Dict[tuple, int] = {}
         self.lock = threading.Lock()  # Lock for thread safety
-    
-    def subscribe(self, topic: str, callback):
+
+        # Worker pool state, only used in 'pool' mode
+        # Topic to pending (callback, message, enqueued_at)
+        self._queues: Dict[str, deque] = {}
+        # Topics with pending deliveries, served round-robin
+        self._ready_topics = deque()
+        # Guards queues, stats and worker state
+        self._queue_cond = threading.Condition()
+        self._workers = []
+        self._worker_state = threading.local()  # Marks the pool's own worker threads
+        self._closed = False
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+        self.transport = transport
+        if transport is not None:
+            transport.start(self._receive)
+
+    def subscribe(
+        self, topic: str, callback, inline: bool = False, group: str = None, load=None
+    ):
         """
         Subscribe a callback function to a topic.
-        
+
         Args:
             topic: The topic to subscribe to
             callback: The function to be called when a message is published to the topic
+            inline: Call the callback directly on the publisher's thread, bypassing the
+                dispatch mode. Only for callbacks that return immediately, such as
+                putting the message on an agent's inbox
+            group: Optional consumer group. Each message goes to every plain subscriber
+                but to only one member of each group, so replicas share the work
+            load: Optional function returning the member's current backlog; the least
+                loaded member of a group is chosen, ties are broken round-robin
+        """
+        with self.lock:
+            if group is None:
+                if topic not in self.subscriptions:
+                    self.subscriptions[topic] = []
+                self.subscriptions[topic].append((callback, inline))
+            else:
+                members = self.groups.setdefault(topic, {}).setdefault(group, [])
+                members.append((callback, inline, load))
+
+    def unsubscribe(self, topic: str, callback=None):
+        """
+        Remove subscriptions from a topic.
+
+        Args:
+            topic: The topic to unsubscribe from
+            callback: The callback to remove, None removes every subscriber of the topic
         """
         with self.lock:
-            if topic not in self.subscriptions:
-                self.subscriptions[topic] = []
-            self.subscriptions[topic].append(callback)
-    
+            if callback is None:
+                self.subscriptions.pop(topic, None)
+                self.groups.pop(topic, None)
+                return
+            remaining = [
+                entry
+                for entry in self.subscriptions.get(topic, [])
+                if entry[0] != callback
+            ]
+            if remaining:
+                self.subscriptions[topic] = remaining
+            else:
+                self.subscriptions.pop(topic, None)
+            for members in self.groups.get(topic, {}).values():
+                members[:] = [member for member in members if member[0] != callback]
+
     def publish(self, topic: str, message: Dict[str, Any]):
         """
         Publish a message to a topic, notifying all subscribers asynchronously.
-        
+
         Args:
             topic: The topic to publish to
             message: The message data to be sent to subscribers (as a dictionary)
+
+        Raises:
+            queue.Full: In 'pool' mode with 'reject' backpressure when the topic queue
+                is full
         """
+        if self.transport is not None:
+            # Encode once, the same frame goes to every peer. Forward before local
+            # delivery so a local shutdown handler can't close the transport first
+            self.transport.send(MessageCodec.encode(topic, message))
+        self._deliver(topic, message)
+
+    def _receive(self, frame: bytes):
+        """Deliver a frame published by a peer broker to the local subscribers."""
+        topic = MessageCodec.topic(frame)
+        with self.lock:
+            interested = bool(self.subscriptions.get(topic) or self.groups.get(topic))
+        if interested:  # Skip unpickling messages nobody here listens to
+            _, message = MessageCodec.decode(frame)
+            self._deliver(topic, message)
+
+    def _deliver(self, topic: str, message: Dict[str, Any]):
+        """Hand a message to the subscribers of this broker."""
         with self.lock:
-            subscribers = self.subscriptions.get(topic, [])
-            for callback in subscribers:
-                # Start a new daemon thread for each callback
-                threading.Thread(
-                    target=callback,
-                    args=(message,),
-                    daemon=True
-                ).start()
\ No newline at end of file
+            subscribers = list(self.subscriptions.get(topic, []))
+            for group, members in self.groups.get(topic, {}).items():
+                if members:
+                    subscribers.append(self._pick_member(topic, group, members))
+
+        # Dispatch outside the subscription lock so publishers don't block each other
+        for callback, inline in subscribers:
+            if inline:
+                callback(message)
+            else:
+                self._dispatch(topic, callback, message)
+
+    def _pick_member(self, topic: str, group: str, members: list):
+        """
+        Choose the group member that receives the next message. Caller must hold lock.
+        """
+        start = self._group_cursors.get((topic, group), 0)
+        order = [members[(start + i) % len(members)] for i in range(len(members))]
+        chosen = min(order, key=lambda member: member[2]() if member[2] else 0)
+        self._group_cursors[(topic, group)] = (members.index(chosen) + 1) % len(members)
+        return chosen[0], chosen[1]
+
+    def _dispatch(self, topic: str, callback, message: Dict[str, Any]):
+        """Deliver one message to one subscriber according to the dispatch mode."""
+        if self.dispatch_mode == "pool":
+            self._enqueue(topic, callback, message)
+        else:
+            # Start a new daemon thread for each callback
+            threading.Thread(target=callback, args=(message,), daemon=True).start()
+
+    def _topic_stats(self, topic: str) -> Dict[str, float]:
+        """Get (or create) the counters of a topic. Caller must hold _queue_cond."""
+        if topic not in self._stats:
+            self._stats[topic] = {
+                "published": 0,
+                "dispatched": 0,
+                "dropped": 0,
+                "rejected": 0,
+                "inlined": 0,
+                "max_depth": 0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+            }
+        return self._stats[topic]
+
+    def _enqueue(self, topic: str, callback, message: Dict[str, Any]):
+        """
+        Put a delivery on the bounded topic queue, applying backpressure.
+
+        In 'block' mode a pool worker publishing to a full queue runs the delivery
+        itself instead of waiting: once every worker waited for room, none would be
+        left to make it.
+        """
+        with self._queue_cond:
+            if self._closed:
+                raise RuntimeError("MessageBroker is closed")
+            self._start_workers()
+            pending = self._queues.setdefault(topic, deque())
+            stats = self._topic_stats(topic)
+            inline = False  # Run on this worker instead of queueing
+
+            if len(pending) >= self.queue_size:
+                if self.backpressure == "reject":
+                    stats["rejected"] += 1
+                    raise queue.Full(f"Topic {topic} queue is full ({self.queue_size})")
+                elif self.backpressure == "drop_oldest":
+                    pending.popleft()
+                    stats["dropped"] += 1
+                elif getattr(self._worker_state, "active", False):
+                    stats["published"] += 1
+                    stats["dispatched"] += 1
+                    stats["inlined"] += 1
+                    inline = True
+                else:
+                    while len(pending) >= self.queue_size and not self._closed:
+                        self._queue_cond.wait()
+                    if self._closed:
+                        raise RuntimeError("MessageBroker is closed")
+
+            if not inline:
+                if not pending:
+                    self._ready_topics.append(topic)
+                pending.append((callback, message, time.perf_counter()))
+                stats["published"] += 1
+                stats["max_depth"] = max(stats["max_depth"], len(pending))
+                self._queue_cond.notify_all()
+
+        if inline:  # On the publishing worker, outside the lock
+            try:
+                callback(message)
+            except Exception:
+                traceback.print_exc()  # Handler errors don't reach the publisher
+
+    def _start_workers(self):
+        """Start the fixed worker pool on first use. Caller must hold _queue_cond."""
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(
+                target=self._worker_loop, name=f"MessageBroker-worker-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self):
+        """Take deliveries from the topic queues in round-robin order and run them."""
+        self._worker_state.active = True
+        while True:
+            with self._queue_cond:
+                while not self._ready_topics and not self._closed:
+                    self._queue_cond.wait()
+                if not self._ready_topics:
+                    return  # Closed and fully drained
+
+                topic = self._ready_topics.popleft()
+                pending = self._queues[topic]
+                callback, message, enqueued_at = pending.popleft()
+                if pending:
+                    self._ready_topics.append(topic)
+
+                latency = time.perf_counter() - enqueued_at
+                stats = self._topic_stats(topic)
+                stats["dispatched"] += 1
+                stats["latency_total"] += latency
+                stats["latency_max"] = max(stats["latency_max"], latency)
+                self._queue_cond.notify_all()  # Wake publishers blocked on a full queue
+
+            try:
+                callback(message)
+            except Exception:
+                traceback.print_exc()  # Keep the worker alive on handler errors
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get dispatch counters per topic ('pool' mode).
+
+        Returns:
+            Dictionary mapping topic to its current queue depth, max depth, number of
+            published/dispatched/dropped/rejected deliveries, deliveries run by a
+            worker publishing to a full queue ('inlined') and dispatch latency in
+            seconds
+        """
+        with self._queue_cond:
+            result = {}
+            for topic, stats in self._stats.items():
+                dispatched = stats["dispatched"]
+                result[topic] = {
+                    "depth": len(self._queues.get(topic, ())),
+                    "max_depth": stats["max_depth"],
+                    "published": stats["published"],
+                    "dispatched": dispatched,
+                    "dropped": stats["dropped"],
+                    "rejected": stats["rejected"],
+                    "inlined": stats["inlined"],
+                    "avg_latency": (
+                        stats["latency_total"] / dispatched if dispatched else 0.0
+                    ),
+                    "max_latency": stats["latency_max"],
+                }
+            return result
+
+    def close(self, timeout: float = None):
+        """
+        Stop the worker pool after the pending deliveries have been handled
+        and disconnect the transport.
+
+        Args:
+            timeout: Maximum seconds to wait for each worker to finish
+        """
+        if self.transport is not None:
+            self.transport.close()
+        with self._queue_cond:
+            self._closed = True
+            self._queue_cond.notify_all()
+            workers = list(self._workers)
+        for worker in workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
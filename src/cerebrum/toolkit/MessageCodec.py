@@ -0,0 +1,98 @@
+import pickle
+import struct
+from typing import Any, Dict, Tuple
+
+
+class MessageCodec:
+    """
+    Binary framing of broker messages for transports that cross process boundaries.
+
+    A frame is encoded once per publish and can be relayed to any number of peers
+    as-is. Large binary payloads (numpy arrays behind DataFrames such as tickerData)
+    are carried as out-of-band pickle protocol 5 buffers, so they are copied into
+    the frame once instead of being re-serialized inside the pickle stream, and
+    are decoded without another copy. The topic is stored in a small header so
+    receivers can drop frames for topics they don't subscribe to without
+    unpickling the payload.
+
+    Layout: topic length (H) | topic | buffer count (I) | pickle length (Q) | pickle |
+    [buffer length (Q) | buffer] * buffer count
+
+    Only exchange frames with trusted peers, decoding unpickles the payload.
+    """
+
+    _TOPIC_HEADER = struct.Struct("!H")
+    _BODY_HEADER = struct.Struct("!IQ")
+    _BUFFER_HEADER = struct.Struct("!Q")
+
+    @classmethod
+    def encode(cls, topic: str, message: Dict[str, Any]) -> bytes:
+        """
+        Encode a topic and message into a single frame.
+
+        Args:
+            topic: The topic the message is published to
+            message: The message data
+
+        Returns:
+            The encoded frame
+        """
+        topicBytes = str(getattr(topic, "value", topic)).encode("utf-8")
+        buffers = []
+        body = pickle.dumps(message, protocol=5, buffer_callback=buffers.append)
+
+        parts = [
+            cls._TOPIC_HEADER.pack(len(topicBytes)),
+            topicBytes,
+            cls._BODY_HEADER.pack(len(buffers), len(body)),
+            body,
+        ]
+        for buffer in buffers:
+            raw = buffer.raw()
+            parts.append(cls._BUFFER_HEADER.pack(raw.nbytes))
+            parts.append(raw)
+        return b"".join(parts)
+
+    @classmethod
+    def topic(cls, frame) -> str:
+        """
+        Read the topic of a frame without decoding the message.
+
+        Args:
+            frame: An encoded frame
+
+        Returns:
+            The topic string
+        """
+        (topicLength,) = cls._TOPIC_HEADER.unpack_from(frame, 0)
+        start = cls._TOPIC_HEADER.size
+        return bytes(frame[start : start + topicLength]).decode("utf-8")
+
+    @classmethod
+    def decode(cls, frame) -> Tuple[str, Dict[str, Any]]:
+        """
+        Decode a frame produced by encode.
+
+        Args:
+            frame: An encoded frame (bytes or memoryview)
+
+        Returns:
+            Tuple of (topic, message); out-of-band buffers are views into the frame
+        """
+        view = memoryview(frame)
+        topic = cls.topic(view)
+        offset = cls._TOPIC_HEADER.size + len(topic.encode("utf-8"))
+
+        bufferCount, bodyLength = cls._BODY_HEADER.unpack_from(view, offset)
+        offset += cls._BODY_HEADER.size
+        body = view[offset : offset + bodyLength]
+        offset += bodyLength
+
+        buffers = []
+        for _ in range(bufferCount):
+            (length,) = cls._BUFFER_HEADER.unpack_from(view, offset)
+            offset += cls._BUFFER_HEADER.size
+            buffers.append(view[offset : offset + length])
+            offset += length
+
+        return topic, pickle.loads(body, buffers=buffers)
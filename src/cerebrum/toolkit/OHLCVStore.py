@@ -0,0 +1,333 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from cerebrum.config.Config import Config
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+
+        PARQUET = True
+    except ImportError:  # Histories are stored as pickles instead
+        PARQUET = False
+
+
+class OHLCVStore:
+    """
+    Local on-disk store of daily OHLCV histories, one file per ticker.
+
+    A request is served from the stored bars when they cover its window, and only
+    the missing bars are downloaded otherwise: bars before the earliest covered
+    date, and bars from the latest stored one on (which is downloaded again, it
+    may have been taken before its session closed). Stored data counts as current
+    until the next session close, and for intradayTTL seconds during a session.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+    _PERIOD = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+    def __init__(
+        self,
+        path: str,
+        intraday_ttl: float = 300,
+        timezone: str = "America/New_York",
+        session: tuple = ("09:30", "16:00"),
+        close_delay: float = 900,
+    ):
+        """
+        Initialize the OHLCVStore.
+
+        Args:
+            path: Directory of the per-ticker files
+            intraday_ttl: Seconds stored data counts as current during a session
+            timezone: Time zone of the exchange's session times
+            session: Opening and closing time of a session
+            close_delay: Seconds after the close before the day's bar counts as final
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.intraday_ttl = intraday_ttl
+        self.timezone = timezone
+        self.session = tuple(pd.Timedelta(f"{value}:00") for value in session)
+        self.close_delay = pd.Timedelta(seconds=close_delay)
+        self.format = "parquet" if PARQUET else "pickle"
+        self.lock = threading.Lock()
+        self._ticker_locks: Dict[str, threading.Lock] = {}
+        self._stats = {"hits": 0, "incremental": 0, "downloads": 0}
+
+    @classmethod
+    def shared(cls) -> "OHLCVStore":
+        """Get the process-wide store configured in Config['utils']['dataCache']."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                storeConfig = Config().config["utils"]["dataCache"]
+                cls._shared = cls(
+                    path=storeConfig["path"],
+                    intraday_ttl=storeConfig["intradayTTL"],
+                    timezone=storeConfig["timezone"],
+                    session=tuple(storeConfig["session"]),
+                    close_delay=storeConfig["closeDelay"],
+                )
+            return cls._shared
+
+    def retrieve(
+        self, ticker: str, filter: Dict[str, Any], download: Callable[..., pd.DataFrame]
+    ) -> pd.DataFrame:
+        """
+        Get the daily history of a ticker for a data filter.
+
+        Args:
+            ticker: Stock ticker
+            filter: {'option': 1, 'period': ...} or
+                {'option': 2, 'start_date': ..., 'end_date': ...},
+                as in FinanceDataUtils.retrieveData
+            download: Called as download(ticker, start=..., end=...) or
+                download(ticker, period='max'), returns the bars of that window
+
+        Returns:
+            The bars of the filter's window, oldest first
+        """
+        ticker = ticker.upper()
+        with self._ticker_lock(ticker):
+            now = pd.Timestamp.now(tz=self.timezone)
+            data, meta = self._load(ticker)
+            start, end, days = self._window(filter, now)
+            first = data is None
+
+            # Whether bars were downloaded, and up to now
+            fetched, current = (
+                False,
+                False,
+            )
+            if start is None and not meta.get("max"):
+                data = self._merge(data, download(ticker, period="max"))
+                meta["max"], fetched, current = True, True, True
+            elif start is not None and (
+                first or not meta.get("max") and start < self._covered(meta)
+            ):
+                # Bars before the covered window, or everything on a first request
+                head = download(
+                    ticker,
+                    start=start.strftime("%Y-%m-%d"),
+                    end=None if first else meta["start"],
+                )
+                data = self._merge(data, head)
+                meta["start"], fetched, current = (
+                    start.strftime("%Y-%m-%d"),
+                    True,
+                    first,
+                )
+            if not current and self._needs_tail(data, meta, end, now):
+                # Bars from the latest stored one on
+                tail = download(
+                    ticker,
+                    start=self._day(data.index[-1]).strftime("%Y-%m-%d"),
+                    end=None,
+                )
+                data = self._merge(data, tail)
+                fetched = True
+
+            with self.lock:
+                self._stats[
+                    "hits" if not fetched else "downloads" if first else "incremental"
+                ] += 1
+            if fetched:
+                meta["fetched"] = time.time()
+                self._save(ticker, data, meta)
+
+        return self._slice(data, start, end, days)
+
+    def _ticker_lock(self, ticker: str) -> threading.Lock:
+        with self.lock:
+            return self._ticker_locks.setdefault(ticker, threading.Lock())
+
+    def _window(self, filter: Dict[str, Any], now: pd.Timestamp):
+        """
+        Translate a filter to a window.
+
+        Returns:
+            Tuple of the start date (None for all bars), the exclusive end date (None
+            for up to now) and, for periods in days, the number of latest bars to keep
+        """
+        today = now.normalize().tz_localize(None)
+        if filter["option"] != 1:
+            start = pd.Timestamp(filter["start_date"])
+            end = pd.Timestamp(filter["end_date"]) if filter.get("end_date") else None
+            return start, end, None
+
+        period = filter["period"]
+        if period == "max":
+            return None, None, None
+        if period == "ytd":
+            return today.replace(month=1, day=1), None, None
+        match = self._PERIOD.match(period)
+        if match is None:
+            raise ValueError(f"Unsupported period: {period}")
+        count, unit = int(match.group(1)), match.group(2)
+        if unit == "d":
+            # Enough calendar days to hold the trading days, trimmed
+            # to the count in _slice
+            return today - pd.Timedelta(days=count * 7 // 5 + 10), None, count
+        if unit == "wk":
+            return today - pd.Timedelta(weeks=count), None, None
+        offset = (
+            pd.DateOffset(months=count) if unit == "mo" else pd.DateOffset(years=count)
+        )
+        return today - offset, None, None
+
+    @staticmethod
+    def _covered(meta: Dict[str, Any]) -> pd.Timestamp:
+        return pd.Timestamp(meta["start"])
+
+    @staticmethod
+    def _day(timestamp: pd.Timestamp) -> pd.Timestamp:
+        """The trading day of a bar, in the time zone of its own exchange."""
+        return pd.Timestamp(timestamp).normalize().tz_localize(None)
+
+    def _needs_tail(
+        self,
+        data: pd.DataFrame,
+        meta: Dict[str, Any],
+        end: Optional[pd.Timestamp],
+        now: pd.Timestamp,
+    ) -> bool:
+        """Whether bars after the stored ones may exist within the window."""
+        if data is None or data.empty:
+            return False  # Nothing to extend, an empty download is not stored
+        if end is not None and end <= self._day(data.index[-1]) + pd.Timedelta(days=1):
+            return False  # The window ends within the stored bars
+        return not self._current(meta.get("fetched"), now)
+
+    def _current(self, fetched: Optional[float], now: pd.Timestamp) -> bool:
+        """
+        Whether data fetched at a time is still current: fetched after the latest final
+        close, or recently during a session.
+        """
+        if fetched is None:
+            return False
+        fetched = pd.Timestamp(fetched, unit="s", tz="UTC").tz_convert(self.timezone)
+        today = now.normalize()
+        opening, closing = today + self.session[0], today + self.session[1]
+        weekday = now.weekday() < 5
+        if weekday and opening <= now < closing + self.close_delay:
+            return now - fetched < pd.Timedelta(seconds=self.intraday_ttl)
+        # Latest session close that has settled, weekends and
+        # holidays keep the previous one
+        close = closing if weekday and now >= closing + self.close_delay else None
+        day = today
+        while close is None:
+            day -= pd.Timedelta(days=1)
+            if day.weekday() < 5:
+                close = day + self.session[1]
+        return fetched >= close + self.close_delay
+
+    @staticmethod
+    def _merge(
+        data: Optional[pd.DataFrame], new: Optional[pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Combine stored and downloaded bars, downloaded ones win."""
+        if new is None or new.empty:
+            return data if data is not None else pd.DataFrame()
+        if data is None or data.empty:
+            return new.sort_index()
+        if data.index.tz is not None and new.index.tz is not None:
+            new = new.tz_convert(data.index.tz)
+        merged = pd.concat([data, new])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    def _slice(self, data: Optional[pd.DataFrame], start, end, days) -> pd.DataFrame:
+        if data is None or data.empty:
+            return pd.DataFrame() if data is None else data.copy()
+        dates = data.index.normalize()
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        mask = np.ones(len(data), dtype=bool)
+        if start is not None:
+            mask &= dates >= start
+        if end is not None:
+            mask &= dates < end
+        window = data[mask]
+        return (window.tail(days) if days else window).copy()
+
+    def _file(self, ticker: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", ticker)
+        return os.path.join(self.path, f"{name}.{self.format}")
+
+    def _load(self, ticker: str):
+        """
+        Read a ticker's stored bars and metadata, (None, {}) when nothing is stored.
+        """
+        path = self._file(ticker)
+        if not os.path.exists(path) or not os.path.exists(path + ".json"):
+            return None, {}
+        try:
+            data = (
+                pd.read_parquet(path)
+                if self.format == "parquet"
+                else pd.read_pickle(path)
+            )
+            with open(path + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            return None, {}  # Unreadable files are downloaded again
+        return data, meta
+
+    def _save(self, ticker: str, data: pd.DataFrame, meta: Dict[str, Any]):
+        """Write a ticker's bars and then its metadata, each atomically."""
+        path = self._file(ticker)
+        if data.empty:
+            return
+        if "start" not in meta:
+            meta["start"] = self._day(data.index[0]).strftime("%Y-%m-%d")
+        temporary = path + ".tmp"
+        if self.format == "parquet":
+            data.to_parquet(temporary)
+        else:
+            data.to_pickle(temporary)
+        os.replace(temporary, path)
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporary, path + ".json")
+
+    def invalidate(self, ticker: str = None):
+        """
+        Remove the stored bars of a ticker.
+
+        Args:
+            ticker: Stock ticker, None removes every ticker
+        """
+        with self.lock:
+            names = os.listdir(self.path)
+        prefix = (
+            None if ticker is None else os.path.basename(self._file(ticker.upper()))
+        )
+        for name in names:
+            if prefix is None or name.startswith(prefix):
+                os.remove(os.path.join(self.path, name))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the store's counters.
+
+        Returns:
+            Dictionary with requests served without downloading ('hits'), with a
+            partial download ('incremental') and with a first download ('downloads'),
+            and the hit rate
+        """
+        with self.lock:
+            stats = dict(self._stats)
+        requests = stats["hits"] + stats["incremental"] + stats["downloads"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        return stats
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cerebrum.config.Config import Config
+
+
+class ReportCache:
+    """
+    Persistent cache of final reports.
+
+    Entries are keyed on the ticker, the data filter and the latest bar of the
+    ticker's history, so a task is answered from the cache until a new bar (or a
+    revision of the latest one) arrives. Entries expire after a TTL and the least
+    recently used ones are evicted beyond the size limit.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self, path: Optional[str] = None, ttl: float = 86400, max_entries: int = 5000
+    ):
+        """
+        Initialize the ReportCache.
+
+        Args:
+            path: SQLite file, None or '' keeps the cache in memory
+            ttl: Seconds a report stays valid
+            max_entries: Maximum number of reports kept
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if path:
+            path = os.path.expanduser(path)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                key TEXT PRIMARY KEY,
+                ticker TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS reports_accessed ON reports (accessed)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS reports_ticker ON reports (ticker)"
+        )
+        self._db.commit()
+
+    @classmethod
+    def shared(cls) -> "ReportCache":
+        """Get the process-wide cache configured in Config['reportCache']."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cacheConfig = Config().config["reportCache"]
+                cls._shared = cls(
+                    path=cacheConfig["path"],
+                    ttl=cacheConfig["ttl"],
+                    max_entries=cacheConfig["maxEntries"],
+                )
+            return cls._shared
+
+    @staticmethod
+    def key(ticker: str, filter: Dict[str, Any], tickerData) -> Optional[str]:
+        """
+        Build the cache key of a task.
+
+        Args:
+            ticker: Stock ticker
+            filter: Data filter of the task
+            tickerData: History returned by FinanceDataUtils.retrieveData
+
+        Returns:
+            Hex SHA-256 digest of the ticker, filter and latest bar, None without data
+        """
+        if tickerData is None or len(tickerData) == 0:
+            return None
+        bar = tickerData.iloc[-1]
+        request = {
+            "ticker": ticker.upper(),
+            "filter": filter,
+            "bar": str(tickerData.index[-1]),
+            "close": float(bar["Close"]),  # The latest bar changes during its session
+            "volume": float(bar["Volume"]),
+        }
+        canonical = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached report.
+
+        Args:
+            key: Key from ReportCache.key
+
+        Returns:
+            Dictionary with the 'report' and its 'structured' result, None on a miss
+        """
+        now = time.time()
+        with self.lock:
+            row = self._db.execute(
+                "SELECT value, created FROM reports WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created = row
+                if now - created < self.ttl:
+                    self._db.execute(
+                        "UPDATE reports SET accessed = ? WHERE key = ?", (now, key)
+                    )
+                    self._db.commit()
+                    self._stats["hits"] += 1
+                    return json.loads(value)
+                self._db.execute("DELETE FROM reports WHERE key = ?", (key,))
+                self._db.commit()
+            self._stats["misses"] += 1
+            return None
+
+    def put(
+        self,
+        key: str,
+        ticker: str,
+        report: str,
+        structured: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Store a final report.
+
+        Args:
+            key: Key from ReportCache.key
+            ticker: Stock ticker, for invalidate()
+            report: The final report
+            structured: The report's structured result, if any
+        """
+        now = time.time()
+        value = json.dumps(
+            {"report": report, "structured": structured}, ensure_ascii=False
+        )
+        with self.lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO reports (key, ticker, value, created, "
+                "accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, ticker.upper(), value, now, now),
+            )
+            self._stats["writes"] += 1
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float):
+        """
+        Drop expired rows and the least recently used rows beyond the size limit. Caller
+        must hold lock.
+        """
+        self._db.execute("DELETE FROM reports WHERE created < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM reports").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM reports WHERE key IN (SELECT key FROM reports ORDER BY "
+                "accessed LIMIT ?)",
+                (excess,),
+            )
+            self._stats["evictions"] += excess
+
+    def invalidate(self, ticker: str = None):
+        """
+        Remove the reports of a ticker.
+
+        Args:
+            ticker: Stock ticker, None removes every report
+        """
+        with self.lock:
+            if ticker is None:
+                self._db.execute("DELETE FROM reports")
+            else:
+                self._db.execute(
+                    "DELETE FROM reports WHERE ticker = ?", (ticker.upper(),)
+                )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss statistics.
+
+        Returns:
+            Dictionary with hits, misses, writes, evictions, hit rate and number of
+            entries
+        """
+        with self.lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            (stats["entries"],) = self._db.execute(
+                "SELECT COUNT(*) FROM reports"
+            ).fetchone()
+            return stats
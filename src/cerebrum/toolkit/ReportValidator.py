@@ -0,0 +1,219 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from cerebrum.config.Config import Config
+
+
+class ReportValidator:
+    """
+    Deterministic check of a market analysis report before the chief analyst's LLM
+    review.
+
+    Parses the markdown table format requested by Prompt.market_analysis and checks
+    that the eight core indicators, the summary and the confidence are present, that
+    the confidence matches the share of indicators agreeing with the summary (12.5%
+    each), and, when the computed indicators are given, that no indicator's
+    recommendation contradicts its computed signal: MA/EMA crossovers, the MACD
+    cross, RSI levels, Bollinger band breakouts, the K/D cross, ADX trend strength
+    (a clear trend follows MACD's direction, a weak one supports neither) and
+    volume above its average confirming the 20-bar price trend.
+    """
+
+    # Checked in order, so EMA/VOMA rows are not taken for MA
+    INDICATORS = (
+        ("VOMA", ("VOMA", "成交量移動平均", "成交量均線")),
+        ("EMA", ("EMA", "指數移動平均")),
+        ("MACD", ("MACD",)),
+        ("RSI", ("RSI", "相對強弱", "相對強度")),
+        ("BB", ("布林", "BOLL", "BB")),
+        ("SO", ("KD", "隨機", "STOCH")),
+        ("ADX", ("ADX", "趨向", "趨勢指")),
+        ("MA", ("MA", "移動平均")),
+    )
+    RECOMMENDATIONS = {
+        "買入": ("買入", "买入", "BUY"),
+        "持有": ("持有", "HOLD"),
+        "賣出": ("賣出", "卖出", "SELL"),
+    }
+    WEIGHT = 12.5  # Confidence points per agreeing indicator
+    ADX_THRESHOLD = (
+        25  # ADX above which a trend counts as clear, as in getTechnicalIndicators
+    )
+
+    def __init__(self, tolerance: float = None):
+        """
+        Initialize the ReportValidator.
+
+        Args:
+            tolerance: Allowed confidence deviation in percentage points, defaults to
+                Config['review']['confidenceTolerance']
+        """
+        self.tolerance = (
+            tolerance
+            if tolerance is not None
+            else Config().config["review"]["confidenceTolerance"]
+        )
+
+    def validate(
+        self, report: str, indicators: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Validate a report.
+
+        Args:
+            report: The market analyst's markdown report
+            indicators: Output of FinanceDataUtils.getTechnicalIndicators for the
+                report's ticker, enables the signal consistency checks
+
+        Returns:
+            Dictionary with 'passed', the 'errors' found, the parsed 'signals' per
+            indicator, 'summary' and 'confidence'
+        """
+        signals, summary, confidence = self._parse(report)
+        errors = []
+
+        missing = [name for name, _ in self.INDICATORS if name not in signals]
+        if missing:
+            errors.append(f"缺少指標：{', '.join(missing)}")
+        if summary is None:
+            errors.append("缺少總結或總結沒有買入/持有/賣出結論")
+        if confidence is None:
+            errors.append("缺少置信度")
+
+        if summary is not None and not missing:
+            counts = Counter(signals.values())
+            if counts[summary] < max(counts.values()):
+                errors.append(f"總結「{summary}」不是多數指標的結論 {dict(counts)}")
+            if confidence is not None:
+                expected = counts[summary] * self.WEIGHT
+                if abs(confidence - expected) > self.tolerance:
+                    errors.append(
+                        f"置信度 {confidence:g}% 與 {counts[summary]} 個一致指標（{expected:g}%）"
+                        "不符"
+                    )
+
+        if indicators is not None:
+            errors.extend(self._contradictions(signals, indicators))
+
+        return {
+            "passed": not errors,
+            "errors": errors,
+            "signals": signals,
+            "summary": summary,
+            "confidence": confidence,
+        }
+
+    def _parse(self, report: str):
+        """
+        Read indicator recommendations, summary and confidence from the table rows.
+        """
+        signals, summary, confidence = {}, None, None
+        for line in report.splitlines():
+            line = line.strip()
+            if not line.startswith("|"):
+                continue
+            cells = [
+                re.sub(r"[*`_]", "", cell).strip()
+                for cell in line.strip("|").split("|")
+            ]
+            if not cells or set(cells[0]) <= set("-: "):
+                continue  # Separator row
+            name = cells[0].upper()
+            if "置信" in name or "信心" in name or "CONFIDENCE" in name:
+                confidence = self._percentage(cells[1:])
+            elif (
+                "總結" in name or "总结" in name or "綜合" in name or "SUMMARY" in name
+            ):
+                summary = self._recommendation(cells[1:2])
+            elif "技術指標" not in name:
+                indicator = self._indicator(name)
+                recommendation = self._recommendation(cells[1:2])
+                if indicator and recommendation and indicator not in signals:
+                    signals[indicator] = recommendation
+        return signals, summary, confidence
+
+    def _indicator(self, name: str) -> Optional[str]:
+        for indicator, aliases in self.INDICATORS:
+            if any(alias in name for alias in aliases):
+                return indicator
+        return None
+
+    def _recommendation(self, cells: List[str]) -> Optional[str]:
+        text = " ".join(cells).upper()
+        found = [
+            label
+            for label, words in self.RECOMMENDATIONS.items()
+            if any(word in text for word in words)
+        ]
+        # Placeholders like 買入/持有/賣出 don't count
+        return found[0] if len(found) == 1 else None
+
+    @staticmethod
+    def _percentage(cells: List[str]) -> Optional[float]:
+        for cell in cells:
+            match = re.search(r"(\d+(?:\.\d+)?)\s*%", cell)
+            if match:
+                return float(match.group(1))
+        return None
+
+    def _contradictions(
+        self, signals: Dict[str, str], indicators: Dict[str, Any]
+    ) -> List[str]:
+        """Recommendations that go against the direction of a computed signal."""
+        # Indicators whose computed signal rules out 賣出 / 買入
+        bullish, bearish = (
+            set(),
+            set(),
+        )
+        for name in ("MA", "EMA"):
+            short, long = indicators[name][f"{name}20"], indicators[name][f"{name}50"]
+            if short > long:
+                bullish.add(name)
+            elif short < long:
+                bearish.add(name)
+        cross = indicators["MACD"]["latest_MACD_signal"]
+        if cross == "黃金交叉":
+            bullish.add("MACD")
+        elif cross == "死亡交叉":
+            bearish.add("MACD")
+        rsi = indicators["RSI"]["latest_RSI"]
+        if rsi > 70:
+            bearish.add("RSI")
+        elif rsi < 30:
+            bullish.add("RSI")
+        band = indicators["BB"]["latest_BB_signal"]
+        if band == "突破上軌":
+            bullish.add("BB")
+        elif band == "跌破下軌":
+            bearish.add("BB")
+        kd = indicators["SO"]["latest_KD_signal"]
+        if kd == "K上穿D":
+            bullish.add("SO")
+        elif kd == "K下穿D":
+            bearish.add("SO")
+        # A clear trend in MACD's direction
+        if indicators["ADX"]["latest_ADX"] > self.ADX_THRESHOLD:
+            if "MACD" in bullish:
+                bullish.add("ADX")
+            elif "MACD" in bearish:
+                bearish.add("ADX")
+        # Rising volume confirms the price trend
+        if indicators["VOMA"]["latest_Volume_signal"] == "放量":
+            prices = indicators["price"]["Price20_Trend"]
+            if prices and prices[-1] > prices[0]:
+                bullish.add("VOMA")
+            elif prices and prices[-1] < prices[0]:
+                bearish.add("VOMA")
+
+        errors = []
+        adx = indicators["ADX"]["latest_ADX"]
+        if adx <= self.ADX_THRESHOLD and signals.get("ADX") in ("買入", "賣出"):
+            errors.append(f"ADX {adx:.1f} 顯示趨勢弱，報告卻建議{signals['ADX']}")
+        for name in sorted(bullish):
+            if signals.get(name) == "賣出":
+                errors.append(f"{name} 的計算信號偏多，報告卻建議賣出")
+        for name in sorted(bearish):
+            if signals.get(name) == "買入":
+                errors.append(f"{name} 的計算信號偏空，報告卻建議買入")
+        return errors
@@ -0,0 +1,122 @@
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+import openai
+
+from cerebrum.config.Config import Config
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies per model, shared by the whole process.
+    """
+
+    _lock = threading.Lock()
+    _samples: Dict[str, deque] = {}
+    window = 200  # Latencies kept per model
+
+    @classmethod
+    def record(cls, model: str, seconds: float):
+        """
+        Record the latency of a successful call.
+
+        Args:
+            model: The model that answered
+            seconds: Wall time of the call
+        """
+        with cls._lock:
+            cls._samples.setdefault(model, deque(maxlen=cls.window)).append(seconds)
+
+    @classmethod
+    def quantile(cls, model: str, q: float, min_samples: int) -> Optional[float]:
+        """
+        Get a latency quantile of a model.
+
+        Args:
+            model: The model to look up
+            q: Quantile between 0 and 1, e.g. 0.95
+            min_samples: Number of samples required for a meaningful estimate
+
+        Returns:
+            The latency in seconds, or None if there are too few samples
+        """
+        with cls._lock:
+            samples = sorted(cls._samples.get(model, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class RetryPolicy:
+    """
+    Retry, timeout and hedging settings for AI service calls.
+
+    Transient failures (rate limits, timeouts, connection errors and 5xx responses)
+    are retried with exponential backoff and full jitter. When hedging is enabled,
+    a duplicate request goes to the next fallback model once the primary model has
+    been slower than its recent latency quantile, and the first answer wins.
+    """
+
+    RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+    def __init__(self, retryConfig: Dict[str, Any] = None):
+        """
+        Initialize the RetryPolicy.
+
+        Args:
+            retryConfig: Settings as in Config['utils']['AI']['retry'], defaults to
+                Config
+
+        Raises:
+            ValueError: If maxAttempts is less than 1
+        """
+        retryConfig = retryConfig or Config().config["utils"]["AI"]["retry"]
+        self.max_attempts = retryConfig["maxAttempts"]
+        if self.max_attempts < 1:
+            raise ValueError(f"maxAttempts must be at least 1, got {self.max_attempts}")
+        self.base_delay = retryConfig["baseDelay"]
+        self.max_delay = retryConfig["maxDelay"]
+        self.timeout = retryConfig["timeout"]
+        self.hedge = retryConfig["hedge"]
+        self.hedge_after = retryConfig["hedgeAfter"]
+        self.hedge_quantile = retryConfig["hedgeQuantile"]
+        self.hedge_min_samples = retryConfig["hedgeMinSamples"]
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether a failed call is worth retrying."""
+        return isinstance(error, self.RETRYABLE_ERRORS)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Get the delay before the next attempt.
+
+        Args:
+            attempt: Number of the attempt that just failed, starting at 0
+
+        Returns:
+            Seconds to sleep, drawn uniformly up to the capped exponential delay
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    def hedge_delay(self, model: str) -> float:
+        """
+        Get how long to wait for a model before hedging with the fallback model.
+
+        Args:
+            model: The primary model
+
+        Returns:
+            The model's observed latency quantile, or the configured hedgeAfter
+            until enough samples have been recorded
+        """
+        observed = LatencyTracker.quantile(
+            model, self.hedge_quantile, self.hedge_min_samples
+        )
+        return observed if observed is not None else self.hedge_after
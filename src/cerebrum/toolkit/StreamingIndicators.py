@@ -0,0 +1,410 @@
+import math
+from collections import deque
+from typing import Any, Dict, Mapping
+
+import pandas as pd
+
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine
+
+NAN = float("nan")
+
+
+def _zero(value: float) -> bool:
+    return -1e-8 < value < 1e-8
+
+
+def _clone(value):
+    """Copy an indicator's state: its own attributes, windows and nested indicators."""
+    if isinstance(value, deque):
+        return deque(value, value.maxlen)
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if hasattr(value, "__dict__"):
+        clone = object.__new__(type(value))
+        clone.__dict__ = _clone(value.__dict__)
+        return clone
+    return value  # Numbers, tuples and None are immutable
+
+
+class SMA:
+    """
+    Simple moving average over a window of the last period values.
+
+    The running total is summed again from the window every period values, so
+    rounding errors don't build up over a long stream (amortized constant time).
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        self.count += 1
+        if self.count % self.period == 0:
+            self.total = math.fsum(self.window)
+        self.value = (
+            self.total / self.period if len(self.window) == self.period else NAN
+        )
+        return self.value
+
+
+class EMA:
+    """
+    Exponential moving average, seeded with the SMA of its first period values like
+    TA-Lib.
+    """
+
+    def __init__(self, period: int, seed: int = None):
+        """
+        Initialize the EMA.
+
+        Args:
+            period: Number of values the smoothing factor 2 / (period + 1) is based on
+            seed: Values before the one the SMA seed ends at, period - 1 by default
+                (MACD seeds its fast EMA together with the slow one)
+        """
+        self.k = 2.0 / (period + 1)
+        self.seed = (period - 1 if seed is None else seed) + 1  # Values up to the seed
+        self.count = 0
+        self.mean = SMA(period)  # Dropped once seeded
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        self.count += 1
+        if self.mean is not None:
+            self.mean.update(x)
+            if self.count == self.seed:
+                self.value, self.mean = self.mean.value, None
+            return self.value
+        self.value = (x - self.value) * self.k + self.value
+        return self.value
+
+
+class MACD:
+    """MACD line, signal and histogram, all available from the 34th bar like TA-Lib."""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast, seed=slow - 1)
+        self.slow = EMA(slow)
+        self.signalEMA = EMA(signal)
+        self.line = self.signal = self.hist = NAN
+
+    def update(self, x: float):
+        line = self.fast.update(x) - self.slow.update(x)
+        if not math.isnan(line):
+            self.signal = self.signalEMA.update(line)
+        self.line = line if not math.isnan(self.signal) else NAN
+        self.hist = self.line - self.signal
+        return self.line, self.signal, self.hist
+
+
+class RSI:
+    """Wilder's RSI, available from the (period + 1)th bar."""
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.previous = None
+        self.count = 0  # Changes seen
+        self.gain = self.loss = 0.0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if self.previous is None:
+            self.previous = x
+            return self.value
+        change, self.previous = x - self.previous, x
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        self.count += 1
+        # The first changes are averaged, later ones smoothed in
+        if self.count <= self.period:
+            self.gain += gain
+            self.loss += loss
+            if self.count < self.period:
+                return self.value
+            self.gain /= self.period
+            self.loss /= self.period
+        else:
+            self.gain = (self.gain * (self.period - 1) + gain) / self.period
+            self.loss = (self.loss * (self.period - 1) + loss) / self.period
+        total = self.gain + self.loss
+        self.value = 0.0 if _zero(total) else 100 * (self.gain / total)
+        return self.value
+
+
+class BollingerBands:
+    """Bollinger bands on the population standard deviation."""
+
+    def __init__(self, period: int = 20, deviations: float = 2.0):
+        self.deviations = deviations
+        self.mean = SMA(period)
+        self.meanSquare = SMA(period)
+        self.upper = self.middle = self.lower = NAN
+
+    def update(self, x: float):
+        self.middle = self.mean.update(x)
+        variance = self.meanSquare.update(x * x) - self.middle * self.middle
+        deviation = (
+            NAN
+            if math.isnan(variance)
+            else 0.0 if variance < 1e-8 else math.sqrt(variance)
+        )
+        self.upper = self.middle + self.deviations * deviation
+        self.lower = self.middle - self.deviations * deviation
+        return self.upper, self.middle, self.lower
+
+
+class Stochastic:
+    """Slow stochastic %K and %D with SMA smoothing, available from the 9th bar."""
+
+    def __init__(self, fastk: int = 5, slowk: int = 3, slowd: int = 3):
+        self.highs = deque(maxlen=fastk)
+        self.lows = deque(maxlen=fastk)
+        self.slowK = SMA(slowk)
+        self.slowD = SMA(slowd)
+        self.k = self.d = NAN
+
+    def update(self, high: float, low: float, close: float):
+        self.highs.append(high)
+        self.lows.append(low)
+        if len(self.highs) < self.highs.maxlen:
+            return self.k, self.d
+        highest, lowest = max(self.highs), min(self.lows)
+        diff = (highest - lowest) / 100.0
+        k = self.slowK.update((close - lowest) / diff if diff != 0 else 0.0)
+        if not math.isnan(k):
+            self.d = self.slowD.update(k)
+        self.k = k if not math.isnan(self.d) else NAN
+        return self.k, self.d
+
+
+class ADX:
+    """Wilder's ADX, available from the (2 * period)th bar like TA-Lib."""
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.count = 0  # Bars seen
+        self.previous = None  # High, low and close of the previous bar
+        self.plus = self.minus = self.range = self.sumDX = 0.0
+        self.value = NAN
+
+    def update(self, high: float, low: float, close: float) -> float:
+        if self.previous is None:
+            self.previous = (high, low, close)
+            self.count = 1
+            return self.value
+        prevHigh, prevLow, prevClose = self.previous
+        self.previous = (high, low, close)
+        phase, period = self.count, self.period  # Bars before this one
+        self.count += 1
+
+        up, down = high - prevHigh, prevLow - low
+        plusDM = up if up > 0 and up > down else 0.0
+        minusDM = down if down > 0 and up < down else 0.0
+        trueRange = max(high - low, abs(high - prevClose), abs(low - prevClose))
+        if phase < period:  # The first period - 1 moves are summed
+            self.plus += plusDM
+            self.minus += minusDM
+            self.range += trueRange
+            return self.value
+        self.plus = self.plus - self.plus / period + plusDM
+        self.minus = self.minus - self.minus / period + minusDM
+        self.range = self.range - self.range / period + trueRange
+
+        dx = None
+        if not _zero(self.range):
+            plusDI, minusDI = 100 * (self.plus / self.range), 100 * (
+                self.minus / self.range
+            )
+            total = minusDI + plusDI
+            if not _zero(total):
+                dx = 100 * (abs(minusDI - plusDI) / total)
+        if phase <= 2 * period - 1:  # The first period DX values are averaged
+            if dx is not None:
+                self.sumDX += dx
+            if phase == 2 * period - 1:
+                self.value = self.sumDX / period
+        elif dx is not None:
+            self.value = (self.value * (period - 1) + dx) / period
+        return self.value
+
+
+class StreamingIndicators:
+    """
+    The technical indicators of one ticker, updated bar by bar.
+
+    Every indicator keeps only the state its next value needs (running sums,
+    smoothed averages and windows of at most 50 bars), so a new bar is processed
+    in constant time and memory instead of recomputing the whole history. Values
+    and signal codes match IndicatorEngine and the TA-Lib outputs of
+    FinanceDataUtils.getTechnicalIndicators for the same bars.
+
+    A live feed seeds the indicators once from the history, then calls update()
+    for each new bar and revise() for each tick of the bar in progress:
+
+        streaming = StreamingIndicators.seed(financeUtils.retrieveData(ticker, filter))
+        streaming.revise({'High': ..., 'Low': ..., 'Close': ..., 'Volume': ...})
+        if streaming.signals()['MACD_code'] == 1:
+            ...  # Golden cross on this bar
+    """
+
+    def __init__(self):
+        """Initialize the indicators with no bars."""
+        self.ma20, self.ma50 = SMA(20), SMA(50)
+        self.ema20, self.ema50 = EMA(20), EMA(50)
+        self.macd = MACD()
+        self.rsi = RSI(14)
+        self.bb = BollingerBands(20)
+        self.stoch = Stochastic()
+        self.adx = ADX(14)
+        self.volumeMA = SMA(20)
+        self.closes, self.volumes, self.macds = (
+            deque(maxlen=50),
+            deque(maxlen=50),
+            deque(maxlen=20),
+        )
+        self.codes: Dict[str, int] = {}
+        self.latest_cross = 0  # Code of the most recent MACD cross
+        self.bars = 0
+        self._before = None  # State before the latest bar, for revise()
+
+    @classmethod
+    def seed(cls, data: pd.DataFrame) -> "StreamingIndicators":
+        """
+        Create the indicators of a history.
+
+        Args:
+            data: Pandas DataFrame with High, Low, Close and Volume columns, as
+                returned by FinanceDataUtils.retrieveData
+
+        Returns:
+            StreamingIndicators up to the history's last bar, which can be revised
+        """
+        streaming = cls()
+        rows = data[["High", "Low", "Close", "Volume"]].itertuples(
+            index=False, name=None
+        )
+        for count, (high, low, close, volume) in enumerate(rows, 1):
+            bar = {"High": high, "Low": low, "Close": close, "Volume": volume}
+            if count == len(data):
+                streaming.update(bar)
+            else:
+                streaming._apply(bar)
+        return streaming
+
+    def update(self, bar: Mapping[str, float]) -> Dict[str, Any]:
+        """
+        Add a new bar.
+
+        Args:
+            bar: Mapping with the bar's High, Low, Close and Volume
+
+        Returns:
+            The latest values and signal codes, see values() and signals()
+        """
+        self._before = self._state()
+        return self._apply(bar)
+
+    def revise(self, bar: Mapping[str, float]) -> Dict[str, Any]:
+        """
+        Replace the latest bar, e.g. with the latest tick of a bar in progress.
+
+        Args:
+            bar: Mapping with the bar's High, Low, Close and Volume so far
+
+        Returns:
+            The latest values and signal codes, see values() and signals()
+        """
+        if self._before is None:
+            return self.update(bar)
+        self.__dict__.update(_clone(self._before))
+        return self._apply(bar)
+
+    def _state(self) -> Dict[str, Any]:
+        return _clone(
+            {name: value for name, value in self.__dict__.items() if name != "_before"}
+        )
+
+    def _apply(self, bar: Mapping[str, float]) -> Dict[str, Any]:
+        high, low, close, volume = (
+            float(bar[field]) for field in IndicatorEngine.FIELDS
+        )
+        macdPrev, signalPrev = self.macd.line, self.macd.signal
+
+        self.ma20.update(close)
+        self.ma50.update(close)
+        self.ema20.update(close)
+        self.ema50.update(close)
+        macd, signal, _ = self.macd.update(close)
+        rsi = self.rsi.update(close)
+        upper, _, lower = self.bb.update(close)
+        k, d = self.stoch.update(high, low, close)
+        adx = self.adx.update(high, low, close)
+        volumeMA = self.volumeMA.update(volume)
+        self.closes.append(close)
+        self.volumes.append(volume)
+        self.macds.append(macd)
+        self.bars += 1
+
+        # Comparisons with NaN are false, as in IndicatorEngine.signals
+        cross = (
+            1
+            if macdPrev < signalPrev and macd > signal
+            else -1 if macdPrev > signalPrev and macd < signal else 0
+        )
+        if cross:
+            self.latest_cross = cross
+        self.codes = {
+            "MACD_code": cross,
+            "RSI_code": 1 if rsi > 70 else -1 if rsi < 30 else 0,
+            "BB_code": 1 if close > upper else -1 if close < lower else 0,
+            "KD_code": 1 if k > d else -1,
+            "ADX_code": 1 if adx > 25 else 0,
+            "Volume_code": 1 if volume > volumeMA else -1,
+        }
+        return dict(self.values(), **self.signals())
+
+    def values(self) -> Dict[str, float]:
+        """
+        Latest value of each indicator, named as in IndicatorEngine.compute(), NaN until
+        available.
+        """
+        return {
+            "MA20": self.ma20.value,
+            "MA50": self.ma50.value,
+            "EMA20": self.ema20.value,
+            "EMA50": self.ema50.value,
+            "MACD": self.macd.line,
+            "MACD_signal": self.macd.signal,
+            "MACD_hist": self.macd.hist,
+            "RSI": self.rsi.value,
+            "UpperBB": self.bb.upper,
+            "MiddleBB": self.bb.middle,
+            "LowerBB": self.bb.lower,
+            "slowk": self.stoch.k,
+            "slowd": self.stoch.d,
+            "ADX": self.adx.value,
+            "Volume_MA20": self.volumeMA.value,
+        }
+
+    def signals(self) -> Dict[str, int]:
+        """
+        Signal codes of the latest bar and 'MACD_latest_cross', see
+        IndicatorEngine.SIGNALS.
+        """
+        return dict(self.codes, MACD_latest_cross=self.latest_cross)
+
+    def indicators(self) -> Dict[str, Any]:
+        """
+        The indicators dict of the latest bar, as returned by
+        FinanceDataUtils.getTechnicalIndicators.
+        """
+        return IndicatorEngine.compile(
+            self.volumes, self.closes, self.macds, dict(self.values(), **self.signals())
+        )
@@ -0,0 +1,320 @@
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List
+
+# The eight core indicators
+INDICATORS = (
+    "MA",
+    "EMA",
+    "MACD",
+    "RSI",
+    "BB",
+    "SO",
+    "ADX",
+    "VOMA",
+)
+VERDICTS = ("買入", "持有", "賣出")
+INDICATOR_NAMES = {
+    "MA": "MA（移動平均線）",
+    "EMA": "EMA (指數移動平均)",
+    "MACD": "MACD",
+    "RSI": "RSI",
+    "BB": "布林通道 (Bollinger Bands)",
+    "SO": "隨機指標 (KD)",
+    "ADX": "平均趨向指標 (ADX)",
+    "VOMA": "成交量移動平均 (VOMA)",
+}
+_VERDICT_ALIASES = {
+    "BUY": "買入",
+    "买入": "買入",
+    "HOLD": "持有",
+    "SELL": "賣出",
+    "卖出": "賣出",
+}
+
+
+@dataclass
+class IndicatorVerdict:
+    """Verdict of one indicator in a structured market analysis."""
+
+    indicator: str  # One of INDICATORS
+    verdict: str  # One of VERDICTS
+    volume_support: bool  # Whether the volume trend supports the verdict
+    rationale: str
+
+
+@dataclass
+class MarketAnalysisResult:
+    """Structured market analysis of one ticker."""
+
+    ticker: str
+    indicators: List[IndicatorVerdict]
+    summary: str  # One of VERDICTS
+    confidence: float  # Percent, 12.5 per indicator agreeing with the summary
+    rationale: str
+
+    def verdicts(self) -> Dict[str, str]:
+        """Verdict per indicator."""
+        return {item.indicator: item.verdict for item in self.indicators}
+
+    def to_markdown(self) -> str:
+        """
+        Render the analysis as the markdown table format of Prompt.market_analysis.
+        """
+        rows = [
+            "| **技術指標** | **分析結果** | **具體依據** | **成交量趨勢支持** |",
+            "| --- | --- | --- | --- |",
+        ]
+        for item in self.indicators:
+            name = INDICATOR_NAMES.get(item.indicator, item.indicator)
+            rows.append(
+                f"| **{name}** | {item.verdict} | {item.rationale} | "
+                f"{'是' if item.volume_support else '否'} |"
+            )
+        rows.append("| --- | --- | --- | --- |")
+        rows.append(f"| **總結** | **{self.summary}** | {self.rationale} |  |")
+        rows.append(f"| **置信度** |  |  | **{self.confidence:g}%** |")
+        return "\n".join(rows)
+
+
+@dataclass
+class ReviewResult:
+    """Structured review of a market analysis by the chief analyst."""
+
+    result: str  # 'APPROVED' or 'REVISE_REQUIRED'
+    feedback: str
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def approved(self) -> bool:
+        return self.result == "APPROVED"
+
+    def to_text(self) -> str:
+        """Render the review as feedback for the revision prompt."""
+        issues = "".join(f"\n- {issue}" for issue in self.issues)
+        return f"{self.result}：{self.feedback}{issues}"
+
+
+class StructuredOutput:
+    """
+    JSON schemas, response_format parameters and parsers of the structured output mode.
+
+    In structured mode analysts answer with compact JSON (a verdict, volume support
+    and a short rationale per indicator) instead of free-form markdown, which keeps
+    responses short and lets batch and screening runs aggregate typed results.
+    """
+
+    _VERDICT = {"type": "string", "enum": list(VERDICTS)}
+    _ANALYSIS = {
+        "type": "object",
+        "properties": {
+            "ticker": {"type": "string"},
+            "indicators": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "indicator": {"type": "string", "enum": list(INDICATORS)},
+                        "verdict": _VERDICT,
+                        "volume_support": {"type": "boolean"},
+                        "rationale": {"type": "string"},
+                    },
+                    "required": ["indicator", "verdict", "volume_support", "rationale"],
+                    "additionalProperties": False,
+                },
+            },
+            "summary": _VERDICT,
+            "confidence": {"type": "number"},
+            "rationale": {"type": "string"},
+        },
+        "required": ["ticker", "indicators", "summary", "confidence", "rationale"],
+        "additionalProperties": False,
+    }
+    SCHEMAS = {
+        "market_analysis": _ANALYSIS,
+        "market_analysis_batch": {
+            "type": "object",
+            "properties": {"results": {"type": "array", "items": _ANALYSIS}},
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+        "review": {
+            "type": "object",
+            "properties": {
+                "result": {"type": "string", "enum": ["APPROVED", "REVISE_REQUIRED"]},
+                "feedback": {"type": "string"},
+                "issues": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["result", "feedback", "issues"],
+            "additionalProperties": False,
+        },
+    }
+
+    @classmethod
+    def response_format(cls, kind: str, mode: str = "json_schema") -> Dict[str, Any]:
+        """
+        Get the response_format request parameter for a kind of response.
+
+        Args:
+            kind: A key of SCHEMAS
+            mode: 'json_schema' for schema-constrained output, 'json_object' for
+                services that only support plain JSON mode
+
+        Returns:
+            The response_format parameter
+        """
+        if mode == "json_object":
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": kind, "schema": cls.SCHEMAS[kind], "strict": True},
+        }
+
+    @classmethod
+    def schema_text(cls, kind: str) -> str:
+        """
+        The schema as compact JSON, for prompts of services without schema support.
+        """
+        return json.dumps(cls.SCHEMAS[kind], ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def _load(text: str) -> Any:
+        """
+        Load the JSON object in a response, ignoring code fences and surrounding text.
+        """
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("Response contains no JSON object")
+        try:
+            return json.loads(text[start : end + 1])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Response is not valid JSON: {e}") from e
+
+    @staticmethod
+    def _verdict(value: Any) -> str:
+        verdict = str(value).strip()
+        verdict = _VERDICT_ALIASES.get(verdict.upper(), verdict)
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown verdict: {value}")
+        return verdict
+
+    @classmethod
+    def _analysis(
+        cls, data: Dict[str, Any], ticker: str = None
+    ) -> MarketAnalysisResult:
+        try:
+            indicators = [
+                IndicatorVerdict(
+                    indicator=str(item["indicator"]).upper(),
+                    verdict=cls._verdict(item["verdict"]),
+                    volume_support=bool(item.get("volume_support", False)),
+                    rationale=str(item.get("rationale", "")),
+                )
+                for item in data["indicators"]
+            ]
+            return MarketAnalysisResult(
+                ticker=str(data.get("ticker") or ticker or ""),
+                indicators=indicators,
+                summary=cls._verdict(data["summary"]),
+                confidence=float(str(data["confidence"]).rstrip("%")),
+                rationale=str(data.get("rationale", "")),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Malformed market analysis: {e}") from e
+
+    @classmethod
+    def parse_analysis(cls, text: str, ticker: str = None) -> MarketAnalysisResult:
+        """
+        Parse a structured market analysis response.
+
+        Args:
+            text: The model's response
+            ticker: Ticker to use when the response doesn't name one
+
+        Returns:
+            The typed analysis
+
+        Raises:
+            ValueError: If the response doesn't match the schema
+        """
+        return cls._analysis(cls._load(text), ticker)
+
+    @classmethod
+    def parse_batch(cls, text: str) -> Dict[str, MarketAnalysisResult]:
+        """
+        Parse a structured batch response.
+
+        Returns:
+            Typed analyses keyed by upper-case ticker, malformed entries are left out
+
+        Raises:
+            ValueError: If the response isn't a JSON object with a results list
+        """
+        try:
+            results = cls._load(text).get("results")
+        except ValueError:
+            results = cls.complete_results(text)  # Cut off by the token limit
+            if not results:
+                raise
+        if not isinstance(results, list):
+            raise ValueError("Batch response has no results list")
+        analyses = {}
+        for data in results:
+            try:
+                analysis = cls._analysis(data)
+            except ValueError:
+                continue
+            analyses[analysis.ticker.upper()] = analysis
+        return analyses
+
+    @staticmethod
+    def complete_results(text: str) -> List[Any]:
+        """
+        Get the complete entries of a batch response's results list.
+
+        A response cut off by the token limit is not valid JSON, but the entries
+        before the cut are, so only the tickers after it need another request.
+
+        Returns:
+            The entries up to the first incomplete one, empty without a results list
+        """
+        match = re.search(r'"results"\s*:\s*\[', text)
+        if match is None:
+            return []
+        decoder = json.JSONDecoder()
+        results, offset = [], match.end()
+        while True:
+            while offset < len(text) and text[offset] in " \t\r\n,":
+                offset += 1
+            if offset >= len(text) or text[offset] == "]":
+                return results
+            try:
+                entry, offset = decoder.raw_decode(text, offset)
+            except json.JSONDecodeError:
+                return results
+            results.append(entry)
+
+    @classmethod
+    def parse_review(cls, text: str) -> ReviewResult:
+        """
+        Parse a structured review response.
+
+        Raises:
+            ValueError: If the response doesn't match the schema
+        """
+        data = cls._load(text)
+        data = data.get("audit_result", data)  # Also accept the free-form review format
+        result = str(data.get("result", "")).upper()
+        if result not in ("APPROVED", "REVISE_REQUIRED"):
+            raise ValueError(f"Unknown review result: {data.get('result')}")
+        return ReviewResult(
+            result=result,
+            feedback=str(data.get("feedback", "")),
+            issues=[str(issue) for issue in data.get("issues") or []],
+        )
+
+    @staticmethod
+    def to_dict(result) -> Dict[str, Any]:
+        """Plain dict of a typed result, for broker messages."""
+        return asdict(result)
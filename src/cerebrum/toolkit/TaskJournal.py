@@ -0,0 +1,233 @@
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from cerebrum.toolkit.MessageCodec import MessageCodec
+from cerebrum.toolkit.Topics import Topics
+
+try:
+    import fcntl
+except ImportError:  # Windows, the journal file isn't locked
+    fcntl = None
+
+
+class TaskJournal:
+    """
+    Append-only journal of the stage transitions of tasks.
+
+    Every message published on a stage topic is appended as a MessageCodec frame,
+    so the LLM output a stage has paid for survives a crash. On restart the last
+    recorded stage of every task that has not been reported is published again,
+    and the task continues from there instead of from scratch.
+
+    A resumed message carries the number of times its stage has been resumed.
+    Once that reaches max_resumes the task is given up and recorded as shed, so
+    a task that keeps failing without a report isn't replayed on every startup.
+
+    Record layout: time (d) | frame length (Q) | frame. A record cut off by a crash
+    is ignored when the journal is read.
+
+    A journal file belongs to one work group at a time, held by a lock on
+    '<path>.lock': another owner's records would be lost when compact()
+    rewrites the file, and its tasks would be resumed by both.
+    """
+
+    STAGES = (
+        Topics.MARKET_ANALYSIS,
+        Topics.MARKET_ANALYSIS_BATCH,
+        Topics.USER_FEEDBACK,
+        Topics.MARKET_ANALYSIS_FEEDBACK,
+        Topics.CHIEF_REVIEW,
+        Topics.MARKET_ANALYSIS_REVISE,
+    )
+    # A task is complete once one of these is recorded
+    FINAL = (
+        Topics.PRESENT_REPORT,
+        Topics.TASK_SHED,
+    )
+    _HEADER = struct.Struct("!dQ")
+
+    def __init__(
+        self,
+        path: str,
+        fsync: bool = False,
+        max_age: float = 86400,
+        max_resumes: int = 3,
+    ):
+        """
+        Initialize the TaskJournal.
+
+        Args:
+            path: Journal file, created if missing
+            fsync: Force every record to disk, not just to the OS
+            max_age: Seconds after which an incomplete task is no longer resumed
+            max_resumes: Times a task's stage is resumed before the task is given up
+
+        Raises:
+            RuntimeError: If the journal is open elsewhere, in this or another process
+        """
+        self.path = os.path.expanduser(path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._owner = open(self.path + ".lock", "ab")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._owner.close()
+                raise RuntimeError(f"Task journal {self.path} is in use")
+        self.fsync = fsync
+        self.max_age = max_age
+        self.max_resumes = max_resumes
+        self.lock = threading.Lock()
+        self._file = open(self.path, "ab")
+
+    def attach(self, broker):
+        """Record the stage and final messages published on a broker."""
+        for topic in self.STAGES + self.FINAL:
+            broker.subscribe(
+                topic,
+                lambda message, topic=topic: self.record(topic, message),
+                inline=True,
+            )
+
+    def record(self, topic: str, message: Dict[str, Any]):
+        """
+        Append a message to the journal.
+
+        A batch message is recorded once per task, so each task resumes on its own.
+        Retrieved histories are left out, the market analyst downloads them again.
+        """
+        if topic == Topics.MARKET_ANALYSIS_BATCH:
+            for task in message["tasks"]:
+                self._append(topic, {"tasks": [self._strip(task)]})
+            return
+        if message.get("task_id") is None:
+            return
+        self._append(topic, self._strip(message))
+
+    def _append(self, topic: str, message: Dict[str, Any]):
+        frame = MessageCodec.encode(topic, message)
+        with self.lock:
+            if self._file.closed:
+                return
+            self._file.write(self._HEADER.pack(time.time(), len(frame)) + frame)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    @staticmethod
+    def _strip(message: Dict[str, Any]) -> Dict[str, Any]:
+        data = message.get("data")
+        if isinstance(data, dict) and "tickerData" in data:
+            message = dict(
+                message,
+                data={key: value for key, value in data.items() if key != "tickerData"},
+            )
+        return message
+
+    def _read(self) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """Read all complete records, oldest first."""
+        records = []
+        with open(self.path, "rb") as f:
+            content = f.read()
+        offset = 0
+        while offset + self._HEADER.size <= len(content):
+            recorded, length = self._HEADER.unpack_from(content, offset)
+            start = offset + self._HEADER.size
+            if start + length > len(content):
+                break  # Cut off by a crash
+            try:
+                topic, message = MessageCodec.decode(content[start : start + length])
+            except Exception:
+                break  # Corrupt tail
+            records.append((recorded, topic, message))
+            offset = start + length
+        return records
+
+    @staticmethod
+    def _task_id(topic: str, message: Dict[str, Any]) -> str:
+        if topic == Topics.MARKET_ANALYSIS_BATCH:
+            return message["tasks"][0]["task_id"]
+        return message["task_id"]
+
+    def _pending(self) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """
+        The last record of every task not yet reported and not too old. Caller must hold
+        lock.
+        """
+        self._file.flush()
+        latest = OrderedDict()  # task_id -> (time, topic, message) of its last record
+        for recorded, topic, message in self._read():
+            task_id = self._task_id(topic, message)
+            latest.pop(task_id, None)
+            if topic not in self.FINAL:
+                latest[task_id] = (recorded, topic, message)
+        now = time.time()
+        return [record for record in latest.values() if now - record[0] <= self.max_age]
+
+    def incomplete(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Get the last recorded stage of every task that has not been reported.
+
+        Tasks resumed max_resumes times at the same stage are given up instead.
+
+        Returns:
+            (topic, message) pairs to publish, tasks whose last stage was a batch
+            analysis are regrouped into one batch message
+        """
+        with self.lock:
+            records = self._pending()
+        pending, batch = [], []
+        for _, topic, message in records:
+            task = (
+                message["tasks"][0]
+                if topic == Topics.MARKET_ANALYSIS_BATCH
+                else message
+            )
+            resumed = task.get("resumed", 0)
+            if resumed >= self.max_resumes:
+                print(
+                    f"\033[90m任務 {task['task_id']} 已恢復 {resumed} 次仍未完成，不再恢復。\033[0m"
+                )
+                self._append(
+                    Topics.TASK_SHED,
+                    {
+                        "task_id": task["task_id"],
+                        "role": "journal",
+                        "reason": "resumes",
+                    },
+                )
+                continue
+            task = dict(task, resumed=resumed + 1)
+            if topic == Topics.MARKET_ANALYSIS_BATCH:
+                batch.append(task)
+            else:
+                pending.append((topic, task))
+        if batch:
+            pending.append((Topics.MARKET_ANALYSIS_BATCH.value, {"tasks": batch}))
+        return pending
+
+    def compact(self):
+        """Rewrite the journal with only the last records of incomplete tasks."""
+        temporary = self.path + ".tmp"
+        with self.lock:
+            records = self._pending()
+            with open(temporary, "wb") as f:
+                for recorded, topic, message in records:
+                    frame = MessageCodec.encode(topic, message)
+                    f.write(self._HEADER.pack(recorded, len(frame)) + frame)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(temporary, self.path)
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        """Close the journal file and give up its ownership."""
+        with self.lock:
+            self._file.close()
+            self._owner.close()
@@ -0,0 +1,191 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cerebrum.config.Config import Config
+
+
+class TaskScheduler:
+    """
+    Priority inbox of an agent, a drop-in for the queue.Queue of (handler, message)
+    pairs.
+
+    Messages are handed out by priority (lower first), then earliest deadline, then
+    arrival. A task's priority and deadline are encoded in its task_id (see
+    task_id()), so they carry through every downstream topic without changing the
+    messages, also to agents in other processes. Messages whose deadline has passed
+    are shed instead of handled, and the wait of every message is recorded per
+    priority class.
+    """
+
+    # p<priority>[.d<deadline in epoch ms>].<id>
+    _TAG = re.compile(r"^p(\d+)(?:\.d(\d+))?\.")
+    _STOP = -1  # Priority of the stop sentinel, ahead of all work
+
+    def __init__(self, on_shed: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the TaskScheduler.
+
+        Args:
+            on_shed: Called with each message shed for missing its deadline
+        """
+        self.on_shed = on_shed
+        self.cond = threading.Condition()
+        self._heap = []  # (priority, deadline, seq, enqueued_at, sheddable, item)
+        self._seq = itertools.count()  # Keeps arrival order within equal keys
+        self._waits: Dict[int, Dict[str, float]] = {}  # Priority to wait counters
+
+    @staticmethod
+    def priority(value=None) -> int:
+        """
+        Resolve a priority.
+
+        Args:
+            value: A number, lower runs first, or a class name of
+                Config['scheduler']['priorities'] such as 'interactive' or 'batch'
+
+        Returns:
+            The numeric priority, the 'default' class when value is None
+        """
+        priorities = Config().config["scheduler"]["priorities"]
+        if value is None:
+            value = "default"
+        if isinstance(value, str) and not value.isdigit():
+            if value not in priorities:
+                raise ValueError(f"Unknown priority class: {value}")
+            return priorities[value]
+        return int(value)
+
+    @classmethod
+    def task_id(cls, task_id: str, priority=None, deadline: float = None) -> str:
+        """
+        Tag a task ID with its priority and deadline.
+
+        Args:
+            task_id: The untagged task ID
+            priority: See priority()
+            deadline: Absolute time.time() after which the task is shed, None for never
+
+        Returns:
+            The tagged task ID, used as the task's ID on every topic
+        """
+        tag = f"p{cls.priority(priority)}"
+        if deadline is not None:
+            tag += f".d{int(deadline * 1000)}"
+        return f"{tag}.{task_id}"
+
+    @classmethod
+    def schedule(cls, message: Dict[str, Any]) -> Tuple[int, Optional[float]]:
+        """
+        Get the priority and deadline of a message.
+
+        Read from the tag of the message's task_id, otherwise from its 'priority'
+        and 'deadline' fields (task requests not yet given an ID), otherwise the
+        lowest priority among a batch message's tasks.
+
+        Returns:
+            Tuple of priority and deadline (None for no deadline)
+        """
+        task_id = message.get("task_id")
+        match = cls._TAG.match(task_id) if isinstance(task_id, str) else None
+        if match:
+            deadline = match.group(2)
+            return int(match.group(1)), int(deadline) / 1000 if deadline else None
+        if message.get("tasks"):
+            return min(cls.schedule(task)[0] for task in message["tasks"]), None
+        return cls.priority(message.get("priority")), message.get("deadline")
+
+    def put(self, item: Tuple[Callable, Dict[str, Any]], shed: bool = True):
+        """
+        Queue a (handler, message) pair, (None, None) stops the consumer ahead of all
+        work.
+
+        Args:
+            item: The (handler, message) pair
+            shed: Drop the message if its deadline has passed before it is handed
+                out, False for messages that finish a task rather than start work
+        """
+        handler, message = item
+        if handler is None:
+            priority, deadline = self._STOP, None
+        else:
+            priority, deadline = self.schedule(message)
+        with self.cond:
+            heapq.heappush(
+                self._heap,
+                (
+                    priority,
+                    deadline if deadline is not None else float("inf"),
+                    next(self._seq),
+                    time.perf_counter(),
+                    shed,
+                    item,
+                ),
+            )
+            self.cond.notify()
+
+    def get(self) -> Tuple[Callable, Dict[str, Any]]:
+        """
+        Take the most urgent (handler, message) pair, blocking while empty and shedding
+        expired ones.
+        """
+        while True:
+            with self.cond:
+                while not self._heap:
+                    self.cond.wait()
+                priority, deadline, _, enqueued_at, shed, item = heapq.heappop(
+                    self._heap
+                )
+                expired = shed and time.time() > deadline
+                if priority != self._STOP:
+                    self._record(priority, time.perf_counter() - enqueued_at, expired)
+            if not expired:
+                return item
+            if self.on_shed is not None:
+                self.on_shed(item[1])
+
+    def _record(self, priority: int, wait: float, shed: bool):
+        """Count a message's wait in its priority class. Caller must hold cond."""
+        waits = self._waits.setdefault(
+            priority, {"dequeued": 0, "shed": 0, "wait_total": 0.0, "wait_max": 0.0}
+        )
+        waits["shed" if shed else "dequeued"] += 1
+        waits["wait_total"] += wait
+        waits["wait_max"] = max(waits["wait_max"], wait)
+
+    def qsize(self) -> int:
+        """Number of messages waiting."""
+        with self.cond:
+            return len(self._heap)
+
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        """
+        Get the queue waits per priority class.
+
+        Returns:
+            Dictionary mapping priority to the number of messages waiting, handed
+            out and shed, and their average and maximum wait in seconds
+        """
+        with self.cond:
+            waiting = {}
+            for entry in self._heap:
+                if entry[0] != self._STOP:
+                    waiting[entry[0]] = waiting.get(entry[0], 0) + 1
+            result = {}
+            for priority in sorted(set(self._waits) | set(waiting)):
+                waits = self._waits.get(
+                    priority,
+                    {"dequeued": 0, "shed": 0, "wait_total": 0.0, "wait_max": 0.0},
+                )
+                count = waits["dequeued"] + waits["shed"]
+                result[priority] = {
+                    "waiting": waiting.get(priority, 0),
+                    "dequeued": waits["dequeued"],
+                    "shed": waits["shed"],
+                    "avg_wait": waits["wait_total"] / count if count else 0.0,
+                    "max_wait": waits["wait_max"],
+                }
+            return result
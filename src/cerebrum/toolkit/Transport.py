@@ -0,0 +1,285 @@
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import traceback
+from typing import Callable, List
+
+
+class Transport:
+    """
+    Base class for carrying broker messages between processes or hosts.
+
+    A MessageBroker with a transport delivers each publish to its local subscribers
+    and hands one encoded frame (see MessageCodec) to the transport, which forwards
+    it to every peer broker. Frames received from peers are passed back to the
+    broker for local delivery only, so messages are never echoed.
+    """
+
+    def start(self, receive: Callable[[bytes], None]):
+        """
+        Start receiving frames from peers.
+
+        Args:
+            receive: Called with each frame that arrives from a peer
+        """
+        raise NotImplementedError("Transports must implement start")
+
+    def send(self, frame: bytes):
+        """
+        Forward an encoded frame to all peers.
+
+        Args:
+            frame: Frame produced by MessageCodec.encode
+        """
+        raise NotImplementedError("Transports must implement send")
+
+    def close(self):
+        """Stop receiving and release resources."""
+        pass
+
+    def _receive_loop(
+        self, receive: Callable[[bytes], None], read: Callable[[], bytes]
+    ):
+        """
+        Read frames until read returns None, keeping the loop alive on handler errors.
+        """
+        while True:
+            frame = read()
+            if frame is None:
+                return
+            try:
+                receive(frame)
+            except Exception:
+                traceback.print_exc()
+
+
+class QueueTransport(Transport):
+    """
+    Transport between processes on one machine built on multiprocessing queues.
+
+    Every process owns one inbox queue and holds the inbox queues of all its peers.
+    Create the whole mesh up front with QueueTransport.mesh() and pass one
+    transport to each process when it is spawned.
+    """
+
+    def __init__(self, inbox, peers: List):
+        """
+        Initialize the QueueTransport.
+
+        Args:
+            inbox: The multiprocessing queue this process reads from
+            peers: The inbox queues of all other processes
+        """
+        self.inbox = inbox
+        self.peers = peers
+        self._thread = None
+
+    @classmethod
+    def mesh(cls, size: int, context=None) -> List["QueueTransport"]:
+        """
+        Create a fully connected set of transports.
+
+        Args:
+            size: Number of processes taking part
+            context: Optional multiprocessing context (e.g. 'spawn')
+
+        Returns:
+            One transport per process
+        """
+        context = context or multiprocessing.get_context()
+        queues = [context.Queue() for _ in range(size)]
+        return [
+            cls(inbox, [peer for peer in queues if peer is not inbox])
+            for inbox in queues
+        ]
+
+    def start(self, receive: Callable[[bytes], None]):
+        self._thread = threading.Thread(
+            target=self._receive_loop,
+            args=(receive, self.inbox.get),
+            name="QueueTransport-receiver",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def send(self, frame: bytes):
+        for peer in self.peers:
+            peer.put(frame)
+
+    def close(self):
+        self.inbox.put(None)  # Wake the receiver so it exits
+
+
+def _parseAddress(address: str):
+    """
+    Split 'tcp://host:port' or 'unix:///path/to/socket' into socket family and address.
+    """
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://") :]
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://") :].rsplit(":", 1)
+        return socket.AF_INET, (host, int(port))
+    raise ValueError(f"Unsupported transport address: {address}")
+
+
+class _FramedSocket:
+    """Length-prefixed frames over a stream socket."""
+
+    _LENGTH = struct.Struct("!Q")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.lock = threading.Lock()  # Serialize writers so frames don't interleave
+
+    def write(self, frame: bytes):
+        with self.lock:
+            self.sock.sendall(self._LENGTH.pack(len(frame)))
+            self.sock.sendall(frame)
+
+    def read(self):
+        """Read one frame, or None when the connection is closed."""
+        header = self._read_exactly(self._LENGTH.size)
+        if header is None:
+            return None
+        (length,) = self._LENGTH.unpack(header)
+        return self._read_exactly(length)
+
+    def _read_exactly(self, length: int):
+        buffer = bytearray(length)
+        view = memoryview(buffer)
+        received = 0
+        while received < length:
+            try:
+                count = self.sock.recv_into(view[received:])
+            except OSError:
+                return None
+            if count == 0:
+                return None
+            received += count
+        return buffer
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class SocketHub:
+    """
+    Relay for SocketTransport peers on a TCP or Unix socket address.
+
+    Frames are forwarded as opaque bytes to every other connected peer, so the hub
+    never decodes or re-serializes messages. Run it in any one process (or a
+    dedicated one) before the peers connect. Bind it to localhost or a Unix
+    socket, peers unpickle what they receive.
+    """
+
+    def __init__(self, address: str):
+        """
+        Initialize the SocketHub.
+
+        Args:
+            address: 'tcp://host:port' or 'unix:///path/to/socket'
+        """
+        self.address = address
+        self.peers: List[_FramedSocket] = []
+        self.lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Start accepting peers on a background thread."""
+        family, address = _parseAddress(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)  # Remove a stale socket file from a previous run
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        threading.Thread(
+            target=self._accept_loop, name="SocketHub-accept", daemon=True
+        ).start()
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return  # Server socket closed
+            peer = _FramedSocket(sock)
+            with self.lock:
+                self.peers.append(peer)
+            threading.Thread(target=self._relay_loop, args=(peer,), daemon=True).start()
+
+    def _relay_loop(self, sender: _FramedSocket):
+        while True:
+            frame = sender.read()
+            if frame is None:
+                break
+            with self.lock:
+                receivers = [peer for peer in self.peers if peer is not sender]
+            for peer in receivers:
+                try:
+                    peer.write(frame)
+                except OSError:
+                    self._drop(peer)
+        self._drop(sender)
+
+    def _drop(self, peer: _FramedSocket):
+        with self.lock:
+            if peer in self.peers:
+                self.peers.remove(peer)
+        peer.close()
+
+    def close(self):
+        """Stop accepting peers and disconnect the connected ones."""
+        if self._server is not None:
+            self._server.close()
+        with self.lock:
+            peers, self.peers = self.peers, []
+        for peer in peers:
+            peer.close()
+
+
+class SocketTransport(Transport):
+    """Transport that connects to a SocketHub over TCP or a Unix socket."""
+
+    def __init__(self, address: str):
+        """
+        Initialize the SocketTransport.
+
+        Args:
+            address: Address of the SocketHub, 'tcp://host:port' or 'unix:///path'
+        """
+        self.address = address
+        self._connection = None
+        self._closed = False
+
+    def start(self, receive: Callable[[bytes], None]):
+        family, address = _parseAddress(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._connection = _FramedSocket(sock)
+        threading.Thread(
+            target=self._receive_loop,
+            args=(receive, self._connection.read),
+            name="SocketTransport-receiver",
+            daemon=True,
+        ).start()
+
+    def send(self, frame: bytes):
+        if self._closed:
+            return  # Late publishes during shutdown have nowhere to go
+        self._connection.write(frame)
+
+    def close(self):
+        self._closed = True
+        if self._connection is not None:
+            self._connection.close()
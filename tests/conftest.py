@@ -1,10 +1,57 @@
 """
-    Dummy conftest.py for finai.
+Dummy conftest.py for finai.
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
+If you don't know what this is for, just leave it empty.
+Read more about conftest.py under:
+- https://docs.pytest.org/en/stable/fixture.html
+- https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def make_history():
+    """Build a random-walk daily OHLCV history."""
+
+    def make(days: int, seed: int = 0) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        close = 100 + np.cumsum(rng.normal(0, 1, days))
+        return pd.DataFrame(
+            {
+                "Open": close + rng.normal(0, 0.5, days),
+                "High": close + rng.uniform(0.1, 1, days),
+                "Low": close - rng.uniform(0.1, 1, days),
+                "Close": close,
+                "Volume": rng.integers(1_000_000, 2_000_000, days).astype(float),
+            },
+            index=pd.date_range("2024-01-01", periods=days, freq="B"),
+        )
+
+    return make
+
+
+@pytest.fixture
+def same_indicators():
+    """Compare two indicators dicts of getTechnicalIndicators, floats to 1e-8."""
+
+    def same(expected, actual, path="") -> bool:
+        if isinstance(expected, dict):
+            assert sorted(expected) == sorted(actual), path
+            return all(
+                same(expected[key], actual[key], f"{path}.{key}") for key in expected
+            )
+        if isinstance(expected, list):
+            assert len(expected) == len(actual), path
+            return all(same(a, b, path) for a, b in zip(expected, actual))
+        if isinstance(expected, str):
+            assert expected == actual, (path, expected, actual)
+        elif np.isnan(expected):
+            assert np.isnan(actual), (path, actual)
+        else:
+            assert actual == pytest.approx(expected, rel=1e-8, abs=1e-8), path
+        return True
+
+    return same
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.IndicatorEncoder import IndicatorEncoder
+
+
+@pytest.fixture
+def short_indicators():
+    """Indicators of a 40-bar history, too short for the MACD to cover 20 days."""
+    days = np.arange(40)
+    close = 100 + 5 * np.sin(days / 3)
+    history = pd.DataFrame(
+        {
+            "Open": close,
+            "High": close + 1,
+            "Low": close - 1,
+            "Close": close,
+            "Volume": np.full(40, 1e6),
+        },
+        index=pd.date_range("2024-01-01", periods=40, freq="B"),
+    )
+    indicators = FinanceDataUtils.__new__(FinanceDataUtils).getTechnicalIndicators(
+        history
+    )
+    assert math.isnan(indicators["MACD"]["recent20MACD"][0])
+    return indicators
+
+
+@pytest.mark.parametrize("encoding", ["compact", "table", "delta"])
+def test_short_history_encodes_without_nan(short_indicators, encoding):
+    encoded = IndicatorEncoder(encoding, precision=2).encode(short_indicators)
+    assert not any("nan" in text.lower() for text in encoded.values())
+
+
+def test_table_leaves_the_macd_warm_up_blank(short_indicators):
+    table = IndicatorEncoder("table", precision=2).encode(short_indicators)["table"]
+    rows = table.split("```")[1].strip().split("\n")[1:]
+    macd = [row.split(",")[2] for row in rows]
+    covered = [
+        value for value in short_indicators["MACD"]["recent20MACD"] if value == value
+    ]
+    assert macd[-len(covered) :] != [""] * len(covered)
+    assert macd[: len(macd) - len(covered)] == [""] * (len(macd) - len(covered))
+
+
+def test_deltas_skip_nan_and_add_up_to_the_rounded_values():
+    encoder = IndicatorEncoder("delta", precision=2)
+    assert encoder._deltas([float("nan"), 1.0], 2) == "1.00"
+    parts = encoder._deltas([1.004, 1.5, float("nan"), 1.25], 2).split(",")
+    assert parts == ["1.00", "+0.50", "-0.25"]
+
+
+def test_single_nan_values_are_blank():
+    assert IndicatorEncoder._number(float("nan"), 2) == ""
+    assert IndicatorEncoder._number(-0.001, 2) == "0"
@@ -0,0 +1,27 @@
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine
+
+
+def test_run_matches_get_technical_indicators(make_history, same_indicators):
+    # Different lengths, so the shorter histories are padded in the panel
+    histories = {
+        f"T{seed}": make_history(days, seed)
+        for seed, days in enumerate((80, 120, 200, 60))
+    }
+    financeUtils = FinanceDataUtils.__new__(FinanceDataUtils)
+    results = IndicatorEngine().run(histories)
+    assert sorted(results) == sorted(histories)
+    for key, history in histories.items():
+        expected = financeUtils.getTechnicalIndicators(history.copy())
+        assert same_indicators(expected, results[key])
+
+
+def test_run_leaves_the_histories_unchanged(make_history):
+    history = make_history(120, 1)
+    columns = list(history.columns)
+    IndicatorEngine().run({"T": history})
+    assert list(history.columns) == columns
+
+
+def test_run_without_histories():
+    assert IndicatorEngine().run({}) == {}
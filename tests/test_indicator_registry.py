@@ -0,0 +1,54 @@
+import pytest
+
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.IndicatorEngine import IndicatorEngine
+from cerebrum.toolkit.IndicatorRegistry import IndicatorRegistry
+
+CROSSES = {"黃金交叉": 1, "死亡交叉": -1}
+
+
+def test_default_specs_match_get_technical_indicators(make_history):
+    histories = {
+        f"T{seed}": make_history(days, seed) for seed, days in enumerate((80, 120, 200))
+    }
+    registry = IndicatorRegistry()
+    panel = IndicatorEngine().panel(histories)
+    results = registry.evaluate(panel, IndicatorEngine.SPECS)
+    financeUtils = FinanceDataUtils.__new__(FinanceDataUtils)
+    for row, key in enumerate(panel["keys"]):
+        expected = financeUtils.getTechnicalIndicators(histories[key].copy())
+        latest = registry.latest(results, row)
+        for name in ("MA20", "MA50", "EMA20", "EMA50"):
+            group = name[:-2]
+            assert round(latest[name]["value"], 2) == expected[group][name]
+        assert latest["RSI"]["value"] == pytest.approx(expected["RSI"]["latest_RSI"])
+        assert latest["ADX"]["value"] == pytest.approx(expected["ADX"]["latest_ADX"])
+        cross = expected["MACD"]["latest_MACD_signal"]
+        assert latest["MACD"]["latest_cross"] == CROSSES[cross]
+        assert latest["MACD"]["line"] == pytest.approx(
+            expected["MACD"]["recent20MACD"][-1]
+        )
+
+
+def test_subset_evaluates_only_the_requested_indicators(make_history):
+    panel = IndicatorEngine().panel({"T": make_history(120, 1)})
+    results = IndicatorRegistry().evaluate(
+        panel, ["rsi", {"name": "sma", "period": 50}]
+    )
+    assert sorted(results) == ["RSI14", "SMA50"]
+
+
+def test_shared_inputs_are_planned_once():
+    outputs, _ = IndicatorRegistry().plan(
+        ["bbands", {"name": "sma", "period": 20, "as": "mid"}]
+    )
+    assert outputs["mid"]["value"] == outputs["BB20"]["middle"]
+
+
+@pytest.mark.parametrize(
+    "specs",
+    [["unknown"], [{"name": "rsi", "perod": 3}], ["rsi", "rsi"]],
+)
+def test_invalid_specs_raise(specs):
+    with pytest.raises(ValueError):
+        IndicatorRegistry().plan(specs)
@@ -0,0 +1,80 @@
+import pytest
+
+from cerebrum.toolkit import LLMCache as module
+from cerebrum.toolkit.LLMCache import LLMCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Control the time seen by the cache."""
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "time", lambda: now[0])
+    return now
+
+
+def test_key_depends_on_every_request_parameter():
+    messages = [{"role": "user", "content": "AAPL"}]
+    key = LLMCache.key("model", messages, 0.7, 100)
+    assert key == LLMCache.key("model", list(messages), 0.7, 100)
+    assert key != LLMCache.key("other", messages, 0.7, 100)
+    assert key != LLMCache.key("model", messages, 0.0, 100)
+    assert key != LLMCache.key("model", messages, 0.7, 200)
+    assert key != LLMCache.key("model", messages, 0.7, 100, response_format={})
+
+
+def test_memory_entries_expire_after_the_ttl(clock):
+    cache = LLMCache(ttl=60)
+    cache.put("key", "value")
+    clock[0] += 59
+    assert cache.get("key") == "value"
+    clock[0] += 2
+    assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_evicts_the_least_recently_used(clock):
+    cache = LLMCache(max_memory_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")  # b is now the least recently used
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_restart_and_expires(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    LLMCache(path=path, ttl=60).put("key", "value")
+
+    reopened = LLMCache(path=path, ttl=60)
+    assert reopened.get("key") == "value"
+    assert reopened.stats()["disk_hits"] == 1
+
+    clock[0] += 61
+    assert LLMCache(path=path, ttl=60).get("key") is None
+
+
+def test_disk_tier_evicts_the_least_recently_used_rows(tmp_path, clock):
+    cache = LLMCache(
+        path=str(tmp_path / "cache.sqlite3"), max_memory_entries=1, max_disk_entries=2
+    )
+    cache.put("a", "1")
+    clock[0] += 1
+    cache.put("b", "2")
+    clock[0] += 1
+    cache.get("a")  # From disk, a is now more recently used than b
+    clock[0] += 1
+    cache.put("c", "3")
+    assert cache.stats()["disk_entries"] == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.put("key", "value")
+    cache.clear()
+    assert cache.get("key") is None
+    assert cache.stats()["disk_entries"] == 0
@@ -0,0 +1,225 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from cerebrum.toolkit.MessageBroker import MessageBroker
+
+
+def _pool(size=2, backpressure="block", workers=1):
+    return MessageBroker(
+        dispatch_mode="pool",
+        max_workers=workers,
+        queue_size=size,
+        backpressure=backpressure,
+    )
+
+
+def _blocked_worker(broker, topic="hold"):
+    """Occupy the broker's single worker until the returned event is set."""
+    release, started = threading.Event(), threading.Event()
+
+    def hold(message):
+        started.set()
+        release.wait(5)
+
+    broker.subscribe(topic, hold)
+    broker.publish(topic, {})
+    assert started.wait(5)
+    return release
+
+
+def test_thread_mode_delivers_to_every_subscriber():
+    broker = MessageBroker(dispatch_mode="thread")
+    received, done = [], threading.Event()
+
+    def collect(message):
+        received.append(message["n"])
+        if len(received) == 2:
+            done.set()
+
+    broker.subscribe("topic", collect)
+    broker.subscribe("topic", collect)
+    broker.publish("topic", {"n": 1})
+    assert done.wait(5)
+    assert received == [1, 1]
+
+
+def test_reject_raises_when_the_queue_is_full():
+    broker = _pool(size=2, backpressure="reject")
+    release = _blocked_worker(broker)
+    broker.subscribe("topic", lambda message: None)
+    broker.publish("topic", {})
+    broker.publish("topic", {})
+    with pytest.raises(queue.Full):
+        broker.publish("topic", {})
+    assert broker.stats()["topic"]["rejected"] == 1
+    release.set()
+    broker.close(timeout=5)
+
+
+def test_drop_oldest_discards_the_oldest_pending_delivery():
+    broker = _pool(size=2, backpressure="drop_oldest")
+    release = _blocked_worker(broker)
+    received = []
+    broker.subscribe("topic", lambda message: received.append(message["n"]))
+    for n in range(4):
+        broker.publish("topic", {"n": n})
+    assert broker.stats()["topic"]["dropped"] == 2
+    release.set()
+    broker.close(timeout=5)
+    assert received == [2, 3]
+
+
+def test_block_waits_for_room():
+    broker = _pool(size=1, backpressure="block")
+    release = _blocked_worker(broker)
+    received = []
+    broker.subscribe("topic", lambda message: received.append(message["n"]))
+    broker.publish("topic", {"n": 0})
+
+    publisher = threading.Thread(target=broker.publish, args=("topic", {"n": 1}))
+    publisher.start()
+    publisher.join(0.2)
+    assert publisher.is_alive()  # Queue is full until the worker is free
+
+    release.set()
+    publisher.join(5)
+    assert not publisher.is_alive()
+    broker.close(timeout=5)
+    assert received == [0, 1]
+
+
+def test_close_wakes_a_blocked_publisher_with_an_error():
+    broker = _pool(size=1, backpressure="block")
+    release = _blocked_worker(broker)
+    broker.subscribe("topic", lambda message: None)
+    broker.publish("topic", {})
+    errors = []
+
+    def publish():
+        try:
+            broker.publish("topic", {})
+        except RuntimeError as e:
+            errors.append(e)
+
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    publisher.join(0.2)
+    closer = threading.Thread(target=broker.close, kwargs={"timeout": 5})
+    closer.start()
+    publisher.join(5)
+    assert len(errors) == 1
+    assert broker.stats()["topic"]["published"] == 1  # Nothing queued after close
+    release.set()
+    closer.join(5)
+
+
+def test_publish_after_close_raises():
+    broker = _pool()
+    broker.subscribe("topic", lambda message: None)
+    broker.close(timeout=5)
+    with pytest.raises(RuntimeError):
+        broker.publish("topic", {})
+
+
+def test_close_drains_pending_deliveries():
+    broker = _pool(size=10)
+    received = []
+    broker.subscribe("topic", lambda message: (time.sleep(0.01), received.append(1)))
+    for _ in range(5):
+        broker.publish("topic", {})
+    broker.close(timeout=5)
+    assert len(received) == 5
+
+
+def test_workers_publishing_to_a_full_queue_do_not_deadlock():
+    broker = _pool(size=1, backpressure="block", workers=2)
+    received, done = [], threading.Event()
+
+    def downstream(message):
+        received.append(message["n"])
+        if len(received) == 20:
+            done.set()
+
+    def upstream(message):
+        for n in range(10):
+            broker.publish("downstream", {"n": message["n"] * 10 + n})
+
+    broker.subscribe("upstream", upstream)
+    broker.subscribe("downstream", downstream)
+    broker.publish("upstream", {"n": 0})
+    broker.publish("upstream", {"n": 1})
+    assert done.wait(5)
+    assert sorted(received) == list(range(20))
+    assert broker.stats()["downstream"]["inlined"] > 0
+    broker.close(timeout=5)
+
+
+def test_consumer_group_members_share_messages_round_robin():
+    broker = MessageBroker(dispatch_mode="thread")
+    received = {"a": [], "b": [], "c": [], "plain": []}
+    for name in ("a", "b", "c"):
+        broker.subscribe(
+            "topic",
+            lambda m, name=name: received[name].append(m["n"]),
+            inline=True,
+            group="workers",
+        )
+    broker.subscribe("topic", lambda m: received["plain"].append(m["n"]), inline=True)
+    for n in range(9):
+        broker.publish("topic", {"n": n})
+    assert received["plain"] == list(range(9))  # Plain subscribers get every message
+    assert received["a"] == [0, 3, 6]
+    assert received["b"] == [1, 4, 7]
+    assert received["c"] == [2, 5, 8]
+
+
+def test_consumer_group_prefers_the_least_loaded_member():
+    broker = MessageBroker(dispatch_mode="thread")
+    loads = {"busy": 5, "idle": 0}
+    received = {"busy": [], "idle": []}
+    for name in loads:
+        broker.subscribe(
+            "topic",
+            lambda m, name=name: received[name].append(m["n"]),
+            inline=True,
+            group="workers",
+            load=lambda name=name: loads[name],
+        )
+    for n in range(3):
+        broker.publish("topic", {"n": n})
+    assert received == {"busy": [], "idle": [0, 1, 2]}
+
+
+def test_each_group_gets_one_copy():
+    broker = MessageBroker(dispatch_mode="thread")
+    received = []
+    for group in ("analysts", "auditors"):
+        for member in range(2):
+            broker.subscribe(
+                "topic",
+                lambda m, key=(group, member): received.append(key),
+                inline=True,
+                group=group,
+            )
+    broker.publish("topic", {})
+    assert sorted(received) == [("analysts", 0), ("auditors", 0)]
+
+
+def test_unsubscribed_member_leaves_its_group():
+    broker = MessageBroker(dispatch_mode="thread")
+    received = []
+
+    def first(message):
+        received.append("first")
+
+    broker.subscribe("topic", first, inline=True, group="workers")
+    broker.subscribe(
+        "topic", lambda m: received.append("second"), inline=True, group="workers"
+    )
+    broker.unsubscribe("topic", first)
+    broker.publish("topic", {})
+    broker.publish("topic", {})
+    assert received == ["second", "second"]
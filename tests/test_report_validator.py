@@ -0,0 +1,140 @@
+import pytest
+
+from cerebrum.toolkit.ReportValidator import ReportValidator
+
+NAMES = [
+    "MA（移動平均線）",
+    "EMA (指數移動平均)",
+    "MACD",
+    "RSI",
+    "布林通道 (Bollinger Bands)",
+    "隨機指標 (KD)",
+    "平均趨向指標 (ADX)",
+    "成交量移動平均 (VOMA)",
+]
+
+
+def _report(recommendations, summary="持有", confidence="100%"):
+    """A report in the table format of Prompt.market_analysis."""
+    rows = [
+        "| **技術指標** | **分析結果** | **具體依據** | **成交量趨勢支持** |",
+        "| --- | --- | --- | --- |",
+    ]
+    rows += [
+        f"| **{name}** | {recommendation} | 依據 | 是 |"
+        for name, recommendation in zip(NAMES, recommendations)
+    ]
+    rows.append("| --- | --- | --- | --- |")
+    if summary is not None:
+        rows.append(f"| **總結** | **{summary}** | 概要 |  |")
+    if confidence is not None:
+        rows.append(f"| **置信度** |  |  | **{confidence}** |")
+    return "\n".join(rows)
+
+
+def _indicators(**overrides):
+    """Computed indicators without any directional signal."""
+    indicators = {
+        "MA": {"MA20": 100.0, "MA50": 100.0},
+        "EMA": {"EMA20": 100.0, "EMA50": 100.0},
+        "MACD": {"latest_MACD_signal": "無交叉"},
+        "RSI": {"latest_RSI": 50.0},
+        "BB": {"latest_BB_signal": "通道內"},
+        "SO": {"latest_KD_signal": "無交叉"},
+        "ADX": {"latest_ADX": 30.0},
+        "VOMA": {"latest_Volume_signal": "縮量"},
+        "price": {"Price20_Trend": [100.0, 101.0]},
+    }
+    for name, values in overrides.items():
+        indicators[name] = {**indicators[name], **values}
+    return indicators
+
+
+@pytest.fixture
+def validator():
+    return ReportValidator(tolerance=0)
+
+
+def test_consistent_report_passes(validator):
+    result = validator.validate(_report(["持有"] * 8), _indicators())
+    assert result["passed"], result["errors"]
+    assert result["summary"] == "持有"
+    assert result["confidence"] == 100
+    assert set(result["signals"]) == {
+        "MA",
+        "EMA",
+        "MACD",
+        "RSI",
+        "BB",
+        "SO",
+        "ADX",
+        "VOMA",
+    }
+
+
+def test_confidence_counts_the_indicators_agreeing_with_the_summary(validator):
+    report = _report(["買入"] * 5 + ["持有"] * 3, summary="買入", confidence="62.5%")
+    assert validator.validate(report)["passed"]
+
+
+def test_missing_rows_fail(validator):
+    result = validator.validate(_report(["持有"] * 7, summary=None, confidence=None))
+    assert len(result["errors"]) == 3
+    assert "VOMA" in result["errors"][0]
+
+
+def test_placeholder_recommendations_do_not_count(validator):
+    result = validator.validate(_report(["買入/持有/賣出"] + ["持有"] * 7))
+    assert not result["passed"]
+    assert "MA" not in result["signals"]
+
+
+def test_summary_must_follow_the_majority(validator):
+    report = _report(["買入"] * 5 + ["持有"] * 3, summary="持有", confidence="37.5%")
+    result = validator.validate(report)
+    assert len(result["errors"]) == 1
+    assert "多數" in result["errors"][0]
+
+
+def test_confidence_must_match_the_agreeing_share(validator):
+    result = validator.validate(_report(["持有"] * 8, confidence="80%"))
+    assert len(result["errors"]) == 1
+    assert "置信度" in result["errors"][0]
+
+
+@pytest.mark.parametrize(
+    "index, recommendation, overrides",
+    [
+        (0, "賣出", {"MA": {"MA20": 110.0}}),
+        (1, "買入", {"EMA": {"EMA20": 90.0}}),
+        (2, "賣出", {"MACD": {"latest_MACD_signal": "黃金交叉"}}),
+        (3, "買入", {"RSI": {"latest_RSI": 75.0}}),
+        (4, "賣出", {"BB": {"latest_BB_signal": "突破上軌"}}),
+        (5, "買入", {"SO": {"latest_KD_signal": "K下穿D"}}),
+        (6, "買入", {"MACD": {"latest_MACD_signal": "死亡交叉"}}),
+        (6, "賣出", {"ADX": {"latest_ADX": 15.0}}),
+        (7, "賣出", {"VOMA": {"latest_Volume_signal": "放量"}}),
+    ],
+)
+def test_recommendation_against_the_computed_signal_fails(
+    validator, index, recommendation, overrides
+):
+    recommendations = ["持有"] * 8
+    recommendations[index] = recommendation
+    report = _report(recommendations, confidence="87.5%")
+    assert validator.validate(report)["passed"]  # Consistent without the indicators
+    result = validator.validate(report, _indicators(**overrides))
+    assert len(result["errors"]) == 1, result["errors"]
+
+
+def test_recommendation_following_the_computed_signal_passes(validator):
+    recommendations = ["買入", "持有", "買入", "持有", "買入", "持有", "買入", "買入"]
+    overrides = {
+        "MA": {"MA20": 110.0},
+        "MACD": {"latest_MACD_signal": "黃金交叉"},
+        "BB": {"latest_BB_signal": "突破上軌"},
+        "VOMA": {"latest_Volume_signal": "放量"},
+    }
+    report = _report(recommendations, summary="買入", confidence="62.5%")
+    result = validator.validate(report, _indicators(**overrides))
+    assert result["passed"], result["errors"]
@@ -0,0 +1,55 @@
+import threading
+import time
+import types
+
+import pytest
+
+from cerebrum.config.Config import Config
+from cerebrum.toolkit.AIClient import AIClient
+from cerebrum.toolkit.ClientRegistry import ClientRegistry
+from cerebrum.toolkit.RetryPolicy import RetryPolicy
+
+
+def _retry_config(**overrides):
+    return {**Config().config["utils"]["AI"]["retry"], **overrides}
+
+
+def test_max_attempts_must_be_positive():
+    with pytest.raises(ValueError):
+        RetryPolicy(_retry_config(maxAttempts=0))
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(_retry_config(baseDelay=1.0, maxDelay=2.0))
+    assert all(0 <= policy.backoff(attempt) <= 2.0 for attempt in range(10))
+
+
+class _Completions:
+    """Answers at once, except the slow model, which waits until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def create(self, **request):
+        if request["model"] == "slow":
+            self.release.wait(5)
+        message = types.SimpleNamespace(content=f"ok:{request['model']}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def test_hedged_request_hands_back_the_losers_limiter_slot():
+    client = AIClient.__new__(AIClient)
+    client.config = Config().config
+    client.retry_policy = RetryPolicy(_retry_config(hedgeAfter=0.05))
+    completions = _Completions()
+    client.client = types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=completions)
+    )
+    limiter = ClientRegistry.limiter(client.config["utils"]["AI"]["baseURL"])
+    free = limiter._value
+
+    start = time.perf_counter()
+    assert client._hedged({"messages": []}, "slow", "fast") == "ok:fast"
+    assert time.perf_counter() - start < 1
+    assert limiter._value == free  # The slow request is still in flight
+    completions.release.set()
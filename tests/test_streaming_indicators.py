@@ -0,0 +1,38 @@
+import pytest
+
+from cerebrum.toolkit.FinanceDataUtils import FinanceDataUtils
+from cerebrum.toolkit.StreamingIndicators import StreamingIndicators
+
+
+@pytest.mark.parametrize("days, seed", [(60, 3), (120, 1), (300, 4)])
+def test_bar_by_bar_updates_match_get_technical_indicators(
+    make_history, same_indicators, days, seed
+):
+    history = make_history(days, seed)
+    streaming = StreamingIndicators()
+    for bar in history.to_dict("records"):
+        streaming.update(bar)
+    expected = FinanceDataUtils.__new__(FinanceDataUtils).getTechnicalIndicators(
+        history.copy()
+    )
+    assert same_indicators(expected, streaming.indicators())
+
+
+def test_seed_matches_bar_by_bar_updates(make_history, same_indicators):
+    history = make_history(120, 1)
+    streaming = StreamingIndicators()
+    for bar in history.to_dict("records"):
+        streaming.update(bar)
+    seeded = StreamingIndicators.seed(history)
+    assert seeded.bars == streaming.bars == 120
+    assert same_indicators(streaming.indicators(), seeded.indicators())
+
+
+def test_revise_replaces_the_latest_bar(make_history, same_indicators):
+    history = make_history(120, 1)
+    streaming = StreamingIndicators.seed(history.iloc[:-1])
+    streaming.update({"High": 1.0, "Low": 1.0, "Close": 1.0, "Volume": 1.0})
+    streaming.revise(history.iloc[-1])  # The day's final bar replaces the intraday one
+    assert streaming.bars == 120
+    expected = StreamingIndicators.seed(history)
+    assert same_indicators(expected.indicators(), streaming.indicators())
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from cerebrum.toolkit.ReportValidator import ReportValidator
+from cerebrum.toolkit.StructuredOutput import INDICATORS, StructuredOutput
+
+
+def _analysis(ticker="AAPL", summary="買入", confidence=62.5):
+    return {
+        "ticker": ticker,
+        "indicators": [
+            {
+                "indicator": name,
+                "verdict": "買入" if i < 5 else "持有",
+                "volume_support": i % 2 == 0,
+                "rationale": f"{name} 依據",
+            }
+            for i, name in enumerate(INDICATORS)
+        ],
+        "summary": summary,
+        "confidence": confidence,
+        "rationale": "多數指標偏多",
+    }
+
+
+def test_parse_analysis_reads_fenced_json():
+    text = "```json\n" + json.dumps(_analysis(), ensure_ascii=False) + "\n```"
+    result = StructuredOutput.parse_analysis(text)
+    assert result.ticker == "AAPL"
+    assert result.summary == "買入"
+    assert result.confidence == 62.5
+    assert result.verdicts()["MACD"] == "買入"
+    assert result.verdicts()["VOMA"] == "持有"
+
+
+def test_parse_analysis_normalizes_verdicts_and_confidence():
+    data = _analysis(ticker="", summary="buy", confidence="50%")
+    data["indicators"][0]["verdict"] = "卖出"
+    result = StructuredOutput.parse_analysis(json.dumps(data), ticker="MSFT")
+    assert result.ticker == "MSFT"
+    assert result.summary == "買入"
+    assert result.confidence == 50
+    assert result.indicators[0].verdict == "賣出"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "沒有 JSON",
+        '{"ticker": "AAPL", ',
+        json.dumps({"ticker": "AAPL"}),
+        json.dumps(_analysis(summary="觀望")),
+    ],
+)
+def test_parse_analysis_rejects_malformed_responses(text):
+    with pytest.raises(ValueError):
+        StructuredOutput.parse_analysis(text)
+
+
+def test_markdown_rendering_passes_the_report_validator():
+    markdown = StructuredOutput.parse_analysis(json.dumps(_analysis())).to_markdown()
+    assert ReportValidator(tolerance=0).validate(markdown)["passed"]
+
+
+def test_parse_batch_keys_by_ticker_and_skips_malformed_entries():
+    results = [_analysis("aapl"), {"ticker": "BAD"}, _analysis("MSFT", "持有", 37.5)]
+    analyses = StructuredOutput.parse_batch(json.dumps({"results": results}))
+    assert sorted(analyses) == ["AAPL", "MSFT"]
+    assert analyses["MSFT"].summary == "持有"
+
+
+def test_parse_batch_keeps_the_complete_entries_of_a_truncated_response():
+    text = json.dumps({"results": [_analysis("AAPL"), _analysis("MSFT")]})
+    cut = text[: text.rindex('"MSFT"') + 20]
+    assert list(StructuredOutput.parse_batch(cut)) == ["AAPL"]
+
+
+def test_complete_results():
+    assert StructuredOutput.complete_results('{"results": [{"a": 1}, {"b": 2}]}') == [
+        {"a": 1},
+        {"b": 2},
+    ]
+    assert StructuredOutput.complete_results('{"results": [{"a": 1}, {"b": ') == [
+        {"a": 1}
+    ]
+    assert StructuredOutput.complete_results('{"other": []}') == []
+
+
+def test_parse_batch_without_results_raises():
+    with pytest.raises(ValueError):
+        StructuredOutput.parse_batch('{"results": {"a": 1}}')
+    with pytest.raises(ValueError):
+        StructuredOutput.parse_batch("not json")
+
+
+def test_parse_review_accepts_both_formats():
+    review = StructuredOutput.parse_review(
+        '{"result": "revise_required", "feedback": "補充", "issues": ["RSI"]}'
+    )
+    assert not review.approved
+    assert review.to_text() == "REVISE_REQUIRED：補充\n- RSI"
+    legacy = StructuredOutput.parse_review(
+        '{"audit_result": {"result": "APPROVED", "feedback": "好"}}'
+    )
+    assert legacy.approved
+    assert legacy.issues == []
+    with pytest.raises(ValueError):
+        StructuredOutput.parse_review('{"result": "MAYBE"}')
+
+
+def test_response_format():
+    assert StructuredOutput.response_format("review", "json_object") == {
+        "type": "json_object"
+    }
+    schema = StructuredOutput.response_format("market_analysis_batch")["json_schema"]
+    assert schema["name"] == "market_analysis_batch"
+    assert schema["strict"] is True
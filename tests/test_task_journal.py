@@ -0,0 +1,98 @@
+import pytest
+
+from cerebrum.toolkit.TaskJournal import TaskJournal
+from cerebrum.toolkit.Topics import Topics
+
+
+def _task(task_id, ticker):
+    return {
+        "task_id": task_id,
+        "data": {"ticker": ticker, "filter": {"period": "3mo"}, "tickerData": "frame"},
+        "isInteractiveMode": False,
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.bin")
+
+
+@pytest.fixture
+def journal(path):
+    journal = TaskJournal(path, max_resumes=2)
+    yield journal
+    journal.close()
+
+
+def _replay(journal):
+    """Resume the journal's incomplete tasks as AIWorkGroup.resume does."""
+    pending = journal.incomplete()
+    for topic, message in pending:
+        journal.record(topic, message)  # Published again, so recorded again
+    return pending
+
+
+def test_replays_only_unreported_tasks(journal):
+    journal.record(Topics.MARKET_ANALYSIS, _task("crashed", "AAPL"))
+    journal.record(Topics.MARKET_ANALYSIS, _task("reported", "MSFT"))
+    journal.record(Topics.CHIEF_REVIEW, {"task_id": "reported", "content": "..."})
+    journal.record(
+        Topics.PRESENT_REPORT, {"task_id": "reported", "report": "MSFT 報告"}
+    )
+    journal.record(
+        Topics.MARKET_ANALYSIS_BATCH,
+        {"tasks": [_task("batch1", "NVDA"), _task("batch2", "TSLA")]},
+    )
+    journal.record(Topics.PRESENT_REPORT, {"task_id": "batch2", "report": "TSLA"})
+
+    pending = journal.incomplete()
+    assert [topic for topic, _ in pending] == [
+        Topics.MARKET_ANALYSIS,
+        Topics.MARKET_ANALYSIS_BATCH,
+    ]
+    crashed = pending[0][1]
+    assert crashed["task_id"] == "crashed"
+    assert crashed["resumed"] == 1
+    assert "tickerData" not in crashed["data"]  # Downloaded again on resume
+    assert [task["task_id"] for task in pending[1][1]["tasks"]] == ["batch1"]
+
+
+def test_ignores_a_record_cut_off_by_a_crash(journal, path):
+    journal.record(Topics.MARKET_ANALYSIS, _task("first", "AAPL"))
+    journal.record(Topics.MARKET_ANALYSIS, _task("second", "MSFT"))
+    journal.close()
+    with open(path, "rb+") as f:
+        f.truncate(f.seek(0, 2) - 5)
+
+    reopened = TaskJournal(path)
+    try:
+        assert [message["task_id"] for _, message in reopened.incomplete()] == ["first"]
+        reopened.record(Topics.MARKET_ANALYSIS, _task("third", "NVDA"))
+    finally:
+        reopened.close()
+
+
+def test_gives_up_a_task_after_max_resumes(journal):
+    journal.record(Topics.CHIEF_REVIEW, {"task_id": "stuck", "content": "..."})
+    assert len(_replay(journal)) == 1
+    assert len(_replay(journal)) == 1
+    assert _replay(journal) == []  # Resumed twice, now recorded as shed
+    assert journal.incomplete() == []
+
+
+def test_compact_keeps_the_last_stage_of_unreported_tasks(journal, path):
+    journal.record(Topics.MARKET_ANALYSIS, _task("open", "AAPL"))
+    journal.record(Topics.CHIEF_REVIEW, {"task_id": "open", "content": "..."})
+    journal.record(Topics.MARKET_ANALYSIS, _task("done", "MSFT"))
+    journal.record(Topics.PRESENT_REPORT, {"task_id": "done", "report": "..."})
+    journal.compact()
+    assert len(journal._read()) == 1
+    journal.record(Topics.PRESENT_REPORT, {"task_id": "open", "report": "..."})
+    assert journal.incomplete() == []
+
+
+def test_journal_belongs_to_one_owner_at_a_time(journal, path):
+    with pytest.raises(RuntimeError):
+        TaskJournal(path)
+    journal.close()
+    TaskJournal(path).close()
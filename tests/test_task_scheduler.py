@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from cerebrum.toolkit.TaskScheduler import TaskScheduler
+
+
+def _task(name, priority=None, deadline=None):
+    return {"task_id": TaskScheduler.task_id(name, priority, deadline)}
+
+
+def _drain(scheduler):
+    handled = []
+    while scheduler.qsize():
+        handler, message = scheduler.get()
+        handled.append(message["task_id"].rsplit(".", 1)[-1])
+    return handled
+
+
+def test_task_id_carries_priority_and_deadline():
+    task_id = TaskScheduler.task_id("abc", 3, 1700000000.5)
+    assert task_id == "p3.d1700000000500.abc"
+    assert TaskScheduler.schedule({"task_id": task_id}) == (3, 1700000000.5)
+    assert TaskScheduler.schedule({"task_id": "abc", "priority": 2}) == (2, None)
+
+
+def test_priority_classes_resolve_from_config():
+    assert TaskScheduler.priority("interactive") < TaskScheduler.priority("batch")
+    assert TaskScheduler.priority(None) == TaskScheduler.priority("default")
+    assert TaskScheduler.priority("7") == 7
+    with pytest.raises(ValueError):
+        TaskScheduler.priority("urgent")
+
+
+def test_batch_message_takes_its_most_urgent_task():
+    message = {"tasks": [_task("a", 5), _task("b", 2)]}
+    assert TaskScheduler.schedule(message) == (2, None)
+
+
+def test_orders_by_priority_then_deadline_then_arrival():
+    scheduler = TaskScheduler()
+    now = time.time()
+    for message in (
+        _task("late", 1),
+        _task("low", 5),
+        _task("soon", 1, now + 60),
+        _task("later", 1, now + 120),
+        _task("next", 1),
+        _task("urgent", 0),
+    ):
+        scheduler.put((print, message))
+    assert _drain(scheduler) == ["urgent", "soon", "later", "late", "next", "low"]
+
+
+def test_stop_sentinel_goes_ahead_of_all_work():
+    scheduler = TaskScheduler()
+    scheduler.put((print, _task("work", 0)))
+    scheduler.put((None, None))
+    assert scheduler.get() == (None, None)
+
+
+def test_expired_tasks_are_shed():
+    shed = []
+    scheduler = TaskScheduler(on_shed=shed.append)
+    expired = _task("expired", 1, time.time() - 1)
+    scheduler.put((print, expired))
+    scheduler.put((print, _task("kept", 1, time.time() - 1)), shed=False)
+    scheduler.put((print, _task("fresh", 1, time.time() + 60)))
+    assert _drain(scheduler) == ["kept", "fresh"]
+    assert shed == [expired]
+    stats = scheduler.stats()[1]
+    assert (stats["dequeued"], stats["shed"], stats["waiting"]) == (2, 1, 0)